@@ -1,7 +1,97 @@
+import json
+
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 
-from .models import Stock, Order
+from . import holdings
+from .models import (
+    Stock, Order, BulkImport, ExchangeRate, Job, JobRun, OutboxCursor, OutboxEvent, RiskLimit
+)
 # Register your models here.
 
-admin.site.register(Stock)
-admin.site.register(Order)
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that takes the planner's row estimate instead of running an
+    exact COUNT(*) on PostgreSQL once the table is large. Smaller results
+    are counted exactly.
+    """
+    exact_count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connections[queryset.db].vendor == 'postgresql':
+            plan = json.loads(queryset.explain(format='json'))
+            estimate = int(plan[0]['Plan']['Plan Rows'])
+            if estimate > self.exact_count_limit:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Change list settings shared by the large trading tables."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+@admin.register(Stock)
+class StockAdmin(LargeTableAdmin):
+    list_display = ('id', 'name', 'price', 'currency', 'lot_size')
+    list_filter = ('currency',)
+    search_fields = ('name',)
+    ordering = ('name',)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and {'price', 'currency'} & set(form.changed_data):
+            holdings.reprice(obj.id)
+
+
+@admin.register(Order)
+class OrderAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'stock', 'order_type', 'quantity', 'date_time_placed')
+    list_select_related = ('user', 'stock')
+    list_filter = ('order_type',)
+    date_hierarchy = 'date_time_placed'
+    ordering = ('-date_time_placed',)
+    raw_id_fields = ('user',)
+    autocomplete_fields = ('stock',)
+    search_fields = ('=id', '=user__username', '=stock__name')
+    readonly_fields = ('source_ref',)
+
+
+@admin.register(JobRun)
+class JobRunAdmin(admin.ModelAdmin):
+    list_display = ('job', 'status', 'worker', 'started_at', 'duration_seconds', 'chunks', 'items')
+    list_select_related = ('job',)
+    list_filter = ('status', 'job')
+
+
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ('currency', 'rate', 'updated_at')
+
+
+@admin.register(RiskLimit)
+class RiskLimitAdmin(admin.ModelAdmin):
+    list_display = ('user', 'stock', 'max_position', 'max_order_notional', 'max_daily_volume')
+    list_select_related = ('user', 'stock')
+    raw_id_fields = ('user',)
+    autocomplete_fields = ('stock',)
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(LargeTableAdmin):
+    list_display = ('seq', 'topic', 'key', 'created_at')
+    list_filter = ('topic',)
+    ordering = ('-id',)
+    search_fields = ('=seq', '=key')
+
+
+admin.site.register(BulkImport)
+admin.site.register(Job)
+admin.site.register(OutboxCursor)
@@ -0,0 +1,278 @@
+"""
+Columnar snapshot of the Order table for admin reporting.
+
+The refresh_analytics job copies orders, in id order and a chunk at a time,
+from a read replica when one is configured, into NumPy column files under
+ANALYTICS_DIR. Once complete the columns are sorted by date_time_placed and
+published by atomically replacing the CURRENT pointer file. Workers
+memory-map the current snapshot and answer group-by queries with
+np.bincount, so reports never touch the database apart from looking up the
+names of the rows returned.
+
+Only orders still in the Order table are included; archived orders live in
+PositionRollup (see archive.py). NumPy is imported by the functions that
+use it, so workers that never report do not load it.
+"""
+import os
+import shutil
+import threading
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from api_trades import valuation
+from api_trades.models import MINOR_UNITS_PER_UNIT, Order, Stock
+
+COLUMNS = ('user_id', 'stock_id', 'side', 'quantity', 'placed')
+DTYPES = {
+    'user_id': 'int64',
+    'stock_id': 'int64',
+    'side': 'int8',
+    'quantity': 'int64',
+    'placed': 'int64',
+}
+GROUPS = ('stock', 'user', 'side', 'day')
+POINTER = 'CURRENT'
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def analytics_dir():
+    """Return the snapshot directory as a Path."""
+    return Path(settings.ANALYTICS_DIR)
+
+
+def source_alias():
+    """Read from a replica when one is configured."""
+    replicas = list(settings.DATABASE_REPLICAS)
+    return replicas[0] if replicas else DEFAULT_DB_ALIAS
+
+
+def start_build():
+    """Create an empty build directory and return its name."""
+    name = f'build-{uuid.uuid4().hex}'
+    (analytics_dir() / name).mkdir(parents=True)
+    return name
+
+
+def export_chunk(build, after_id=0, chunk_size=100000):
+    """
+    Copy up to chunk_size orders with an id above after_id into a part
+    file of the build. Returns (last id copied, number copied).
+    """
+    import numpy as np
+
+    rows = list(
+        Order.objects.using(source_alias())
+        .filter(id__gt=after_id)
+        .order_by('id')
+        .values_list('id', 'user_id', 'stock_id', 'order_type', 'quantity', 'date_time_placed')
+        [:chunk_size]
+    )
+    if not rows:
+        return after_id, 0
+
+    ids, user_ids, stock_ids, order_types, quantities, placed = zip(*rows)
+    np.savez(
+        analytics_dir() / build / f'part-{ids[0]:012d}.npz',
+        user_id=np.array(user_ids, dtype=DTYPES['user_id']),
+        stock_id=np.array(stock_ids, dtype=DTYPES['stock_id']),
+        side=np.array([1 if order_type == 'buy' else -1 for order_type in order_types],
+                      dtype=DTYPES['side']),
+        quantity=np.array(quantities, dtype=DTYPES['quantity']),
+        placed=np.array([int(value.timestamp()) for value in placed], dtype=DTYPES['placed']),
+    )
+    return ids[-1], len(rows)
+
+
+def publish(build):
+    """Combine the build's parts into a snapshot and make it current."""
+    import numpy as np
+
+    directory = analytics_dir()
+    build_dir = directory / build
+    parts = [np.load(path) for path in sorted(build_dir.glob('part-*.npz'))]
+    columns = {
+        column: (np.concatenate([part[column] for part in parts]) if parts
+                 else np.empty(0, dtype=DTYPES[column]))
+        for column in COLUMNS
+    }
+    order = np.argsort(columns['placed'], kind='stable')
+
+    name = f'snapshot-{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}'
+    snapshot_dir = directory / name
+    snapshot_dir.mkdir()
+    for column, values in columns.items():
+        np.save(snapshot_dir / f'{column}.npy', values[order])
+
+    # Prices are stored in the FX reference currency so notionals can be
+    # summed across stocks; stocks without an exchange rate count as zero.
+    rates = valuation.scaled_rates()
+    prices = {
+        stock_id: (price_minor, currency)
+        for stock_id, price_minor, currency in Stock.objects.using(source_alias()).values_list(
+            'id', 'price_minor', 'currency')
+    }
+    price_column = np.zeros(max(prices, default=0) + 1, dtype='float64')
+    for stock_id, (price_minor, currency) in prices.items():
+        try:
+            reference_minor = valuation.convert(
+                price_minor, currency, settings.FX_REFERENCE_CURRENCY, rates)
+        except valuation.MissingRate:
+            continue
+        price_column[stock_id] = reference_minor / MINOR_UNITS_PER_UNIT
+    np.save(snapshot_dir / 'price.npy', price_column)
+
+    pointer = directory / f'{POINTER}.{uuid.uuid4().hex}'
+    pointer.write_text(name)
+    os.replace(pointer, directory / POINTER)
+    shutil.rmtree(build_dir)
+
+    # Keep the previous snapshot for workers that have not reloaded yet.
+    for old in sorted(directory.glob('snapshot-*'))[:-2]:
+        shutil.rmtree(old, ignore_errors=True)
+    return name
+
+
+def build_snapshot(chunk_size=100000):
+    """Export every order and publish the snapshot in one go."""
+    build = start_build()
+    last_id = 0
+    while True:
+        last_id, copied = export_chunk(build, last_id, chunk_size)
+        if copied < chunk_size:
+            return publish(build)
+
+
+class Snapshot:
+    """A memory-mapped, published snapshot."""
+
+    def __init__(self, name):
+        import numpy as np
+
+        self.name = name
+        path = analytics_dir() / name
+        for column in COLUMNS + ('price',):
+            setattr(self, column, np.load(path / f'{column}.npy', mmap_mode='r'))
+        self.taken_at = datetime.strptime(name, 'snapshot-%Y%m%dT%H%M%S%f').replace(
+            tzinfo=timezone.utc)
+
+    def __len__(self):
+        return len(self.placed)
+
+    def _window(self, since=None, until=None):
+        import numpy as np
+
+        start = 0 if since is None else np.searchsorted(self.placed, int(since.timestamp()), 'left')
+        end = len(self) if until is None else np.searchsorted(self.placed, int(until.timestamp()), 'left')
+        return slice(start, end)
+
+    def group_by(self, group, since=None, until=None, user_id=None, stock_id=None):
+        """
+        Aggregate the orders placed in [since, until) by stock, user, side or
+        day. Returns a dict of equal-length arrays, one entry per group.
+        """
+        import numpy as np
+
+        window = self._window(since, until)
+        side = self.side[window]
+        quantity = self.quantity[window]
+        keys = {
+            'stock': self.stock_id[window],
+            'user': self.user_id[window],
+            'side': (side > 0).astype(np.int64),
+            'day': self.placed[window] // SECONDS_PER_DAY,
+        }[group]
+        stocks = self.stock_id[window]
+
+        mask = None
+        if user_id is not None:
+            mask = self.user_id[window] == user_id
+        if stock_id is not None:
+            stock_mask = stocks == stock_id
+            mask = stock_mask if mask is None else mask & stock_mask
+        if mask is not None:
+            keys, side, quantity, stocks = keys[mask], side[mask], quantity[mask], stocks[mask]
+
+        if not len(keys):
+            return {field: np.empty(0) for field in (
+                'key', 'orders', 'buy_quantity', 'sell_quantity', 'notional')}
+
+        offset = keys.min()
+        keys = keys - offset
+        buys = side > 0
+        # Stocks created after the snapshot have no price yet.
+        known = stocks < len(self.price)
+        prices = np.where(known, self.price[np.where(known, stocks, 0)], 0)
+        orders = np.bincount(keys)
+        present = np.flatnonzero(orders)
+        sums = {
+            'orders': orders,
+            'buy_quantity': np.bincount(keys, weights=np.where(buys, quantity, 0)),
+            'sell_quantity': np.bincount(keys, weights=np.where(buys, 0, quantity)),
+            'notional': np.bincount(keys, weights=quantity * prices),
+        }
+        result = {field: values[present] for field, values in sums.items()}
+        result['key'] = present + offset
+        return result
+
+
+def report(groups, sort='-volume', limit=50):
+    """Return the first limit groups, ordered by sort, as dicts."""
+    import numpy as np
+
+    buys, sells = groups['buy_quantity'], groups['sell_quantity']
+    metrics = {
+        'orders': groups['orders'],
+        'buy_quantity': buys,
+        'sell_quantity': sells,
+        'volume': buys + sells,
+        'net_quantity': buys - sells,
+        'notional': groups['notional'],
+    }
+    values = metrics[sort.lstrip('-')]
+    order = np.argsort(-values if sort.startswith('-') else values, kind='stable')[:limit]
+
+    rows = []
+    for index in order:
+        volume = int(metrics['volume'][index])
+        net = int(metrics['net_quantity'][index])
+        rows.append({
+            'key': int(groups['key'][index]),
+            'orders': int(metrics['orders'][index]),
+            'buy_quantity': int(buys[index]),
+            'sell_quantity': int(sells[index]),
+            'volume': volume,
+            'net_quantity': net,
+            'imbalance': round(net / volume, 4) if volume else 0,
+            'notional': round(float(metrics['notional'][index]), 2),
+        })
+    return rows
+
+
+_lock = threading.Lock()
+_current = None
+
+
+def current_snapshot():
+    """Return the published snapshot, reloading it if a newer one exists."""
+    global _current
+    try:
+        name = (analytics_dir() / POINTER).read_text().strip()
+    except FileNotFoundError:
+        return None
+    if _current is not None and _current.name == name:
+        return _current
+    with _lock:
+        if _current is None or _current.name != name:
+            _current = Snapshot(name)
+        return _current
+
+
+def clear():
+    """Drop the loaded snapshot."""
+    global _current
+    with _lock:
+        _current = None
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ApiTradesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api_trades'
+
+    def ready(self):
+        from api_trades import signals  # noqa: F401
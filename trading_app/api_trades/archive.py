@@ -0,0 +1,269 @@
+"""
+Cold storage for old orders.
+
+archive_orders moves orders placed before a cutoff into gzip'd NDJSON
+files under ORDER_ARCHIVE_DIR and folds their quantities into
+PositionRollup rows, so position math only aggregates recent orders.
+
+Each batch is written and fsynced as one gzip member per user before the
+matching orders are deleted and rolled up in one database transaction,
+which also records each member's position in an ArchiveSegment row. A
+user's archived orders are read by decompressing only their segments, and
+a page of them (ArchivedOrders) only the segments covering that page. A
+crash between the two leaves the batch in both places; it is archived
+again on the next run, and the members written before the crash have no
+segments, so they are never read for a user.
+"""
+import gzip
+import json
+import os
+import zlib
+from collections import defaultdict
+from datetime import datetime, timezone
+from itertools import groupby, islice
+from operator import attrgetter
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, Sum, Window
+
+from api_trades.models import ArchiveSegment, Order, PositionRollup
+
+FILE_PATTERN = 'orders-*.ndjson.gz'
+
+
+def archive_dir(directory=None):
+    """Return the archive directory as a Path."""
+    return Path(directory or settings.ORDER_ARCHIVE_DIR)
+
+
+def serialize(order):
+    """Return the archived form of an order."""
+    return {
+        'id': order.id,
+        'user_id': order.user_id,
+        'stock_id': order.stock_id,
+        'order_type': order.order_type,
+        'quantity': order.quantity,
+        'date_time_placed': order.date_time_placed.isoformat(),
+        'source_ref': order.source_ref,
+    }
+
+
+def write_batch(path, orders):
+    """
+    Append orders to path as one gzip member per user and flush them to
+    disk. Returns the unsaved ArchiveSegment of each member.
+    """
+    by_user = defaultdict(list)
+    for order in orders:
+        by_user[order.user_id].append(order)
+
+    segments = []
+    with open(path, 'ab') as archive_file:
+        for user_id, user_orders in by_user.items():
+            lines = ''.join(json.dumps(serialize(order)) + '\n' for order in user_orders)
+            member = gzip.compress(lines.encode('utf-8'))
+            segments.append(ArchiveSegment(
+                user_id=user_id, file_name=Path(path).name, offset=archive_file.tell(),
+                length=len(member), order_count=len(user_orders)))
+            archive_file.write(member)
+        archive_file.flush()
+        os.fsync(archive_file.fileno())
+    return segments
+
+
+def fold_into_rollups(orders):
+    """Add the orders' quantities to their users' rollups."""
+    totals = defaultdict(lambda: {'buy': 0, 'sell': 0, 'count': 0, 'through': None})
+    for order in orders:
+        total = totals[order.user_id, order.stock_id]
+        total[order.order_type] += order.quantity
+        total['count'] += 1
+        if total['through'] is None or order.date_time_placed > total['through']:
+            total['through'] = order.date_time_placed
+
+    for (user_id, stock_id), total in totals.items():
+        rollup, _ = PositionRollup.objects.select_for_update().get_or_create(
+            user_id=user_id, stock_id=stock_id)
+        rollup.buy_quantity += total['buy']
+        rollup.sell_quantity += total['sell']
+        rollup.order_count += total['count']
+        if rollup.archived_through is None or total['through'] > rollup.archived_through:
+            rollup.archived_through = total['through']
+        rollup.save()
+
+
+def new_archive_path(directory=None):
+    """Return the path of a new archive file in directory."""
+    directory = archive_dir(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / f'orders-{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}.ndjson.gz'
+
+
+def archive_batch(cutoff, path, batch_size=1000):
+    """
+    Archive the oldest batch_size orders placed before cutoff into path.
+    Returns the number archived; fewer than batch_size means none are left.
+    """
+    batch = list(
+        Order.objects.filter(date_time_placed__lt=cutoff).order_by('id')[:batch_size]
+    )
+    if not batch:
+        return 0
+    segments = write_batch(path, batch)
+    with transaction.atomic():
+        fold_into_rollups(batch)
+        ArchiveSegment.objects.bulk_create(segments)
+        # Without signals: archived orders still count towards positions,
+        # holdings and the risk counters, through the rollups.
+        archived = Order.objects.filter(id__in=[order.id for order in batch])
+        archived._raw_delete(archived.db)
+    return len(batch)
+
+
+def archive_orders(cutoff, batch_size=1000, directory=None):
+    """
+    Archive every order placed before cutoff. Returns (path, count) where
+    path is the file written, or None if there was nothing to archive.
+    """
+    path = new_archive_path(directory)
+
+    archived = 0
+    while True:
+        count = archive_batch(cutoff, path, batch_size)
+        archived += count
+        if count < batch_size:
+            break
+
+    return (path if archived else None), archived
+
+
+def read_archived(user_id=None, directory=None):
+    """
+    Yield archived orders, optionally only one user's, oldest file first.
+    Every file is read unless user_id is given, in which case only the
+    user's segments are. A member left incomplete by a crash ends that file.
+    """
+    if user_id is not None:
+        yield from _read_segments(user_id, archive_dir(directory))
+        return
+
+    seen = set()
+    for path in sorted(archive_dir(directory).glob(FILE_PATTERN)):
+        with gzip.open(path, 'rt', encoding='utf-8') as archive_file:
+            try:
+                for line in archive_file:
+                    row = json.loads(line)
+                    if row['id'] in seen:
+                        continue
+                    seen.add(row['id'])
+                    yield row
+            except (EOFError, gzip.BadGzipFile, json.JSONDecodeError):
+                continue
+
+
+def _read_segments(user_id, directory, segments=None):
+    if segments is None:
+        segments = ArchiveSegment.objects.filter(user_id=user_id).order_by('file_name', 'offset')
+    seen = set()
+    for file_name, file_segments in groupby(segments, key=attrgetter('file_name')):
+        with open(directory / file_name, 'rb') as archive_file:
+            for segment in file_segments:
+                archive_file.seek(segment.offset)
+                lines = gzip.decompress(archive_file.read(segment.length)).decode('utf-8')
+                for line in lines.splitlines():
+                    row = json.loads(line)
+                    # Members of files indexed by index_archive hold every user's orders.
+                    if row['user_id'] != user_id or row['id'] in seen:
+                        continue
+                    seen.add(row['id'])
+                    yield row
+
+
+class ArchivedOrders:
+    """
+    One user's archived orders in the order they were archived, as a
+    sequence for LimitOffsetPagination. The count comes from the segments'
+    order_count, and a slice only decompresses the segments covering it,
+    so a page costs the same however much the user has archived.
+    """
+
+    def __init__(self, user_id, directory=None):
+        self.user_id = user_id
+        self.directory = archive_dir(directory)
+        self.segments = ArchiveSegment.objects.filter(user_id=user_id)
+
+    def count(self):
+        return self.segments.aggregate(total=Sum('order_count', default=0))['total']
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step is not None:
+            raise TypeError('ArchivedOrders only supports slices')
+        start, stop = index.start or 0, index.stop
+        segments = self.segments.annotate(
+            end=Window(Sum('order_count'), order_by=['file_name', 'offset', 'id']),
+        ).order_by('file_name', 'offset', 'id').filter(end__gt=start)
+        if stop is not None:
+            segments = segments.filter(end__lt=stop + F('order_count'))
+        segments = list(segments)
+        if not segments:
+            return []
+        skip = start - (segments[0].end - segments[0].order_count)
+        rows = islice(_read_segments(self.user_id, self.directory, segments), skip, None)
+        return list(islice(rows, stop - start) if stop is not None else rows)
+
+
+def members(path):
+    """Yield (offset, length, content) of each complete gzip member of path."""
+    data = memoryview(Path(path).read_bytes())
+    offset = 0
+    while offset < len(data):
+        decompressor = zlib.decompressobj(wbits=31)
+        try:
+            content = decompressor.decompress(data[offset:])
+        except zlib.error:
+            return
+        if not decompressor.eof:
+            return
+        length = len(data) - offset - len(decompressor.unused_data)
+        yield offset, length, content
+        offset += length
+
+
+def index_archive(path):
+    """
+    Record the segments of an archive file written before segments were,
+    one per user in each member. Returns the number of segments created.
+    """
+    path = Path(path)
+    segments = []
+    for offset, length, content in members(path):
+        counts = defaultdict(int)
+        for line in content.decode('utf-8').splitlines():
+            counts[json.loads(line)['user_id']] += 1
+        segments += [
+            ArchiveSegment(user_id=user_id, file_name=path.name, offset=offset,
+                           length=length, order_count=count)
+            for user_id, count in counts.items()
+        ]
+    # Deleted users' orders are kept in the file but no longer readable.
+    users = set(User.objects.filter(
+        id__in={segment.user_id for segment in segments}).values_list('id', flat=True))
+    segments = [segment for segment in segments if segment.user_id in users]
+    ArchiveSegment.objects.bulk_create(segments)
+    return len(segments)
+
+
+def unindexed_archives(directory=None):
+    """Return the archive files in directory without any segments."""
+    indexed = set(ArchiveSegment.objects.values_list('file_name', flat=True).distinct())
+    return [
+        path for path in sorted(archive_dir(directory).glob(FILE_PATTERN))
+        if path.name not in indexed
+    ]
@@ -0,0 +1,249 @@
+"""
+Placing orders from a CSV file of user_id,stock_id,order_type,quantity rows,
+one row per line.
+
+Files are imported in batches. The byte offset of the next unread row is
+kept in the file's BulkImport row and committed in the same transaction as
+each batch, so an interrupted import resumes at the first uncommitted batch
+without re-reading the rows before it. A file is identified by a hash of
+its size and first and last blocks, so importing the same file again is a
+no-op.
+
+Every order carries a chained hash in source_ref: the hash of the previous
+row's chain value and its own line, starting from the import's source and
+the header. A row that is replayed anyway is never booked twice, and the
+rows of a file keep their identity when rows are appended to it. A file
+that is new by its fingerprint but starts with exactly the rows of the
+last import of the same path is taken to have been appended to: it keeps
+that import's source and chain and carries on from its offset.
+"""
+import csv
+import hashlib
+import os
+from dataclasses import dataclass, field
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from trading_app.routers import pin_to_primary, user_pin
+
+from api_trades import caching, holdings, journal, outbox, positions, risk
+from api_trades.models import BulkImport, Order, Stock
+
+BLOCK_SIZE = 64 * 1024
+ORDER_TYPES = {choice for choice, _ in Order.ORDER_CHOICES}
+
+
+@dataclass
+class ImportResult:
+    """Outcome of importing one batch of a file."""
+    fingerprint: str
+    offset: int
+    size: int
+    done: bool
+    placed: int = 0
+    skipped: int = 0
+    errors: list = field(default_factory=list)
+
+    @property
+    def rows(self):
+        return self.placed + self.skipped + len(self.errors)
+
+
+def fingerprint(path):
+    """Return (hash, size) identifying the file without reading all of it."""
+    size = os.path.getsize(path)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=32)
+    with open(path, 'rb') as csvfile:
+        digest.update(csvfile.read(BLOCK_SIZE))
+        if size > BLOCK_SIZE:
+            csvfile.seek(max(size - BLOCK_SIZE, BLOCK_SIZE))
+            digest.update(csvfile.read())
+    return digest.hexdigest(), size
+
+
+def chain(previous, line):
+    """Return the chain value after line; line endings are ignored."""
+    digest = hashlib.blake2b(previous.encode(), digest_size=16)
+    digest.update(line.rstrip(b'\r\n'))
+    return digest.hexdigest()
+
+
+def row_ref(chain_value):
+    """Return the source_ref of the order placed from the row with chain_value."""
+    return f'csv:{chain_value}'
+
+
+def prefix_chain(path, source, offset):
+    """
+    Return (chain value, end) over the header and rows of the file at path
+    that start before byte offset, where end is the offset after them.
+    """
+    with open(path, 'rb') as csvfile:
+        value = chain(source, csvfile.readline())
+        while csvfile.tell() < offset:
+            line = csvfile.readline()
+            if not line:
+                break
+            if line.strip():
+                value = chain(value, line)
+        return value, csvfile.tell()
+
+
+def new_import(path, file_fingerprint, size):
+    """
+    Return the fields of the BulkImport of a file seen for the first time,
+    carrying on from the last import of the same path if the file starts
+    with the rows it imported.
+    """
+    fields = {'path': str(path), 'size': size, 'source': file_fingerprint}
+    previous = BulkImport.objects.filter(path=str(path)).order_by('-started_at', '-id').first()
+    if previous is not None and previous.chain and previous.offset <= size:
+        value, end = prefix_chain(path, previous.source, previous.offset)
+        if value == previous.chain:
+            return {**fields, 'source': previous.source, 'offset': end, 'chain': value}
+    fields['chain'], _ = prefix_chain(path, file_fingerprint, 0)
+    return fields
+
+
+def read_rows(path, offset, limit):
+    """
+    Read up to limit rows starting at byte offset (0 for the first row).
+    Returns ([(offset, line, row)], next offset).
+    """
+    rows = []
+    with open(path, 'rb') as csvfile:
+        header = csvfile.readline()
+        fields = next(csv.reader([header.decode('utf-8-sig')]))
+        csvfile.seek(max(offset, len(header)))
+        while len(rows) < limit:
+            row_offset = csvfile.tell()
+            line = csvfile.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            values = next(csv.reader([line.decode('utf-8')]))
+            rows.append((row_offset, line, dict(zip(fields, values))))
+        return rows, csvfile.tell()
+
+
+def build_orders(chain_value, rows, result):
+    """
+    Validate a batch of rows following chain_value and return the orders
+    to create and the chain value after the batch. Rows that oversell or
+    break a risk limit are rejected, counting the batch's earlier orders.
+    Must run in the transaction that creates the orders.
+    """
+    refs = []
+    for _, line, _ in rows:
+        chain_value = chain(chain_value, line)
+        refs.append(row_ref(chain_value))
+    booked = set(Order.objects.filter(source_ref__in=refs).values_list('source_ref', flat=True))
+
+    parsed = []
+    for ref, (offset, _, row) in zip(refs, rows):
+        if ref in booked:
+            result.skipped += 1
+            continue
+        try:
+            parsed.append((ref, int(row['user_id']), int(row['stock_id']),
+                           row['order_type'], int(row['quantity'])))
+        except (KeyError, TypeError, ValueError):
+            result.errors.append(f'Row at byte {offset} is not a valid order.')
+
+    user_ids = set(User.objects.filter(id__in={row[1] for row in parsed}).values_list('id', flat=True))
+    stocks = Stock.objects.in_bulk({row[2] for row in parsed})
+
+    limits = risk.BatchCheck(for_update=True)
+    held = {}
+    orders = []
+    for ref, user_id, stock_id, order_type, quantity in parsed:
+        if user_id not in user_ids:
+            result.errors.append(f'User with ID {user_id} does not exist.')
+            continue
+        if stock_id not in stocks:
+            result.errors.append(f'Stock with ID {stock_id} does not exist.')
+            continue
+        if order_type not in ORDER_TYPES or quantity < 1:
+            result.errors.append(f'Invalid order {order_type} {quantity} for stock ID {stock_id}.')
+            continue
+        if quantity % stocks[stock_id].lot_size:
+            result.errors.append(
+                f'Quantity {quantity} is not a multiple of the lot size for stock ID {stock_id}.')
+            continue
+
+        key = (user_id, stock_id)
+        if key not in held:
+            held[key] = positions.net_quantity(*key)
+        if order_type == 'sell' and quantity > held[key]:
+            result.errors.append(
+                f'User {user_id} does not have enough stock to sell for stock ID {stock_id}')
+            continue
+        try:
+            limits.check(user_id, stocks[stock_id], order_type, quantity)
+        except ValidationError as e:
+            result.errors.append(f'Order for user {user_id} in stock ID {stock_id}: {e.detail[0]}')
+            continue
+        held[key] += positions.signed_quantity(order_type, quantity)
+        orders.append(Order(user_id=user_id, stock_id=stock_id, order_type=order_type,
+                            quantity=quantity, source_ref=ref))
+    return orders, chain_value
+
+
+def import_batch(path, batch_size=500):
+    """Import the next batch_size rows of the file at path."""
+    file_fingerprint, size = fingerprint(path)
+    with transaction.atomic():
+        progress = BulkImport.objects.select_for_update().filter(fingerprint=file_fingerprint).first()
+        if progress is None:
+            progress, _ = BulkImport.objects.select_for_update().get_or_create(
+                fingerprint=file_fingerprint, defaults=new_import(path, file_fingerprint, size))
+        if not progress.chain:
+            # Started before rows were chained.
+            progress.chain, _ = prefix_chain(path, progress.source, progress.offset)
+        result = ImportResult(file_fingerprint, progress.offset, size,
+                              done=progress.completed_at is not None)
+        if result.done:
+            return result
+
+        rows, result.offset = read_rows(path, progress.offset, batch_size)
+        result.done = result.offset >= size
+        orders, progress.chain = build_orders(progress.chain, rows, result)
+        created = Order.objects.bulk_create(orders)
+        holdings.apply_orders(created)
+        risk.record_orders(created)
+        outbox.record_orders(created)
+        if created and journal.enabled():
+            transaction.on_commit(partial(journal.append, created))
+        result.placed = len(created)
+
+        progress.offset = result.offset
+        progress.rows_placed += result.placed
+        progress.rows_skipped += result.skipped
+        progress.rows_rejected += len(result.errors)
+        if result.done:
+            progress.completed_at = timezone.now()
+        progress.save()
+        # bulk_create bypasses post_save, so invalidate versions by hand.
+        transaction.on_commit(partial(invalidate_positions, {order.user_id for order in created}))
+    return result
+
+
+def invalidate_positions(user_ids):
+    for user_id in user_ids:
+        caching.bump_positions(user_id)
+        positions.invalidate(user_id)
+        pin_to_primary(user_pin(user_id))
+
+
+def import_orders(path, batch_size=500):
+    """Import the rest of the file at path, yielding the result of each batch."""
+    while True:
+        result = import_batch(path, batch_size)
+        yield result
+        if result.done:
+            return
@@ -0,0 +1,158 @@
+"""
+Version counters used to answer conditional GET requests for the
+stock catalogue and user portfolios without touching the database.
+
+Each version is the time of the last change to the resource, kept in the
+Django cache so every worker sharing that cache sees the same value.
+"""
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from api_trades.serializers import PortfolioQuerySerializer
+
+# Versions are recreated on a cache miss, so expiring them only costs
+# clients a single full response.
+VERSION_TIMEOUT = 60 * 60 * 24
+
+CATALOGUE_KEY = 'api_trades:catalogue:version'
+FX_KEY = 'api_trades:fx:version'
+
+
+def stock_key(stock_id):
+    """cache key for the version of a single stock"""
+    return f'api_trades:stock:{stock_id}:version'
+
+
+def positions_key(user_id):
+    """cache key for the version of a user's positions"""
+    return f'api_trades:positions:{user_id}:version'
+
+
+def get_version(key):
+    """Return the current version stored under key, creating it if missing."""
+    version = cache.get(key)
+    if version is None:
+        version = time.time()
+        if not cache.add(key, version, timeout=VERSION_TIMEOUT):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_version(key):
+    """Mark the resource stored under key as changed."""
+    cache.set(key, time.time(), timeout=VERSION_TIMEOUT)
+
+
+def bump_stock(stock_id):
+    """Mark a stock, and therefore the catalogue, as changed."""
+    bump_version(stock_key(stock_id))
+    bump_version(CATALOGUE_KEY)
+
+
+def bump_positions(user_id):
+    """Mark a user's positions as changed."""
+    bump_version(positions_key(user_id))
+
+
+def _tag(*versions):
+    return '-'.join(f'{int(version * 1_000_000):x}' for version in versions)
+
+
+def _modified(*versions):
+    return datetime.fromtimestamp(max(versions), tz=timezone.utc)
+
+
+def catalogue_etag(request, *args, **kwargs):
+    """ETag for the stock list"""
+    return f'"catalogue-{_tag(get_version(CATALOGUE_KEY))}"'
+
+
+def catalogue_last_modified(request, *args, **kwargs):
+    """Last-Modified for the stock list"""
+    return _modified(get_version(CATALOGUE_KEY))
+
+
+def stock_etag(request, *args, **kwargs):
+    """ETag for a single stock"""
+    pk = kwargs['pk']
+    return f'"stock-{pk}-{_tag(get_version(stock_key(pk)))}"'
+
+
+def stock_last_modified(request, *args, **kwargs):
+    """Last-Modified for a single stock"""
+    return _modified(get_version(stock_key(kwargs['pk'])))
+
+
+def _portfolio_versions(request):
+    return (
+        get_version(positions_key(request.user.id)),
+        get_version(CATALOGUE_KEY),
+        get_version(FX_KEY),
+    )
+
+
+def portfolio_version(request):
+    """
+    Tag of the positions, prices and rates a user's portfolio is valued
+    from, whatever the query.
+    """
+    return _tag(*_portfolio_versions(request))
+
+
+def portfolio_query(params):
+    """
+    Return validated PortfolioQuerySerializer data as a hashable key, so
+    requests asking the same question share one ETag and cache entry
+    whatever order or extra parameters their query strings have.
+    """
+    stocks = params.get('stocks')
+    return (
+        tuple(sorted(set(stocks))) if stocks is not None else None,
+        params['order_by'],
+        params.get('limit'),
+        params.get('base'),
+    )
+
+
+def portfolio_etag(request, *args, **kwargs):
+    """
+    ETag for a user's portfolio. Values depend on prices, exchange rates
+    and the query (base currency, stocks, sorting and limit) as well as
+    positions, so all of them are part of the tag. Invalid queries get no
+    ETag and are answered with their errors.
+    """
+    query = PortfolioQuerySerializer(data=request.GET)
+    if not query.is_valid():
+        return None
+    digest = hashlib.blake2b(
+        repr(portfolio_query(query.validated_data)).encode(), digest_size=8).hexdigest()
+    return f'"portfolio-{request.user.id}-{digest}-{portfolio_version(request)}"'
+
+
+def portfolio_last_modified(request, *args, **kwargs):
+    """Last-Modified for a user's portfolio"""
+    return _modified(*_portfolio_versions(request))
+
+
+def conditional(etag_func, last_modified_func):
+    """
+    Method decorator answering If-None-Match / If-Modified-Since with a
+    304 before the wrapped view runs any query. Responses are marked
+    private so shared caches never serve one user's data to another.
+    """
+    check = condition(etag_func=etag_func, last_modified_func=last_modified_func)
+
+    def decorator(func):
+        def inner(request, *args, **kwargs):
+            response = func(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return check(inner)
+
+    return method_decorator(decorator)
@@ -0,0 +1,82 @@
+"""
+Per-process cache of the serialized stock catalogue.
+
+The catalogue is rebuilt whenever the shared catalogue version moves on, so
+every worker serves the same data without re-running the queryset or the
+serializer on each request.
+"""
+import bisect
+import gzip
+import threading
+
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.renderers import JSONRenderer
+
+from api_trades import caching
+from api_trades.models import Stock
+from api_trades.serializers import StockSerializer
+
+
+class Catalogue:
+    """A rendered snapshot of every stock plus a sorted name index."""
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.rows = rows
+        self.content = JSONRenderer().render(rows)
+        self.compressed = gzip.compress(self.content)
+        index = sorted(
+            (row['name'].casefold(), position) for position, row in enumerate(rows)
+        )
+        self._names = [name for name, _ in index]
+        self._positions = [position for _, position in index]
+
+    def search(self, prefix):
+        """Return the stocks whose name starts with prefix, ignoring case."""
+        prefix = prefix.casefold()
+        start = bisect.bisect_left(self._names, prefix)
+        end = start
+        while end < len(self._names) and self._names[end].startswith(prefix):
+            end += 1
+        return [self.rows[position] for position in sorted(self._positions[start:end])]
+
+
+_lock = threading.Lock()
+_current = None
+
+
+def build(version):
+    """
+    Query and serialize every stock for the given catalogue version. Always
+    reads the primary: a lagging replica would be cached under the new
+    version until the next write.
+    """
+    stocks = Stock.objects.using(DEFAULT_DB_ALIAS).order_by('pk')
+    rows = StockSerializer(stocks, many=True).data
+    return Catalogue(version, list(rows))
+
+
+def get_catalogue():
+    """Return the catalogue, rebuilding it if another worker changed it."""
+    global _current
+    version = caching.get_version(caching.CATALOGUE_KEY)
+    current = _current
+    if current is not None and current.version == version:
+        return current
+
+    with _lock:
+        if _current is None or _current.version != version:
+            _current = build(version)
+        return _current
+
+
+def refresh():
+    """Rebuild the catalogue after a write made by this process."""
+    return get_catalogue()
+
+
+def clear():
+    """Drop the cached catalogue."""
+    global _current
+    with _lock:
+        _current = None
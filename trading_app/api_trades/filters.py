@@ -0,0 +1,56 @@
+"""
+Filtering, ordering and per-day summaries of a user's order history.
+
+Every query is already restricted to one user, and each filter has an
+index leading with user (see Order.Meta.indexes):
+
+- no filter, date range or date ordering: order_user_placed_idx
+- stock, with or without date range: order_user_stock_placed_idx
+- side, with or without date range: order_user_type_placed_idx
+- stock and side: whichever of those two the planner prefers
+- quantity range or quantity ordering: order_user_quantity_idx
+
+Other filters in the same request are applied to the rows the index
+finds. test_order_filters checks the query plans.
+"""
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+
+ORDERINGS = {
+    'date_time_placed': ('date_time_placed', 'id'),
+    '-date_time_placed': ('-date_time_placed', '-id'),
+    'quantity': ('quantity', 'id'),
+    '-quantity': ('-quantity', '-id'),
+}
+
+LOOKUPS = {
+    'stock': 'stock_id',
+    'side': 'order_type',
+    'min_quantity': 'quantity__gte',
+    'max_quantity': 'quantity__lte',
+    'placed_after': 'date_time_placed__gte',
+    'placed_before': 'date_time_placed__lt',
+}
+
+
+def filter_orders(queryset, params):
+    """Apply validated OrderFilterSerializer params to an order queryset."""
+    queryset = queryset.filter(**{
+        lookup: params[name] for name, lookup in LOOKUPS.items() if params.get(name) is not None
+    })
+    return queryset.order_by(*ORDERINGS[params.get('ordering', 'date_time_placed')])
+
+
+def daily_summary(queryset):
+    """Return order counts and quantities per day and stock, newest day first."""
+    return list(
+        queryset.annotate(day=TruncDate('date_time_placed'))
+        .values('day', 'stock_id', 'stock__name')
+        .annotate(
+            orders=Count('id'),
+            buy_quantity=Sum('quantity', filter=Q(order_type='buy'), default=0),
+            sell_quantity=Sum('quantity', filter=Q(order_type='sell'), default=0),
+            volume=Sum('quantity'),
+        )
+        .order_by('-day', 'stock_id')
+    )
@@ -0,0 +1,141 @@
+"""
+Reverse index from stocks to the users holding them, and precomputed
+portfolio valuations.
+
+Holding rows mirror positions.net_quantity for every (user, stock) pair
+and carry the holding's value in minor units of the stock's currency. New
+orders are applied as they are saved (post_save for single orders,
+apply_orders after bulk_create), so finding a stock's holders is an index
+lookup on Holding rather than an aggregate over Order.
+
+When a stock is repriced, reprice() rewrites value_minor for that stock's
+holdings in one UPDATE and revalue() recomputes only those holders'
+PortfolioValuation, so the cost grows with the number of holders rather
+than the number of orders.
+
+Orders edited or deleted through the ORM (e.g. in the admin) are taken back
+off with remove_orders() by the Order signal handlers. Archiving leaves
+positions, and so holdings, unchanged, and deleting a stock or user
+deletes their holdings with them. Anything else that bypasses the signals
+is picked up by rebuild(), run with `python manage.py rebuild_holdings`.
+
+Placing a single order applies it synchronously in the request, which
+costs a fixed number of queries (test_single_order_query_count).
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+
+from api_trades import positions
+from api_trades.models import Holding, PortfolioValuation, Stock
+
+REVALUE_BATCH_SIZE = 1000
+
+
+def _value_minor():
+    price_minor = Stock.objects.filter(pk=OuterRef('stock_id')).values('price_minor')[:1]
+    return F('quantity') * Subquery(price_minor)
+
+
+def holders(stock_id):
+    """Return the ids of the users currently holding a stock."""
+    return list(
+        Holding.objects.filter(stock_id=stock_id).exclude(quantity=0)
+        .order_by('user_id').values_list('user_id', flat=True)
+    )
+
+
+def apply_orders(orders):
+    """Add the orders' quantities to their holdings and revalue their owners."""
+    _apply_deltas(orders, 1)
+
+
+def remove_orders(orders):
+    """Take deleted or changed orders' quantities back off their holdings."""
+    _apply_deltas(orders, -1)
+
+
+def _apply_deltas(orders, sign):
+    deltas = defaultdict(int)
+    for order in orders:
+        deltas[order.user_id, order.stock_id] += sign * positions.signed_quantity(
+            order.order_type, int(order.quantity))
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        Holding.objects.bulk_create(
+            [Holding(user_id=user_id, stock_id=stock_id) for user_id, stock_id in deltas],
+            ignore_conflicts=True,
+        )
+        user_ids = {user_id for user_id, _ in deltas}
+        rows = [
+            holding
+            for holding in Holding.objects.select_for_update().filter(
+                user_id__in=user_ids, stock_id__in={stock_id for _, stock_id in deltas}
+            ).order_by('id')
+            if (holding.user_id, holding.stock_id) in deltas
+        ]
+        for holding in rows:
+            holding.quantity += deltas[holding.user_id, holding.stock_id]
+        Holding.objects.bulk_update(rows, ['quantity'])
+        Holding.objects.filter(id__in=[holding.id for holding in rows]).update(
+            value_minor=_value_minor())
+        revalue(user_ids)
+
+
+def revalue(user_ids):
+    """Recompute the PortfolioValuation of the given users from their holdings."""
+    user_ids = sorted(set(user_ids))
+    for start in range(0, len(user_ids), REVALUE_BATCH_SIZE):
+        batch = user_ids[start:start + REVALUE_BATCH_SIZE]
+        totals = {user_id: {} for user_id in batch}
+        rows = Holding.objects.filter(user_id__in=batch).exclude(quantity=0).values_list(
+            'user_id', 'stock__currency'
+        ).annotate(value_minor=Sum('value_minor')).order_by()
+        for user_id, currency, value_minor in rows:
+            totals[user_id][currency] = value_minor
+
+        PortfolioValuation.objects.bulk_create(
+            [PortfolioValuation(user_id=user_id, totals=value) for user_id, value in totals.items()],
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=['totals', 'updated_at'],
+        )
+
+
+def reprice(stock_id):
+    """
+    Revalue the holdings of a stock after its price or currency changed.
+    Returns the number of holders revalued.
+    """
+    with transaction.atomic():
+        Holding.objects.filter(stock_id=stock_id).exclude(quantity=0).update(
+            value_minor=_value_minor())
+        user_ids = holders(stock_id)
+        revalue(user_ids)
+    return len(user_ids)
+
+
+def rebuild():
+    """Recreate every holding and valuation from the orders and rollups."""
+    with transaction.atomic():
+        Holding.objects.all().delete()
+        Holding.objects.bulk_create(
+            [
+                Holding(user_id=user_id, stock_id=stock_id, quantity=quantity)
+                for (user_id, stock_id), quantity in positions.all_positions().items()
+            ],
+            batch_size=REVALUE_BATCH_SIZE,
+        )
+        Holding.objects.update(value_minor=_value_minor())
+        user_ids = set(Holding.objects.values_list('user_id', flat=True))
+        PortfolioValuation.objects.exclude(user_id__in=user_ids).delete()
+        revalue(user_ids)
+    return len(user_ids)
+
+
+def valuation(user_id):
+    """Return the user's PortfolioValuation, or None if they never traded."""
+    return PortfolioValuation.objects.filter(user_id=user_id).first()
@@ -0,0 +1,100 @@
+"""
+Background jobs run by the scheduler (api_trades/scheduler.py).
+
+A job is a function taking the run's checkpoint dict plus the options
+configured in SCHEDULER_JOBS. Each call processes one chunk of work,
+records its progress in the checkpoint and returns (items processed,
+finished). The checkpoint is saved in the same transaction as the chunk.
+"""
+import logging
+import os
+from datetime import datetime, timedelta
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.utils import timezone
+
+from user.authentication import purge_expired
+
+from api_trades import analytics, archive, bulk_orders, risk
+
+logger = logging.getLogger(__name__)
+
+JOBS = {}
+
+
+def job(name):
+    """Register a function as the job called name."""
+    def register(func):
+        JOBS[name] = func
+        return func
+    return register
+
+
+@job('place_bulk_order')
+def place_bulk_order(checkpoint, csv_file=None, batch_size=500):
+    """
+    Place the orders in the bulk order CSV file, batch_size rows at a time.
+    The import keeps its own byte-offset checkpoint (see bulk_orders.py).
+    """
+    path = csv_file or settings.BULK_ORDER_CSV
+    if not os.path.exists(path):
+        logger.warning('Bulk order file %s does not exist', path)
+        return 0, True
+
+    result = bulk_orders.import_batch(path, batch_size)
+    for error in result.errors:
+        logger.warning('Bulk order row rejected: %s', error)
+    checkpoint.update(fingerprint=result.fingerprint, offset=result.offset)
+    return result.rows, result.done
+
+
+@job('archive_orders')
+def archive_orders(checkpoint, days=365, batch_size=1000):
+    """Archive orders older than days, one batch per chunk."""
+    if 'cutoff' not in checkpoint:
+        checkpoint['cutoff'] = (timezone.now() - timedelta(days=days)).isoformat()
+        checkpoint['path'] = str(archive.new_archive_path())
+
+    cutoff = datetime.fromisoformat(checkpoint['cutoff'])
+    count = archive.archive_batch(cutoff, checkpoint['path'], batch_size)
+    return count, count < batch_size
+
+
+@job('manage_order_partitions')
+def manage_order_partitions(checkpoint, months_ahead=3, retain_months=None, drop=False):
+    """Create upcoming Order partitions and detach old ones."""
+    call_command(
+        'manage_order_partitions', months_ahead=months_ahead,
+        retain_months=retain_months, drop=drop, stdout=StringIO(),
+    )
+    return 0, True
+
+
+@job('refresh_analytics')
+def refresh_analytics(checkpoint, chunk_size=100000):
+    """Rebuild the analytics snapshot, copying chunk_size orders per chunk."""
+    if 'build' not in checkpoint or not (analytics.analytics_dir() / checkpoint['build']).exists():
+        checkpoint.update(build=analytics.start_build(), last_id=0)
+
+    checkpoint['last_id'], copied = analytics.export_chunk(
+        checkpoint['build'], checkpoint['last_id'], chunk_size)
+    if copied < chunk_size:
+        analytics.publish(checkpoint['build'])
+        return copied, True
+    return copied, False
+
+
+@job('purge_tokens')
+def purge_tokens(checkpoint, batch_size=1000):
+    """Delete expired auth tokens and stale revocation records in batches."""
+    tokens, revoked = purge_expired(batch_size)
+    return tokens + revoked, max(tokens, revoked) < batch_size
+
+
+@job('reset_risk_counters')
+def reset_risk_counters(checkpoint, batch_size=1000):
+    """Delete the risk counters of earlier days in batches."""
+    deleted = risk.purge_counters(batch_size)
+    return deleted, deleted < batch_size
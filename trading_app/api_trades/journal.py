@@ -0,0 +1,133 @@
+"""
+Append-only binary journal of orders.
+
+Every persisted order is appended as a fixed-width 32 byte record:
+
+    user_id   uint64
+    stock_id  uint64
+    ts        int64   microseconds since the epoch (date_time_placed)
+    quantity  uint32
+    side      uint8   0 = buy, 1 = sell, plus 2 if the order was deleted
+    padding   3 bytes
+
+The journal is never rewritten: deleting an order appends a copy of it
+flagged as deleted, which replaying subtracts again, and changing one
+appends a deleted copy of the old values followed by the new ones.
+Archived orders are not deleted in this sense and stay in the journal;
+they are counted through PositionRollup instead.
+
+Fixed-width little-endian records let the reader memory-map the file and
+view it as a NumPy structured array without parsing, so positions can be
+rebuilt without going through the ORM. The journal is disabled unless
+ORDER_JOURNAL_PATH is set. Only the readers need NumPy, so it is imported
+when they run rather than by every worker that appends.
+"""
+import mmap
+import os
+import struct
+from functools import cache
+
+from django.conf import settings
+
+BUY = 0
+SELL = 1
+DELETED = 2
+
+RECORD = struct.Struct('<QQqIB3x')
+
+FIELDS = [
+    ('user_id', '<u8'),
+    ('stock_id', '<u8'),
+    ('ts', '<i8'),
+    ('quantity', '<u4'),
+    ('side', 'u1'),
+    ('padding', 'V3'),
+]
+
+
+@cache
+def record_dtype():
+    """Return the NumPy dtype of a journal record."""
+    import numpy as np
+
+    dtype = np.dtype(FIELDS)
+    assert dtype.itemsize == RECORD.size
+    return dtype
+
+
+def enabled():
+    """Return True if orders should be journaled."""
+    return bool(settings.ORDER_JOURNAL_PATH)
+
+
+def pack(order, deleted=False):
+    """Return the journal record for an order, or for its deletion."""
+    placed = order.date_time_placed
+    ts = int(placed.timestamp() * 1_000_000) if placed else 0
+    side = BUY if order.order_type == 'buy' else SELL
+    if deleted:
+        side |= DELETED
+    return RECORD.pack(order.user_id, order.stock_id, ts, order.quantity, side)
+
+
+def append(orders, path=None, deleted=False):
+    """
+    Append orders, or their deletion, to the journal in a single write.
+    O_APPEND keeps concurrent writers from interleaving records.
+    """
+    path = path or settings.ORDER_JOURNAL_PATH
+    data = b''.join(pack(order, deleted) for order in orders)
+    if not data:
+        return
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+
+def read(path=None):
+    """
+    Memory-map the journal and return it as a structured array. A torn
+    record left by a crash mid-write is ignored.
+    """
+    import numpy as np
+
+    path = path or settings.ORDER_JOURNAL_PATH
+    dtype = record_dtype()
+    if not os.path.exists(path) or os.path.getsize(path) < dtype.itemsize:
+        return np.empty(0, dtype=dtype)
+    with open(path, 'rb') as journal_file:
+        buffer = mmap.mmap(journal_file.fileno(), 0, access=mmap.ACCESS_READ)
+    count = len(buffer) // dtype.itemsize
+    return np.frombuffer(buffer, dtype=dtype, count=count)
+
+
+def replay_positions(records):
+    """Return {(user_id, stock_id): net quantity} for a set of records."""
+    import numpy as np
+
+    if not len(records):
+        return {}
+
+    signed = records['quantity'].astype(np.int64)
+    signed[(records['side'] & SELL) != 0] *= -1
+    signed[(records['side'] & DELETED) != 0] *= -1
+
+    order = np.lexsort((records['stock_id'], records['user_id']))
+    user_ids = records['user_id'][order]
+    stock_ids = records['stock_id'][order]
+    changes = (user_ids[1:] != user_ids[:-1]) | (stock_ids[1:] != stock_ids[:-1])
+    starts = np.concatenate(([0], np.flatnonzero(changes) + 1))
+    totals = np.add.reduceat(signed[order], starts)
+
+    return {
+        (int(user_ids[start]), int(stock_ids[start])): int(total)
+        for start, total in zip(starts, totals)
+    }
+
+
+def order_count(records):
+    """Return the number of orders a set of records leaves in place."""
+    deleted = int(((records['side'] & DELETED) != 0).sum())
+    return len(records) - 2 * deleted
@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from trading_app.profiling import ProfiledCommand
+
+from api_trades import archive
+
+
+class Command(ProfiledCommand):
+    help = 'Move old orders into compressed archive files and per-user position rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365,
+                            help='Archive orders placed more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of orders archived per transaction')
+        parser.add_argument('--dir', type=str, default=settings.ORDER_ARCHIVE_DIR,
+                            help='Directory to write archive files to')
+        parser.add_argument('--index-existing', action='store_true',
+                            help='First record the segments of archive files written '
+                                 'before archives were indexed by user')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['index_existing']:
+            for path in archive.unindexed_archives(kwargs['dir']):
+                segments = archive.index_archive(path)
+                self.stdout.write(f'Indexed {path} into {segments} segments')
+
+        cutoff = timezone.now() - timedelta(days=kwargs['days'])
+        path, count = archive.archive_orders(
+            cutoff, batch_size=kwargs['batch_size'], directory=kwargs['dir'])
+
+        if not count:
+            self.stdout.write(f'No orders placed before {cutoff:%Y-%m-%d %H:%M} to archive')
+            return
+        self.stdout.write(self.style.SUCCESS(f'Archived {count} orders to {path}'))
@@ -0,0 +1,69 @@
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from trading_app.profiling import ProfiledCommand
+
+from api_trades import risk
+from api_trades.models import Order, RiskLimit, Stock
+
+
+def summarize(timings):
+    """Return 'mean / p50 / p99' of timings in milliseconds."""
+    timings = sorted(timings)
+    mean = sum(timings) / len(timings)
+    p50 = timings[len(timings) // 2]
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    return f'mean {mean * 1000:.3f} ms, p50 {p50 * 1000:.3f} ms, p99 {p99 * 1000:.3f} ms'
+
+
+class Command(ProfiledCommand):
+    help = 'Measure the latency risk limit checks add to placing an order, then roll back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=500,
+                            help='Number of orders timed with and without checks')
+        parser.add_argument('--history', type=int, default=10000,
+                            help='Number of earlier orders the benchmark user already has')
+
+    def handle(self, *args, **kwargs):
+        count = kwargs['orders']
+        with transaction.atomic():
+            user = get_user_model().objects.create_user(
+                username=f'benchmark{int(time.time())}', password='benchmark')
+            stock = Stock.objects.create(name='Benchmark', price=Decimal('1.00'))
+            stock.refresh_from_db()
+            Order.objects.bulk_create(
+                [Order(user=user, stock=stock, order_type='buy', quantity=1)
+                 for _ in range(kwargs['history'])],
+                batch_size=1000,
+            )
+            # Every limit is set, but high enough never to reject an order.
+            RiskLimit.objects.create(
+                user=user, stock=stock, max_position=10 ** 12,
+                max_order_notional=Decimal('1000000000'), max_daily_volume=10 ** 12)
+
+            unchecked, checked, checks = [], [], []
+            for _ in range(count):
+                started = time.perf_counter()
+                with transaction.atomic():
+                    Order.objects.create(user=user, stock=stock, order_type='buy', quantity=1)
+                unchecked.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                with transaction.atomic():
+                    risk.check_order(user.id, stock, 'buy', 1, for_update=True)
+                    checks.append(time.perf_counter() - started)
+                    Order.objects.create(user=user, stock=stock, order_type='buy', quantity=1)
+                checked.append(time.perf_counter() - started)
+
+            transaction.set_rollback(True)
+
+        added = (sum(checked) - sum(unchecked)) / count
+        self.stdout.write(f'{kwargs["history"]} earlier orders, {count} orders timed each way')
+        self.stdout.write(f'create without checks: {summarize(unchecked)}')
+        self.stdout.write(f'create with checks:    {summarize(checked)}')
+        self.stdout.write(f'check_order alone:     {summarize(checks)}')
+        self.stdout.write(self.style.SUCCESS(f'added latency per order: {added * 1000:.3f} ms'))
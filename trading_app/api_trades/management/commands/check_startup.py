@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.core.management.base import CommandError
+
+from trading_app.profiling import ProfiledCommand
+
+# Boots a worker the way gunicorn/uvicorn would: set up Django, build the
+# WSGI application and load every URL pattern (which imports all views).
+BOOT_SCRIPT = (
+    'from django.core.wsgi import get_wsgi_application\n'
+    'from django.urls import get_resolver\n'
+    'get_wsgi_application()\n'
+    'get_resolver().url_patterns\n'
+)
+
+
+def parse_importtime(output):
+    """Return [(module, self_us, cumulative_us)] from python -X importtime output."""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        try:
+            self_us, cumulative_us, module = line[len('import time:'):].split('|')
+            imports.append((module.strip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            # The header line ("self [us] | cumulative | imported package").
+            continue
+    return imports
+
+
+class Command(ProfiledCommand):
+    help = 'Report import time per module for a cold worker boot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=25,
+                            help='Number of slowest modules to list')
+        parser.add_argument('--max-ms', type=float, default=None,
+                            help='Fail if the boot takes longer than this many milliseconds')
+
+    def handle(self, *args, **kwargs):
+        env = dict(os.environ)
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT],
+            env=env, capture_output=True, text=True, check=False,
+        )
+        wall_ms = (time.perf_counter() - start) * 1000
+        if result.returncode:
+            raise CommandError(f'Worker boot failed:\n{result.stderr[-2000:]}')
+
+        imports = parse_importtime(result.stderr)
+        total_ms = sum(self_us for _, self_us, _ in imports) / 1000
+
+        packages = defaultdict(int)
+        for module, self_us, _ in imports:
+            packages[module.split('.')[0]] += self_us
+
+        self.stdout.write(
+            f'Settings: {env.get("DJANGO_SETTINGS_MODULE")}\n'
+            f'Boot wall time: {wall_ms:.0f} ms, imports: {total_ms:.0f} ms '
+            f'across {len(imports)} modules\n')
+
+        self.stdout.write('Slowest modules (cumulative ms):')
+        for module, _, cumulative_us in sorted(imports, key=lambda item: -item[2])[:kwargs['top']]:
+            self.stdout.write(f'  {cumulative_us / 1000:8.1f}  {module}')
+
+        self.stdout.write('\nImport time by top-level package (self ms):')
+        for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:kwargs['top']]:
+            self.stdout.write(f'  {self_us / 1000:8.1f}  {package}')
+
+        if kwargs['max_ms'] is not None and wall_ms > kwargs['max_ms']:
+            raise CommandError(
+                f'Worker boot took {wall_ms:.0f} ms, over the {kwargs["max_ms"]:.0f} ms budget')
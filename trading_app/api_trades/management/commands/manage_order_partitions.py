@@ -0,0 +1,57 @@
+from datetime import datetime, timezone
+
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+
+from trading_app.profiling import ProfiledCommand
+
+from api_trades import archive, partitions
+
+
+class Command(ProfiledCommand):
+    help = ('Create upcoming monthly Order partitions, and archive the orders in old ones '
+            'before detaching them (PostgreSQL only)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3,
+                            help='Make sure partitions exist up to this many months ahead')
+        parser.add_argument('--retain-months', type=int, default=None,
+                            help='Archive the orders of partitions older than this many '
+                                 'months, then detach them')
+        parser.add_argument('--drop', action='store_true',
+                            help='Drop detached partitions instead of keeping them as tables')
+
+    def handle(self, *args, **kwargs):
+        if not partitions.is_partitioned(connection):
+            self.stdout.write('The Order table is not partitioned (PostgreSQL only); nothing to do.')
+            return
+
+        current = partitions.month_start(datetime.now(timezone.utc))
+        attached = partitions.monthly_partitions(connection)
+
+        for offset in range(kwargs['months_ahead'] + 1):
+            month = partitions.add_months(current, offset)
+            with transaction.atomic():
+                if partitions.create_partition(connection, month):
+                    self.stdout.write(self.style.SUCCESS(
+                        f'Created partition {partitions.partition_name(month)}'))
+
+        if kwargs['retain_months'] is not None:
+            cutoff = partitions.add_months(current, -kwargs['retain_months'])
+            old = [name for month, name in sorted(attached.items()) if month < cutoff]
+            if not old:
+                return
+
+            # Fold the orders into PositionRollup so positions still count them.
+            path, count = archive.archive_orders(partitions.month_bound(cutoff))
+            if count:
+                self.stdout.write(self.style.SUCCESS(f'Archived {count} orders to {path}'))
+
+            for name in old:
+                try:
+                    with transaction.atomic():
+                        partitions.detach_partition(connection, name, drop=kwargs['drop'])
+                except partitions.PartitionNotEmpty:
+                    raise CommandError(f'Partition {name} received orders while it was archived')
+                action = 'Dropped' if kwargs['drop'] else 'Detached'
+                self.stdout.write(self.style.SUCCESS(f'{action} partition {name}'))
@@ -1,61 +1,46 @@
-import csv
 import os
-from django.core.management.base import BaseCommand
-from django.contrib.auth.models import User
-from api_trades.models import Stock, Order
 
+from django.conf import settings
 
-class Command(BaseCommand):
-    help = 'Place bulk orders from a CSV file'
+from trading_app.profiling import ProfiledCommand
+
+from api_trades import bulk_orders
+
+
+class Command(ProfiledCommand):
+    help = 'Place bulk orders from a CSV file, resuming an interrupted import'
 
     def add_arguments(self, parser):
-        parser.add_argument('csv_file', type=str, help='Path to the CSV file')
+        parser.add_argument('csv_file', type=str, nargs='?', default=settings.BULK_ORDER_CSV,
+                            help='Path to the CSV file (defaults to BULK_ORDER_CSV)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of rows committed together')
 
     def handle(self, *args, **kwargs):
-        # absolute filepath from gitpod.
-        csv_file_path = '/workspace/DRF-Trading/trading_app/data/bulk_order.csv'
+        csv_file_path = kwargs['csv_file']
         self.stdout.write(f'CSV File Path: {csv_file_path}\n')
-        self.stdout.write(f'Current Directory: {os.getcwd()}\n')
 
         if not os.path.exists(csv_file_path):
             self.stdout.write(self.style.ERROR('CSV file does not exist'))
             return
 
+        placed = skipped = rejected = 0
         try:
-            with open(csv_file_path, newline='', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    user_id = row['user_id']
-                    stock_id = row['stock_id']
-                    order_type = row['order_type']
-                    quantity = int(row['quantity'])
-
-                    try:
-                        user = User.objects.get(id=user_id)
-                        stock = Stock.objects.get(id=stock_id)
-
-                        if order_type == 'sell' and not self.can_sell(user, stock, quantity):
-                            self.stdout.write(
-                                self.style.ERROR(
-                                    f'User {user_id} does not have enough stock to sell for stock ID {stock_id}'))
-                            continue
-
-                        Order.objects.create(user=user, stock=stock, order_type=order_type, quantity=quantity)
-
-                    except User.DoesNotExist:
-                        self.stdout.write(self.style.ERROR(f'User with ID {user_id} does not exist.'))
-                    except Stock.DoesNotExist:
-                        self.stdout.write(self.style.ERROR(f'Stock with ID {stock_id} does not exist.'))
-
-            self.stdout.write(self.style.SUCCESS('Successfully placed bulk orders'))
-
-        except FileNotFoundError:
-            self.stdout.write(self.style.ERROR(f'The file {csv_file_path} does not exist.'))
+            for result in bulk_orders.import_orders(csv_file_path, kwargs['batch_size']):
+                for error in result.errors:
+                    self.stdout.write(self.style.ERROR(error))
+                placed += result.placed
+                skipped += result.skipped
+                rejected += len(result.errors)
+                if kwargs['verbosity'] > 1:
+                    self.stdout.write(f'{result.offset}/{result.size} bytes imported')
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'An error occurred: {str(e)}'))
+            return
 
-    def can_sell(self, user, stock, quantity):
-        ''' Check if the user has enough stock to sell '''
-        buy_orders = Order.objects.filter(user=user, stock=stock, order_type='buy')
-        total_buy_quantity = sum(order.quantity for order in buy_orders)
-        return total_buy_quantity >= quantity
+        if not (placed or skipped or rejected):
+            self.stdout.write('This file has already been imported')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully placed bulk orders: {placed} placed, {rejected} rejected, '
+            f'{skipped} already placed'))
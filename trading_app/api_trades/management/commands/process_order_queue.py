@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+
+from trading_app.profiling import ProfiledCommand
+
+from api_trades import order_queue
+
+
+class Command(ProfiledCommand):
+    help = 'Persist orders accepted through the order queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.ORDER_QUEUE_BATCH_SIZE,
+                            help='Number of queued orders written per bulk insert')
+        parser.add_argument('--interval', type=float, default=0.5,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the queue and exit instead of polling forever')
+        parser.add_argument('--purge-after', type=float, default=None,
+                            help='Delete finished queue rows older than this many hours')
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs['batch_size']
+        # Anything still pending was accepted before the last shutdown or
+        # crash; it is replayed first because draining is in queue order,
+        # once the lease of a worker that crashed has expired.
+        total = 0
+        while True:
+            processed = order_queue.drain(batch_size)
+            total += processed
+            if processed:
+                continue
+
+            if kwargs['purge_after'] is not None:
+                order_queue.get_queue().purge(time.time() - kwargs['purge_after'] * 3600)
+            if kwargs['once']:
+                break
+            time.sleep(kwargs['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {total} queued orders'))
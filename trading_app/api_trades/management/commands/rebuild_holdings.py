@@ -0,0 +1,11 @@
+from trading_app.profiling import ProfiledCommand
+
+from api_trades import holdings
+
+
+class Command(ProfiledCommand):
+    help = 'Recreate the stock holder index and portfolio valuations from the orders'
+
+    def handle(self, *args, **kwargs):
+        count = holdings.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt holdings and valuations for {count} users'))
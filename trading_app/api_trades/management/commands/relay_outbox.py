@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import CommandError
+
+from trading_app.profiling import ProfiledCommand
+
+from api_trades import outbox
+
+
+class Command(ProfiledCommand):
+    help = 'Publish order and stock events from the outbox to a sink'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sink', nargs='?', default='file',
+                            help='Name of the sink in OUTBOX_SINKS')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of events published per batch')
+        parser.add_argument('--interval', type=float, default=settings.OUTBOX_POLL_SECONDS,
+                            help='Seconds to wait when there are no new events')
+        parser.add_argument('--once', action='store_true',
+                            help='Publish every pending event and exit instead of polling forever')
+
+    def handle(self, *args, **kwargs):
+        name = kwargs['sink']
+        if name not in settings.OUTBOX_SINKS:
+            raise CommandError(
+                f'Unknown sink {name}. Configured sinks: {", ".join(settings.OUTBOX_SINKS)}')
+        sink = outbox.get_sink(name)
+
+        total = 0
+        while True:
+            published = outbox.relay(name, sink, kwargs['batch_size'])
+            total += published
+            if published:
+                continue
+            if kwargs['once']:
+                break
+            time.sleep(kwargs['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Published {total} events to {name}'))
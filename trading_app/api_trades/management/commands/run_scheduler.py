@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.core.management.base import CommandError
+
+from trading_app.profiling import ProfiledCommand
+
+from api_trades.models import JobRun
+from api_trades.scheduler import Scheduler, job_stats
+
+
+class Command(ProfiledCommand):
+    help = 'Run the scheduled background jobs (bulk orders, archiving, partitions)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Run the jobs that are due and exit')
+        parser.add_argument('--job', type=str, default=None,
+                            help='Run this job now, whether due or not, and exit')
+        parser.add_argument('--concurrency', type=int, default=settings.SCHEDULER_CONCURRENCY,
+                            help='Number of jobs this worker runs at once')
+        parser.add_argument('--status', action='store_true',
+                            help='Show the schedule and timing of each job and exit')
+
+    def handle(self, *args, **kwargs):
+        scheduler = Scheduler()
+        scheduler.sync()
+
+        if kwargs['status']:
+            self.show_status()
+            return
+
+        if kwargs['job'] or kwargs['once']:
+            if kwargs['job'] and kwargs['job'] not in scheduler.jobs:
+                raise CommandError(f'Job {kwargs["job"]} is not in SCHEDULER_JOBS')
+            runs = scheduler.run_pending(kwargs['job'])
+            for run in runs:
+                self.show_run(run)
+            if not runs:
+                self.stdout.write('No jobs due')
+            return
+
+        self.stdout.write(
+            f'Scheduler {scheduler.worker} running {", ".join(scheduler.jobs)} '
+            f'with concurrency {kwargs["concurrency"]}')
+        scheduler.serve(concurrency=kwargs['concurrency'])
+
+    def show_run(self, run):
+        message = (
+            f'{run.job.name}: {run.status}, {run.items} items in {run.chunks} chunks, '
+            f'{run.duration_seconds:.2f}s (slowest chunk {run.slowest_chunk_seconds:.2f}s)'
+        )
+        if run.status == JobRun.FAILED:
+            self.stdout.write(self.style.ERROR(message))
+            self.stdout.write(run.error)
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
+
+    def show_status(self):
+        for stats in job_stats():
+            average = stats['average_seconds']
+            self.stdout.write(
+                f'{stats["name"]}: next run {stats["next_run_at"]:%Y-%m-%d %H:%M}, '
+                f'{stats["runs"]} runs, {stats["failures"]} failures, '
+                f'average {average or 0:.2f}s, last {stats["last_status"] or "never run"}'
+                + (f' (running on {stats["running"]})' if stats['running'] else '')
+            )
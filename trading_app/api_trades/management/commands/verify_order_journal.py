@@ -0,0 +1,54 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db.models import Sum
+
+from trading_app.profiling import ProfiledCommand
+
+from api_trades import journal, positions
+from api_trades.models import Order, PositionRollup
+
+
+class Command(ProfiledCommand):
+    help = 'Check that the order journal replays to the same positions as the Order table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', type=str, default=settings.ORDER_JOURNAL_PATH,
+                            help='Path to the journal (defaults to ORDER_JOURNAL_PATH)')
+
+    def handle(self, *args, **kwargs):
+        path = kwargs['path']
+        if not path:
+            raise CommandError('No journal configured. Set ORDER_JOURNAL_PATH or pass --path.')
+
+        start = time.perf_counter()
+        records = journal.read(path)
+        replayed = journal.replay_positions(records)
+        elapsed = time.perf_counter() - start
+        rate = len(records) / elapsed if elapsed else 0
+        self.stdout.write(
+            f'Replayed {len(records)} orders in {elapsed:.3f}s ({rate:,.0f} orders/s)')
+
+        # Archived orders stay in the journal but leave the Order table.
+        order_count = Order.objects.count() + (
+            PositionRollup.objects.aggregate(total=Sum('order_count'))['total'] or 0)
+        expected = positions.all_positions()
+
+        mismatches = [
+            (key, expected.get(key, 0), replayed.get(key, 0))
+            for key in sorted(expected.keys() | replayed.keys())
+            if expected.get(key, 0) != replayed.get(key, 0)
+        ]
+        for (user_id, stock_id), db_quantity, journal_quantity in mismatches:
+            self.stdout.write(self.style.ERROR(
+                f'User {user_id} stock {stock_id}: database {db_quantity}, journal {journal_quantity}'))
+
+        journaled = journal.order_count(records)
+        if order_count != journaled:
+            self.stdout.write(self.style.ERROR(
+                f'Order table and rollups hold {order_count} orders, journal has {journaled}'))
+
+        if mismatches or order_count != journaled:
+            raise CommandError('Order journal does not match the Order table')
+        self.stdout.write(self.style.SUCCESS('Order journal matches the Order table'))
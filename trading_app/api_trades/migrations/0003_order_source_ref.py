@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 23:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_trades', '0002_order_date_time_placed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='source_ref',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=80, null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Partitions the Order table by month on PostgreSQL; a no-op elsewhere.
+
+from django.db import migrations
+
+from api_trades.partitions import partition_order_table, unpartition_order_table
+
+
+def partition(apps, schema_editor):
+    partition_order_table(schema_editor, apps.get_model('api_trades', 'Order'))
+
+
+def unpartition(apps, schema_editor):
+    unpartition_order_table(schema_editor, apps.get_model('api_trades', 'Order'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_trades', '0003_order_source_ref'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition, unpartition),
+    ]
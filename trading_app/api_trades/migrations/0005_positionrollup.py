@@ -0,0 +1,31 @@
+# Generated by Django 5.1 on 2026-10-18 23:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_trades', '0004_partition_order'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PositionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('buy_quantity', models.PositiveBigIntegerField(default=0)),
+                ('sell_quantity', models.PositiveBigIntegerField(default=0)),
+                ('order_count', models.PositiveIntegerField(default=0)),
+                ('archived_through', models.DateTimeField(blank=True, null=True)),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api_trades.stock')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'stock'), name='unique_rollup_per_user_stock')],
+            },
+        ),
+    ]
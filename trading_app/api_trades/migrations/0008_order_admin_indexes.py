@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-19 00:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_trades', '0007_bulkimport'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['date_time_placed'], name='order_placed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_type', 'date_time_placed'], name='order_type_placed_idx'),
+        ),
+    ]
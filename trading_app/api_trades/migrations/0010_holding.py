@@ -0,0 +1,79 @@
+# Generated by Django 5.1 on 2026-10-19 00:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+
+
+def build_holdings(apps, schema_editor):
+    """Index the positions that existed before holdings were tracked."""
+    Holding = apps.get_model('api_trades', 'Holding')
+    Order = apps.get_model('api_trades', 'Order')
+    PortfolioValuation = apps.get_model('api_trades', 'PortfolioValuation')
+    PositionRollup = apps.get_model('api_trades', 'PositionRollup')
+    Stock = apps.get_model('api_trades', 'Stock')
+
+    held = {}
+    rows = Order.objects.values_list('user_id', 'stock_id').annotate(
+        net_quantity=Sum('quantity', filter=Q(order_type='buy'), default=0)
+        - Sum('quantity', filter=Q(order_type='sell'), default=0)
+    ).order_by()
+    for user_id, stock_id, quantity in rows:
+        held[user_id, stock_id] = quantity
+    for rollup in PositionRollup.objects.all():
+        key = rollup.user_id, rollup.stock_id
+        held[key] = held.get(key, 0) + rollup.buy_quantity - rollup.sell_quantity
+
+    Holding.objects.bulk_create(
+        [Holding(user_id=user_id, stock_id=stock_id, quantity=quantity)
+         for (user_id, stock_id), quantity in held.items()],
+        batch_size=1000,
+    )
+    price_minor = Stock.objects.filter(pk=OuterRef('stock_id')).values('price_minor')[:1]
+    Holding.objects.update(value_minor=F('quantity') * Subquery(price_minor))
+
+    totals = {}
+    rows = Holding.objects.exclude(quantity=0).values_list(
+        'user_id', 'stock__currency').annotate(value_minor=Sum('value_minor')).order_by()
+    for user_id, currency, value_minor in rows:
+        totals.setdefault(user_id, {})[currency] = value_minor
+    PortfolioValuation.objects.bulk_create(
+        [PortfolioValuation(user_id=user_id, totals=value) for user_id, value in totals.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_trades', '0009_stock_currency_lot_size'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioValuation',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('totals', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Holding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('value_minor', models.BigIntegerField(default=0)),
+                ('stock', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='holdings', to='api_trades.stock')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['stock', 'user'], name='holding_stock_user_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'stock'), name='unique_holding_per_user_stock')],
+            },
+        ),
+        migrations.RunPython(build_holdings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1 on 2026-10-19 00:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_trades', '0010_holding'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RiskCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('volume', models.PositiveBigIntegerField(default=0)),
+                ('stock', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='api_trades.stock')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='risk_counter_day_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('stock__isnull', False)), fields=('user', 'stock', 'day'), name='unique_risk_counter_per_stock'), models.UniqueConstraint(condition=models.Q(('stock__isnull', True)), fields=('user', 'day'), name='unique_risk_counter_total')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RiskLimit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('max_position', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('max_order_notional', models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True)),
+                ('max_daily_volume', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('stock', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='api_trades.stock')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'stock'), name='unique_risk_limit_per_user_stock')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_fingerprint(apps, schema_editor):
+    """Imports started before this keep their fingerprint as their source."""
+    BulkImport = apps.get_model('api_trades', 'BulkImport')
+    BulkImport.objects.update(source=F('fingerprint'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_trades', '0014_archive_segments'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkimport',
+            name='source',
+            field=models.CharField(default='', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='bulkimport',
+            name='chain',
+            field=models.CharField(blank=True, default='', max_length=32),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_fingerprint, migrations.RunPython.noop),
+    ]
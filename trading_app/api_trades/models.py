@@ -1,17 +1,46 @@
 '''Models for api_trades app'''
+from django.core.validators import RegexValidator
 from django.db import models
+from django.db.models.functions import Cast, Round
 from django.contrib.auth.models import User
 
+# Prices are held to two decimal places, so hundredths of the currency unit
+# are the integer unit all valuation is done in (see valuation.py).
+MINOR_UNITS_PER_UNIT = 100
+
+currency_code = RegexValidator(r'^[A-Z]{3}$', 'Enter a three letter ISO 4217 currency code.')
+
 
 class Stock(models.Model):
     """The stock model"""
     name = models.CharField(max_length=100, blank=False, null=False)
     price = models.DecimalField(max_digits=10, decimal_places=2, blank=False, null=False)
+    currency = models.CharField(max_length=3, default='USD', validators=[currency_code])
+    # Orders must be for a whole number of lots.
+    lot_size = models.PositiveIntegerField(default=1)
+    price_minor = models.GeneratedField(
+        expression=Cast(Round(models.F('price') * MINOR_UNITS_PER_UNIT), models.BigIntegerField()),
+        output_field=models.BigIntegerField(),
+        db_persist=True,
+    )
 
     def __str__(self):
         return f'{self.name}'
 
 
+class ExchangeRate(models.Model):
+    """
+    Value of one unit of a currency in FX_REFERENCE_CURRENCY. The reference
+    currency itself needs no row.
+    """
+    currency = models.CharField(max_length=3, unique=True, validators=[currency_code])
+    rate = models.DecimalField(max_digits=18, decimal_places=8)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.currency} {self.rate}'
+
+
 class Order(models.Model):
     """The order model"""
     ORDER_CHOICES = [
@@ -19,11 +48,265 @@ class Order(models.Model):
         ('sell', 'Sell'),
     ]
 
-    user = models.ForeignKey(User, on_delete=models.CASCADE, blank=False, null=False)
+    # Covered by the order_user_* indexes, which all lead with user.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, blank=False, null=False,
+                             db_index=False)
     stock = models.ForeignKey(Stock, on_delete=models.CASCADE, blank=False, null=False)
     order_type = models.CharField(max_length=4, choices=ORDER_CHOICES, null=False, blank=False)
     quantity = models.PositiveIntegerField(null=False, blank=False)
     date_time_placed = models.DateTimeField(auto_now_add=True)
+    # Identifies the record an order was persisted from (e.g. a queue ticket)
+    # so replaying that record never books the order twice.
+    source_ref = models.CharField(max_length=80, null=True, blank=True, db_index=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_time_placed'], name='order_placed_idx'),
+            models.Index(fields=['order_type', 'date_time_placed'], name='order_type_placed_idx'),
+            # One per filter the order list supports (see filters.py); id
+            # makes each usable for the list's tie-broken ordering.
+            models.Index(fields=['user', 'date_time_placed', 'id'], name='order_user_placed_idx'),
+            models.Index(fields=['user', 'stock', 'date_time_placed', 'id'],
+                         name='order_user_stock_placed_idx'),
+            models.Index(fields=['user', 'order_type', 'date_time_placed', 'id'],
+                         name='order_user_type_placed_idx'),
+            models.Index(fields=['user', 'quantity', 'id'], name='order_user_quantity_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.stock.name} - {self.order_type} - {self.quantity}"
+
+
+class PositionRollup(models.Model):
+    """
+    Totals of a user's archived orders in a stock. Positions are the rollup
+    plus the orders still in the Order table.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, blank=False, null=False)
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, blank=False, null=False)
+    buy_quantity = models.PositiveBigIntegerField(default=0)
+    sell_quantity = models.PositiveBigIntegerField(default=0)
+    order_count = models.PositiveIntegerField(default=0)
+    archived_through = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'stock'], name='unique_rollup_per_user_stock'),
+        ]
+
+    @property
+    def net_quantity(self):
+        return self.buy_quantity - self.sell_quantity
+
+    def __str__(self):
+        return f"{self.user_id} - {self.stock_id} - {self.net_quantity}"
+
+
+class ArchiveSegment(models.Model):
+    """
+    Where one user's orders from one archive batch are stored: a gzip
+    member of file_name in the archive directory. Lets a user's archived
+    orders be read without decompressing anyone else's.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, blank=False, null=False)
+    file_name = models.CharField(max_length=255)
+    offset = models.PositiveBigIntegerField()
+    length = models.PositiveBigIntegerField()
+    order_count = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'file_name', 'offset'], name='archive_segment_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.file_name}@{self.offset}"
+
+
+class Holding(models.Model):
+    """
+    A user's current net quantity of a stock and its value in the stock's
+    currency, kept up to date as orders are placed. Indexed by stock so the
+    holders of a stock can be found without scanning orders.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Covered by holding_stock_user_idx.
+    stock = models.ForeignKey(
+        Stock, on_delete=models.CASCADE, related_name='holdings', db_index=False)
+    quantity = models.BigIntegerField(default=0)
+    value_minor = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'stock'], name='unique_holding_per_user_stock'),
+        ]
+        indexes = [
+            models.Index(fields=['stock', 'user'], name='holding_stock_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.stock_id} - {self.quantity}"
+
+
+class PortfolioValuation(models.Model):
+    """
+    Precomputed value of a user's holdings, as {currency: minor units},
+    refreshed whenever their holdings or the prices of their stocks change.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    totals = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id} - {self.totals}"
+
+
+class RiskLimit(models.Model):
+    """
+    Pre-trade limits for a user, a stock, or a user in a stock. Leaving user
+    or stock empty applies the limit to every user or stock, and leaving a
+    limit empty disables it. Every limit matching an order applies.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, null=True, blank=True)
+    # Largest quantity of a stock the user may hold.
+    max_position = models.PositiveBigIntegerField(null=True, blank=True)
+    # Largest value of a single order, in FX_REFERENCE_CURRENCY.
+    max_order_notional = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True)
+    # Largest quantity the user may trade in a UTC day (in the stock, or in
+    # total when no stock is set).
+    max_daily_volume = models.PositiveBigIntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'stock'], name='unique_risk_limit_per_user_stock'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id or '*'} - {self.stock_id or '*'}"
+
+
+class RiskCounter(models.Model):
+    """
+    Quantity a user has traded on a day, in one stock or (with no stock) in
+    total. Counters for earlier days are ignored and purged by the
+    reset_risk_counters job.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, null=True, blank=True)
+    day = models.DateField()
+    volume = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'stock', 'day'], condition=models.Q(stock__isnull=False),
+                name='unique_risk_counter_per_stock'),
+            models.UniqueConstraint(
+                fields=['user', 'day'], condition=models.Q(stock__isnull=True),
+                name='unique_risk_counter_total'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='risk_counter_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.stock_id or '*'} - {self.day} - {self.volume}"
+
+
+class OutboxEvent(models.Model):
+    """
+    A change to an order or stock, written in the same transaction as the
+    change. seq is assigned once the event is committed (see outbox.py).
+    """
+    seq = models.BigIntegerField(null=True, blank=True, unique=True)
+    topic = models.CharField(max_length=50)
+    key = models.CharField(max_length=50)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(seq__isnull=True),
+                         name='outbox_unsequenced_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.seq} - {self.topic} - {self.key}"
+
+
+class OutboxCursor(models.Model):
+    """Last sequence number assigned by the sequencer, or relayed to a sink."""
+    name = models.CharField(max_length=100, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} - {self.position}"
+
+
+class BulkImport(models.Model):
+    """
+    Progress of importing a bulk order CSV file (see api_trades/bulk_orders.py).
+    offset is the byte offset of the next row to import, and chain the
+    chained hash of the rows before it, starting from source.
+    """
+    fingerprint = models.CharField(max_length=64, unique=True)
+    source = models.CharField(max_length=64)
+    chain = models.CharField(max_length=32, blank=True)
+    path = models.CharField(max_length=500)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    rows_placed = models.PositiveIntegerField(default=0)
+    rows_skipped = models.PositiveIntegerField(default=0)
+    rows_rejected = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.path} - {self.offset}/{self.size}'
+
+
+class Job(models.Model):
+    """
+    A scheduled background job (see api_trades/scheduler.py). A worker
+    holds the lease while running it; checkpoint records its progress so
+    an interrupted run resumes where it stopped.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    next_run_at = models.DateTimeField()
+    lease_owner = models.CharField(max_length=100, null=True, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    checkpoint = models.JSONField(default=dict, blank=True)
+
+    def __str__(self):
+        return f'{self.name}'
+
+
+class JobRun(models.Model):
+    """Timing and outcome of one run of a job."""
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    ABANDONED = 'abandoned'
+    STATUS_CHOICES = [
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+        (ABANDONED, 'Abandoned'),
+    ]
+
+    job = models.ForeignKey(Job, on_delete=models.CASCADE, related_name='runs')
+    worker = models.CharField(max_length=100)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=RUNNING)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration_seconds = models.FloatField(default=0)
+    chunks = models.PositiveIntegerField(default=0)
+    items = models.PositiveIntegerField(default=0)
+    slowest_chunk_seconds = models.FloatField(default=0)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f'{self.job.name} - {self.status} - {self.started_at}'
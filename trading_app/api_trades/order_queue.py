@@ -0,0 +1,314 @@
+"""
+Accept-then-persist order queue.
+
+When ORDER_QUEUE_ENABLED is set, OrdersViewSet validates an order against
+the in-memory position cache, appends it to a local SQLite (WAL) queue and
+returns a ticket straight away. The process_order_queue command drains
+the queue into the Order table with bulk_create.
+
+Queued rows are only marked done after their orders are committed, and
+persisted orders carry their ticket in Order.source_ref, so a worker that
+crashes part way through a batch simply replays it on restart.
+
+Several workers can drain the same queue. Each batch is claimed with a
+lease of ORDER_QUEUE_LEASE seconds before it is persisted, so no two
+workers insert the same rows, and a claim skips users with rows leased to
+another worker, so each user's orders are still persisted in order. The
+rows of a worker that dies are claimed again once their lease expires.
+"""
+import sqlite3
+import threading
+import time
+import uuid
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from trading_app.routers import pin_to_primary, user_pin
+
+from api_trades import caching, holdings, journal, outbox, positions, risk
+from api_trades.models import Order, Stock
+from api_trades.serializers import check_holdings
+
+PENDING = 'pending'
+DONE = 'done'
+REJECTED = 'rejected'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queued_order (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    ticket TEXT NOT NULL UNIQUE,
+    user_id INTEGER NOT NULL,
+    stock_id INTEGER NOT NULL,
+    order_type TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    accepted_at REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    order_id INTEGER,
+    error TEXT,
+    claimed_by TEXT,
+    claimed_until REAL
+);
+CREATE INDEX IF NOT EXISTS queued_order_status ON queued_order (status, seq);
+CREATE INDEX IF NOT EXISTS queued_order_user ON queued_order (user_id, status);
+"""
+
+COLUMNS = 'seq, ticket, user_id, stock_id, order_type, quantity, accepted_at, status, order_id, error'
+
+# Added after the first release; queue files created before it lack them.
+LEASE_COLUMNS = {'claimed_by': 'TEXT', 'claimed_until': 'REAL'}
+
+
+def enabled():
+    """Return True if orders should be accepted through the queue."""
+    return settings.ORDER_QUEUE_ENABLED
+
+
+class OrderQueue:
+    """A durable queue of accepted orders stored in a local SQLite file."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        """Return this thread's connection, creating the schema on first use."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=FULL')
+            connection.executescript(SCHEMA)
+            existing = {row['name'] for row in connection.execute('PRAGMA table_info(queued_order)')}
+            for column, column_type in LEASE_COLUMNS.items():
+                if column not in existing:
+                    connection.execute(f'ALTER TABLE queued_order ADD COLUMN {column} {column_type}')
+            self._local.connection = connection
+        return connection
+
+    def close(self):
+        """Close this thread's connection."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def enqueue(self, user_id, stock_id, order_type, quantity):
+        """Durably append an order and return its ticket."""
+        ticket = uuid.uuid4().hex
+        self.connection.execute(
+            'INSERT INTO queued_order (ticket, user_id, stock_id, order_type, quantity, accepted_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (ticket, user_id, stock_id, order_type, quantity, time.time()),
+        )
+        return ticket
+
+    def get(self, ticket):
+        """Return the queued row for a ticket, or None."""
+        return self.connection.execute(
+            f'SELECT {COLUMNS} FROM queued_order WHERE ticket = ?', (ticket,)
+        ).fetchone()
+
+    def claim(self, limit, lease):
+        """
+        Lease up to limit pending rows for lease seconds, skipping rows that
+        are leased already and users with rows leased to another claim.
+        Returns (claim id, rows in acceptance order).
+        """
+        claim_id = uuid.uuid4().hex
+        now = time.time()
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'UPDATE queued_order SET claimed_by = ?, claimed_until = ? WHERE seq IN ('
+                '  SELECT seq FROM queued_order'
+                '  WHERE status = ? AND (claimed_until IS NULL OR claimed_until < ?)'
+                '  AND user_id NOT IN ('
+                '    SELECT user_id FROM queued_order WHERE status = ? AND claimed_until >= ?)'
+                '  ORDER BY seq LIMIT ?)',
+                (claim_id, now + lease, PENDING, now, PENDING, now, limit),
+            )
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        rows = connection.execute(
+            f'SELECT {COLUMNS} FROM queued_order WHERE claimed_by = ? ORDER BY seq', (claim_id,)
+        ).fetchall()
+        return claim_id, rows
+
+    def release(self, claim_id):
+        """Give up a claim's lease on the rows still pending."""
+        self.connection.execute(
+            'UPDATE queued_order SET claimed_by = NULL, claimed_until = NULL WHERE claimed_by = ?',
+            (claim_id,),
+        )
+
+    def pending_deltas(self, user_id):
+        """Return {stock_id: quantity change} of a user's unpersisted orders."""
+        rows = self.connection.execute(
+            "SELECT stock_id, SUM(CASE order_type WHEN 'buy' THEN quantity ELSE -quantity END) "
+            'FROM queued_order WHERE user_id = ? AND status = ? GROUP BY stock_id',
+            (user_id, PENDING),
+        )
+        return dict(rows.fetchall())
+
+    def mark(self, results):
+        """
+        Record (ticket, status, order_id, error) outcomes in one transaction,
+        releasing the rows' lease.
+        """
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                'UPDATE queued_order SET status = ?, order_id = ?, error = ?, '
+                'claimed_by = NULL, claimed_until = NULL WHERE ticket = ?',
+                [(status, order_id, error, ticket) for ticket, status, order_id, error in results],
+            )
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def purge(self, before):
+        """Delete finished rows accepted before the given timestamp."""
+        cursor = self.connection.execute(
+            'DELETE FROM queued_order WHERE status != ? AND accepted_at < ?',
+            (PENDING, before),
+        )
+        return cursor.rowcount
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """Return the queue configured by ORDER_QUEUE_PATH."""
+    global _queue
+    with _queue_lock:
+        if _queue is None or _queue.path != str(settings.ORDER_QUEUE_PATH):
+            _queue = OrderQueue(settings.ORDER_QUEUE_PATH)
+        return _queue
+
+
+def _load_positions(user_id):
+    """Persisted positions plus orders still waiting in the queue."""
+    current = positions.user_positions(user_id)
+    for stock_id, delta in get_queue().pending_deltas(user_id).items():
+        current[stock_id] = current.get(stock_id, 0) + delta
+    return current
+
+
+# Positions including the orders this process has queued, checked by accept().
+queued_positions = positions.PositionCache('order_queue')
+
+
+def accept(user, validated_data):
+    """Validate an order against cached positions and queue it."""
+    stock = validated_data['stock']
+    order_type = validated_data['order_type']
+    quantity = validated_data['quantity']
+
+    if order_type == 'sell':
+        held = queued_positions.get(user.id, loader=_load_positions)
+        check_holdings(quantity, held.get(stock.id, 0))
+    # Counters only include persisted orders, so limits are checked again
+    # when the order is drained, against the batch it is persisted with.
+    risk.check_order(user.id, stock, order_type, quantity)
+
+    ticket = get_queue().enqueue(user.id, stock.id, order_type, quantity)
+    queued_positions.apply(
+        user.id, stock.id, positions.signed_quantity(order_type, quantity))
+    return ticket
+
+
+def drain(batch_size=None):
+    """
+    Persist one batch of pending orders and return the number processed.
+
+    Sells and risk limits are checked again against the database because
+    the accepting process saw neither other processes' orders nor the
+    queued orders in its checks; orders that oversell or break a limit are
+    marked rejected rather than persisted.
+    """
+    queue = get_queue()
+    claim_id, rows = queue.claim(
+        batch_size or settings.ORDER_QUEUE_BATCH_SIZE, settings.ORDER_QUEUE_LEASE)
+    if not rows:
+        return 0
+    try:
+        _persist(queue, rows)
+    except Exception:
+        queue.release(claim_id)
+        raise
+    return len(rows)
+
+
+def _persist(queue, rows):
+    """Write a claimed batch to the database and mark its rows."""
+    tickets = [row['ticket'] for row in rows]
+    # Orders committed by a run that crashed before marking its rows.
+    persisted = dict(
+        Order.objects.filter(source_ref__in=tickets).values_list('source_ref', 'id')
+    )
+    results = [(ticket, DONE, order_id, None) for ticket, order_id in persisted.items()]
+
+    stocks = Stock.objects.in_bulk({row['stock_id'] for row in rows})
+    with transaction.atomic():
+        # Counters stay locked until the batch is saved.
+        limits = risk.BatchCheck(for_update=True)
+        held = {}
+        orders = []
+        for row in rows:
+            if row['ticket'] in persisted:
+                continue
+            if row['stock_id'] not in stocks:
+                results.append((
+                    row['ticket'], REJECTED, None, f"Stock with ID {row['stock_id']} does not exist.",
+                ))
+                continue
+            key = (row['user_id'], row['stock_id'])
+            if key not in held:
+                held[key] = positions.net_quantity(*key)
+            if row['order_type'] == 'sell' and row['quantity'] > held[key]:
+                results.append((
+                    row['ticket'], REJECTED, None,
+                    f"You cannot sell more than your current holdings. Available quantity: {held[key]}",
+                ))
+                continue
+            try:
+                limits.check(row['user_id'], stocks[row['stock_id']], row['order_type'], row['quantity'])
+            except ValidationError as e:
+                results.append((row['ticket'], REJECTED, None, str(e.detail[0])))
+                continue
+            held[key] += positions.signed_quantity(row['order_type'], row['quantity'])
+            orders.append(Order(
+                user_id=row['user_id'],
+                stock_id=row['stock_id'],
+                order_type=row['order_type'],
+                quantity=row['quantity'],
+                source_ref=row['ticket'],
+            ))
+
+        created = Order.objects.bulk_create(orders)
+        holdings.apply_orders(created)
+        risk.record_orders(created)
+        outbox.record_orders(created)
+        if journal.enabled():
+            transaction.on_commit(partial(journal.append, created))
+
+    results.extend((order.source_ref, DONE, order.id, None) for order in created)
+    queue.mark(results)
+
+    # bulk_create bypasses post_save, so invalidate versions by hand.
+    for user_id in {row['user_id'] for row in rows}:
+        caching.bump_positions(user_id)
+        positions.invalidate(user_id)
+        pin_to_primary(user_pin(user_id))
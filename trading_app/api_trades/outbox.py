@@ -0,0 +1,189 @@
+"""
+Transactional outbox of order and stock changes for downstream systems.
+
+Events are inserted into OutboxEvent in the same transaction as the change
+they describe, so an event exists exactly when its change was committed.
+Ids are handed out at insert time and can commit out of order, so
+consumers never page by id: sequence() numbers committed events in id
+order while holding the sequencer cursor's row lock, which makes seq grow
+in the order events become visible. A consumer that has read up to seq N
+has seen every event numbered N or below.
+
+/api/trades/events/?after=N serves numbered events, long-polling when
+there are none yet, and `python manage.py relay_outbox <sink>` pushes them
+to a sink from OUTBOX_SINKS, keeping a cursor per sink. Delivery is at
+least once, so consumers should skip sequence numbers they have seen.
+"""
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from api_trades.models import OutboxCursor, OutboxEvent
+
+SEQUENCER = 'sequencer'
+
+
+def order_event(order):
+    """Return the event recording a new order."""
+    return OutboxEvent(topic='order.created', key=str(order.id), payload={
+        'id': order.id,
+        'user_id': order.user_id,
+        'stock_id': order.stock_id,
+        'order_type': order.order_type,
+        'quantity': int(order.quantity),
+        'date_time_placed': order.date_time_placed.isoformat(),
+    })
+
+
+def stock_event(stock, topic):
+    """Return the event recording a stock being created, updated or deleted."""
+    return OutboxEvent(topic=topic, key=str(stock.id), payload={
+        'id': stock.id,
+        'name': stock.name,
+        'price': str(stock.price),
+        'currency': stock.currency,
+        'lot_size': stock.lot_size,
+    })
+
+
+def record(events):
+    """Write events in the current transaction."""
+    OutboxEvent.objects.bulk_create(events)
+
+
+def record_orders(orders):
+    """Write an order.created event for each order."""
+    record([order_event(order) for order in orders])
+
+
+def sequence(batch_size=1000):
+    """
+    Number up to batch_size committed events that have no seq yet. Returns
+    the number sequenced; 0 when another process is already sequencing.
+    Only a read through outbox_unsequenced_idx is made when there is
+    nothing to number, so feed readers polling an idle outbox never take
+    the write lock.
+    """
+    if not OutboxEvent.objects.filter(seq__isnull=True).exists():
+        return 0
+    with transaction.atomic():
+        cursor = OutboxCursor.objects.select_for_update(skip_locked=True).filter(
+            name=SEQUENCER).first()
+        if cursor is None:
+            cursor, created = OutboxCursor.objects.get_or_create(name=SEQUENCER)
+            if not created:
+                return 0
+
+        events = list(
+            OutboxEvent.objects.filter(seq__isnull=True).order_by('id').only('id')[:batch_size])
+        if not events:
+            return 0
+        for seq, event in enumerate(events, cursor.position + 1):
+            event.seq = seq
+        OutboxEvent.objects.bulk_update(events, ['seq'])
+        cursor.position = events[-1].seq
+        cursor.save(update_fields=['position', 'updated_at'])
+    return len(events)
+
+
+def events_after(after, limit=100):
+    """Return up to limit events numbered after the given seq."""
+    sequence()
+    return list(OutboxEvent.objects.filter(seq__gt=after).order_by('seq')[:limit])
+
+
+def wait_for_events(after, limit=100, timeout=0):
+    """
+    Return events numbered after the given seq, waiting up to timeout
+    seconds (capped at OUTBOX_LONG_POLL_SECONDS) for one to be committed.
+    """
+    deadline = time.monotonic() + min(timeout, settings.OUTBOX_LONG_POLL_SECONDS)
+    while True:
+        events = events_after(after, limit)
+        if events or time.monotonic() >= deadline:
+            return events
+        time.sleep(min(settings.OUTBOX_POLL_SECONDS, max(0, deadline - time.monotonic())))
+
+
+def serialize(event):
+    """Return the published form of an event."""
+    return {
+        'seq': event.seq,
+        'topic': event.topic,
+        'key': event.key,
+        'payload': event.payload,
+        'created_at': event.created_at,
+    }
+
+
+class FileSink:
+    """Append events to a file as NDJSON, flushing each batch to disk."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def publish(self, events):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        lines = ''.join(json.dumps(event, cls=DjangoJSONEncoder) + '\n' for event in events)
+        with open(self.path, 'a', encoding='utf-8') as sink_file:
+            sink_file.write(lines)
+            sink_file.flush()
+            os.fsync(sink_file.fileno())
+
+
+class BrokerSink:
+    """
+    Local stand-in for a message broker. Each batch becomes one message
+    file per topic in directory/<topic>/, named by its first seq. Messages
+    are written under a temporary name and renamed into place, so a
+    consumer reading the directory never sees a partial message.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def publish(self, events):
+        topics = {}
+        for event in events:
+            topics.setdefault(event['topic'], []).append(event)
+        for topic, messages in topics.items():
+            queue = self.directory / topic
+            queue.mkdir(parents=True, exist_ok=True)
+            name = f'{messages[0]["seq"]:020d}.json'
+            temporary = queue / f'.{name}.{uuid.uuid4().hex}'
+            temporary.write_text(json.dumps(messages, cls=DjangoJSONEncoder), encoding='utf-8')
+            os.replace(temporary, queue / name)
+
+
+def get_sink(name):
+    """Return the sink configured as name in OUTBOX_SINKS."""
+    config = settings.OUTBOX_SINKS[name]
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+
+
+def relay(name, sink=None, batch_size=500):
+    """
+    Publish the next batch_size events the sink called name has not had.
+    The sink's cursor stays locked while publishing so two relays for the
+    same sink never publish the same batch. Returns the number published.
+    """
+    sink = sink or get_sink(name)
+    sequence()
+    with transaction.atomic():
+        OutboxCursor.objects.get_or_create(name=f'sink:{name}')
+        cursor = OutboxCursor.objects.select_for_update().get(name=f'sink:{name}')
+        events = list(
+            OutboxEvent.objects.filter(seq__gt=cursor.position).order_by('seq')[:batch_size])
+        if not events:
+            return 0
+        sink.publish([serialize(event) for event in events])
+        cursor.position = events[-1].seq
+        cursor.save(update_fields=['position', 'updated_at'])
+    return len(events)
@@ -0,0 +1,8 @@
+"""Pagination classes for api_trades views"""
+from rest_framework.pagination import LimitOffsetPagination
+
+
+class ArchivedOrderPagination(LimitOffsetPagination):
+    """?limit= and ?offset= over a user's archived orders."""
+    default_limit = 100
+    max_limit = 1000
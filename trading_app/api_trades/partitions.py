@@ -0,0 +1,205 @@
+"""
+PostgreSQL range partitioning of the Order table by month of
+date_time_placed.
+
+The table keeps its name, so the ORM, OrdersViewSet, PortfolioView and the
+bulk order command are unaware of it; queries that filter on
+date_time_placed only scan the matching partitions. Each month lives in
+api_trades_order_pYYYY_MM and a default partition catches anything outside
+the created range. The primary key becomes (id, date_time_placed) because
+PostgreSQL requires the partition key in every unique constraint, so no
+other unique constraints can be added to Order.
+
+Old partitions are only detached once they are empty: manage_order_partitions
+archives their orders into PositionRollup first (archive.py), so positions,
+holdings and sell checks keep counting them.
+
+On other databases every function here is a no-op.
+"""
+import re
+from datetime import date, datetime, timezone
+
+TABLE = 'api_trades_order'
+DEFAULT_PARTITION = f'{TABLE}_default'
+SEQUENCE = f'{TABLE}_id_seq'
+
+PARTITION_RE = re.compile(rf'^{TABLE}_p(\d{{4}})_(\d{{2}})$')
+
+
+def month_start(value):
+    """Return the first day of value's month."""
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, months):
+    """Return the first day of the month months after month."""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    """Return the table name of a month's partition."""
+    return f'{TABLE}_p{month:%Y_%m}'
+
+
+def partition_month(name):
+    """Return the month a partition holds, or None for other tables."""
+    match = PARTITION_RE.match(name)
+    return date(int(match[1]), int(match[2]), 1) if match else None
+
+
+def month_bound(month):
+    """Return the instant month starts at, in UTC."""
+    return datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+
+
+def is_partitioned(connection):
+    """Return True if the Order table is a partitioned PostgreSQL table."""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', [TABLE])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def monthly_partitions(connection):
+    """Return {month: table name} of the attached monthly partitions."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+            'WHERE pg_inherits.inhparent = to_regclass(%s)',
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    return {partition_month(name): name for name in names if partition_month(name)}
+
+
+def create_partition(connection, month):
+    """
+    Create the partition for month. Rows already sitting in the default
+    partition for that month are moved into it, since PostgreSQL refuses
+    to add a partition that overlaps rows in the default.
+    """
+    name = partition_name(month)
+    lower, upper = month_bound(month), month_bound(add_months(month, 1))
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s)', [name])
+        if cursor.fetchone()[0] is not None:
+            return False
+
+        cursor.execute(
+            f'SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} '
+            'WHERE date_time_placed >= %s AND date_time_placed < %s)',
+            [lower, upper],
+        )
+        stranded = cursor.fetchone()[0]
+        if stranded:
+            cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}')
+
+        cursor.execute(
+            f'CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)',
+            [lower, upper],
+        )
+
+        if stranded:
+            cursor.execute(
+                f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} '
+                'WHERE date_time_placed >= %s AND date_time_placed < %s RETURNING *) '
+                f'INSERT INTO {TABLE} SELECT * FROM moved',
+                [lower, upper],
+            )
+            cursor.execute(f'ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT')
+    return True
+
+
+class PartitionNotEmpty(Exception):
+    """A partition still holds orders, which detaching it would lose."""
+
+
+def detach_partition(connection, name, drop=False):
+    """
+    Detach an empty partition, leaving it as a standalone table unless drop
+    is set. Raises PartitionNotEmpty if it still holds orders: those must
+    be archived first so positions keep counting them.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {name})')
+        if cursor.fetchone()[0]:
+            raise PartitionNotEmpty(name)
+        cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+        if drop:
+            cursor.execute(f'DROP TABLE {name}')
+
+
+def partition_order_table(schema_editor, model, months_ahead=3):
+    """
+    Rebuild the Order table as a table partitioned by month, copying the
+    existing rows. Used by migration 0004.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql' or is_partitioned(connection):
+        return
+
+    legacy = f'{TABLE}_legacy'
+    sequence = f'{TABLE}_partitioned_id_seq'
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {legacy}')
+        cursor.execute(
+            f'CREATE TABLE {TABLE} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING CONSTRAINTS, '
+            'PRIMARY KEY (id, date_time_placed)) PARTITION BY RANGE (date_time_placed)'
+        )
+        # Identity columns are not supported on partitioned tables before
+        # PostgreSQL 17, so ids come from an owned sequence instead.
+        cursor.execute(f'CREATE SEQUENCE {sequence} OWNED BY {TABLE}.id')
+        cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+        cursor.execute(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT')
+
+        cursor.execute(f'SELECT min(date_time_placed) FROM {legacy}')
+        now = datetime.now(timezone.utc)
+        month = month_start(cursor.fetchone()[0] or now)
+        last = add_months(month_start(now), months_ahead)
+        while month <= last:
+            create_partition(connection, month)
+            month = add_months(month, 1)
+
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {legacy}')
+        cursor.execute(
+            f"SELECT setval('{sequence}', COALESCE((SELECT max(id) FROM {legacy}), 0) + 1, false)")
+        cursor.execute(f'DROP TABLE {legacy}')
+        cursor.execute(f'ALTER SEQUENCE {sequence} RENAME TO {SEQUENCE}')
+
+    # Recreate the indexes and foreign keys that were dropped with the
+    # legacy table; indexes on the parent cascade to every partition.
+    for statement in schema_editor._model_indexes_sql(model):
+        schema_editor.execute(statement)
+    for field in model._meta.local_fields:
+        if field.remote_field and field.db_constraint:
+            schema_editor.execute(
+                schema_editor._create_fk_sql(model, field, '_fk_%(to_table)s_%(to_column)s'))
+
+
+def unpartition_order_table(schema_editor, model):
+    """Rebuild the Order table as a plain table. Reverses migration 0004."""
+    connection = schema_editor.connection
+    if not is_partitioned(connection):
+        return
+
+    legacy = f'{TABLE}_legacy'
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {legacy}')
+        cursor.execute(
+            f'CREATE TABLE {TABLE} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING CONSTRAINTS, '
+            'PRIMARY KEY (id))'
+        )
+        cursor.execute(f'ALTER SEQUENCE {SEQUENCE} OWNED BY {TABLE}.id')
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {legacy}')
+        cursor.execute(f'DROP TABLE {legacy} CASCADE')
+
+    for statement in schema_editor._model_indexes_sql(model):
+        schema_editor.execute(statement)
+    for field in model._meta.local_fields:
+        if field.remote_field and field.db_constraint:
+            schema_editor.execute(
+                schema_editor._create_fk_sql(model, field, '_fk_%(to_table)s_%(to_column)s'))
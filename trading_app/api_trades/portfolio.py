@@ -0,0 +1,221 @@
+"""
+The portfolio query.
+
+A user's positions are their orders plus the PositionRollup of their
+archived orders, grouped by stock and joined with Stock in one statement.
+Filtering by stock, sorting and the limit all happen in the database.
+Window functions add totals over every matching position to each row
+before the limit is applied: the number of positions and the value held
+in each currency. The first position in each currency is returned even
+when it falls outside the limit, so every currency's total is available.
+
+PortfolioView keeps its responses in portfolio_cache, so repeating a
+query skips the statement until the user's positions, prices or rates
+change.
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connections, router
+
+from api_trades import positions
+from api_trades.models import Order, PositionRollup, Stock
+
+# Values in different currencies are compared after conversion to
+# FX_REFERENCE_CURRENCY, as floats since the order is all that matters.
+REFERENCE_VALUE = (
+    'CAST(p.quantity AS DOUBLE PRECISION) * s.price_minor * CASE s.currency {rates} END'
+)
+
+SORTS = {
+    'name': 's.name',
+    'quantity': 'p.quantity',
+    'value': REFERENCE_VALUE,
+}
+
+
+def _sort(order_by, rates):
+    """Return the ORDER BY clause and its parameters for order_by."""
+    field = order_by.lstrip('-')
+    direction = ' DESC' if order_by.startswith('-') else ''
+    expression, params = SORTS[field], []
+    if field == 'value':
+        expression = expression.format(rates=' '.join(['WHEN %s THEN %s'] * len(rates)))
+        for currency, rate in rates.items():
+            params += [currency, rate]
+        # Currencies without a rate sort last.
+        return f'({expression}) IS NULL, {expression}{direction}, s.id', params * 2
+    return f'{expression}{direction}, s.id', params
+
+
+def portfolio(user_id, stock_ids=None, order_by='name', limit=None, rates=None):
+    """
+    Return (holdings, positions, totals) for the user's positions in
+    stock_ids (or every stock) with a positive quantity. holdings lists up
+    to limit of them in order_by order as dicts of stock_id, stock_name,
+    currency, quantity and value_minor; positions counts all of them and
+    totals maps each currency to the value of all of them held in it.
+    Sorting by value needs the scaled_rates().
+    """
+    # Reads from a replica when the router allows it, like the ORM would.
+    connection = connections[router.db_for_read(Order)]
+    quote = connection.ops.quote_name
+    stock_filter, stock_params = '', []
+    if stock_ids is not None:
+        stock_filter = f' AND stock_id IN ({", ".join(["%s"] * len(stock_ids))})'
+        stock_params = list(stock_ids)
+    sort, sort_params = _sort(order_by, rates or {})
+
+    sql = f'''
+        WITH p AS (
+            SELECT stock_id, SUM(quantity) AS quantity FROM (
+                SELECT stock_id, CASE WHEN order_type = %s THEN quantity ELSE -quantity END
+                    AS quantity
+                FROM {quote(Order._meta.db_table)} WHERE user_id = %s{stock_filter}
+                UNION ALL
+                SELECT stock_id, buy_quantity - sell_quantity
+                FROM {quote(PositionRollup._meta.db_table)} WHERE user_id = %s{stock_filter}
+            ) AS net
+            GROUP BY stock_id
+        ), ranked AS (
+            SELECT
+                s.id, s.name, s.currency, p.quantity, p.quantity * s.price_minor AS value_minor,
+                ROW_NUMBER() OVER (ORDER BY {sort}) AS position_rank,
+                ROW_NUMBER() OVER (PARTITION BY s.currency ORDER BY {sort}) AS currency_rank,
+                COUNT(*) OVER () AS positions,
+                SUM(p.quantity * s.price_minor) OVER (PARTITION BY s.currency) AS currency_total
+            FROM p JOIN {quote(Stock._meta.db_table)} s ON s.id = p.stock_id
+            WHERE p.quantity > 0
+        )
+        SELECT id, name, currency, quantity, value_minor, position_rank, positions, currency_total
+        FROM ranked
+        {'WHERE position_rank <= %s OR currency_rank = 1' if limit is not None else ''}
+        ORDER BY position_rank
+    '''
+    params = ['buy', user_id, *stock_params, user_id, *stock_params, *sort_params, *sort_params]
+    if limit is not None:
+        params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    holdings, count, totals = [], 0, {}
+    for stock_id, name, currency, quantity, value_minor, rank, count, total in rows:
+        totals[currency] = int(total)
+        if limit is None or rank <= limit:
+            holdings.append({
+                'stock_id': stock_id,
+                'stock_name': name,
+                'currency': currency,
+                'quantity': int(quantity),
+                'value_minor': int(value_minor),
+            })
+    return holdings, count, totals
+
+
+def _size(value):
+    """Approximate memory used by a response, counting nested containers."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_size(key) + _size(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_size(item) for item in value)
+    return size
+
+
+class PortfolioCache:
+    """
+    Per-process LRU of portfolio responses, keyed by user and normalized
+    query (caching.portfolio_query) and stored with the version of the
+    positions, prices and rates they were valued from, so a user's
+    different queries are cached side by side. Entries hold at most
+    PORTFOLIO_CACHE_MAX_ENTRIES responses and are dropped after
+    PORTFOLIO_CACHE_TTL seconds, at another version, or when this process
+    invalidates the user's positions.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every invalidation, so a load that raced one is not stored.
+        self._generation = 0
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+        positions.caches[name] = self
+
+    def get(self, user_id, query, loader, version):
+        """
+        Return the cached response for a user's query, calling loader() if
+        it is missing, stale or cached at another version. Callers must not
+        modify it.
+        """
+        key = (user_id, query)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, entry_version, data, _ = entry
+                if expires > now and entry_version == version:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return data
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            generation = self._generation
+
+        data = loader()
+        size = _size(data)
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (now + settings.PORTFOLIO_CACHE_TTL, version, data, size)
+                self._entries.move_to_end(key)
+                while len(self._entries) > settings.PORTFOLIO_CACHE_MAX_ENTRIES:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return data
+
+    def invalidate(self, user_id=None):
+        """Forget one user's responses, or everybody's."""
+        with self._lock:
+            self._generation += 1
+            stale = [key for key in self._entries if user_id is None or key[0] == user_id]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def invalidate_stock(self, stock_id):
+        """
+        Forget every response. Totals count positions a response does not
+        list, so any of them may include the stock.
+        """
+        self.invalidate()
+
+    def stats(self):
+        """Return the cache's size, counters and approximate memory use in bytes."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            memory = sys.getsizeof(self._entries) + sum(
+                _size(key) + sys.getsizeof(entry) + entry[3]
+                for key, entry in self._entries.items()
+            )
+            return {
+                'name': self.name,
+                'entries': len(self._entries),
+                'max_entries': settings.PORTFOLIO_CACHE_MAX_ENTRIES,
+                'ttl': settings.PORTFOLIO_CACHE_TTL,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'memory_bytes': memory,
+            }
+
+
+# Portfolio responses served by PortfolioView.
+portfolio_cache = PortfolioCache('portfolio')
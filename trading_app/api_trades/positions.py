@@ -0,0 +1,198 @@
+"""
+Position math shared by the order endpoints, the order queue and the
+bulk order command.
+
+A position is the PositionRollup of the user's archived orders (if any)
+plus the orders still in the Order table.
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import F, Q, Sum
+
+from api_trades.models import Order, PositionRollup
+
+NET_QUANTITY = (
+    Sum('quantity', filter=Q(order_type='buy'), default=0)
+    - Sum('quantity', filter=Q(order_type='sell'), default=0)
+)
+
+
+ROLLUP_NET_QUANTITY = F('buy_quantity') - F('sell_quantity')
+
+
+def net_quantity(user_id, stock_id):
+    """Return the user's current holding of a stock."""
+    live = Order.objects.filter(
+        user_id=user_id, stock_id=stock_id
+    ).aggregate(net_quantity=NET_QUANTITY)['net_quantity']
+    archived = PositionRollup.objects.filter(
+        user_id=user_id, stock_id=stock_id
+    ).values_list(ROLLUP_NET_QUANTITY, flat=True).first()
+    return live + (archived or 0)
+
+
+def user_positions(user_id):
+    """Return {stock_id: net quantity} for every stock the user has traded."""
+    rows = Order.objects.filter(user_id=user_id).values('stock_id').annotate(
+        net_quantity=NET_QUANTITY
+    ).order_by()
+    held = {row['stock_id']: row['net_quantity'] for row in rows}
+
+    rollups = PositionRollup.objects.filter(user_id=user_id).values_list(
+        'stock_id', ROLLUP_NET_QUANTITY)
+    for stock_id, quantity in rollups:
+        held[stock_id] = held.get(stock_id, 0) + quantity
+    return held
+
+
+def all_positions():
+    """Return {(user_id, stock_id): net quantity} across every user."""
+    rows = Order.objects.values('user_id', 'stock_id').annotate(
+        net_quantity=NET_QUANTITY
+    ).order_by()
+    held = {(row['user_id'], row['stock_id']): row['net_quantity'] for row in rows}
+
+    rollups = PositionRollup.objects.values_list('user_id', 'stock_id', ROLLUP_NET_QUANTITY)
+    for user_id, stock_id, quantity in rollups:
+        held[user_id, stock_id] = held.get((user_id, stock_id), 0) + quantity
+    return held
+
+
+def signed_quantity(order_type, quantity):
+    """Return the change an order makes to a position."""
+    return quantity if order_type == 'buy' else -quantity
+
+
+# Every cache of positions in this process, by name: the PositionCaches and
+# portfolio.PortfolioCache.
+caches = {}
+
+
+class PositionCache:
+    """
+    Per-process LRU of users' positions.
+
+    Entries are loaded from the database on first use and hold at most
+    POSITION_CACHE_MAX_ENTRIES users, evicting the least recently used.
+    They are dropped after POSITION_CACHE_TTL seconds, when a caller passes
+    a different version (see caching.positions_key), or when this process
+    invalidates them, so changes made by other processes are picked up.
+    """
+
+    def __init__(self, name, ttl=None, max_entries=None):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every invalidation, so a load that raced one is not stored.
+        self._generation = 0
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+        caches[name] = self
+
+    def _ttl(self):
+        return self.ttl if self.ttl is not None else settings.POSITION_CACHE_TTL
+
+    def _max_entries(self):
+        if self.max_entries is not None:
+            return self.max_entries
+        return settings.POSITION_CACHE_MAX_ENTRIES
+
+    def get(self, user_id, loader=user_positions, version=None):
+        """
+        Return the cached positions for a user, loading them if missing,
+        stale or cached at another version. Callers must not modify them.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                expires, entry_version, positions = entry
+                if expires > now and entry_version == version:
+                    self._entries.move_to_end(user_id)
+                    self.hits += 1
+                    return positions
+                del self._entries[user_id]
+                self.expirations += 1
+            self.misses += 1
+            generation = self._generation
+
+        positions = loader(user_id)
+        with self._lock:
+            if generation == self._generation:
+                self._entries[user_id] = (now + self._ttl(), version, positions)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self._max_entries():
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return positions
+
+    def apply(self, user_id, stock_id, delta):
+        """Adjust a cached position after accepting an order."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                positions = entry[2]
+                positions[stock_id] = positions.get(stock_id, 0) + delta
+
+    def invalidate(self, user_id=None):
+        """Forget one user's positions, or everybody's."""
+        with self._lock:
+            self._generation += 1
+            if user_id is None:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+            elif self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def invalidate_stock(self, stock_id):
+        """Forget the positions of every cached user holding a stock."""
+        with self._lock:
+            self._generation += 1
+            stale = [user_id for user_id, entry in self._entries.items() if stock_id in entry[2]]
+            for user_id in stale:
+                del self._entries[user_id]
+            self.invalidations += len(stale)
+
+    def stats(self):
+        """Return the cache's size, counters and approximate memory use in bytes."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            memory = sys.getsizeof(self._entries) + sum(
+                sys.getsizeof(user_id) + sys.getsizeof(entry) + sys.getsizeof(entry[2])
+                + sum(sys.getsizeof(stock_id) + sys.getsizeof(quantity)
+                      for stock_id, quantity in entry[2].items())
+                for user_id, entry in self._entries.items()
+            )
+            return {
+                'name': self.name,
+                'entries': len(self._entries),
+                'max_entries': self._max_entries(),
+                'ttl': self._ttl(),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'memory_bytes': memory,
+            }
+
+
+def invalidate(user_id=None):
+    """Forget one user's positions, or everybody's, in every cache."""
+    for cache in caches.values():
+        cache.invalidate(user_id)
+
+
+def invalidate_stock(stock_id):
+    """Forget the positions of every user holding a stock, in every cache."""
+    for cache in caches.values():
+        cache.invalidate_stock(stock_id)
+
+# Persisted positions, served by the total value invested endpoint.
+position_cache = PositionCache('positions')
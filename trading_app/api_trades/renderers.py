@@ -0,0 +1,94 @@
+"""
+Optional binary renderers and parsers for the order, stock and portfolio
+endpoints. MessagePack needs the msgpack package and CBOR needs cbor2;
+formats whose package is missing are simply not offered.
+"""
+import datetime
+import decimal
+import uuid
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # pragma: no cover - optional dependency
+    cbor2 = None
+
+
+def _msgpack_default(value):
+    """Encode the types DRF's JSON encoder would turn into strings."""
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f'Cannot serialize {type(value).__name__} to MessagePack')
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Renderer which serializes to MessagePack."""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_msgpack_default, use_bin_type=True)
+
+
+class MessagePackParser(BaseParser):
+    """Parses MessagePack request bodies."""
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
+
+
+class CBORRenderer(BaseRenderer):
+    """Renderer which serializes to CBOR. Decimals keep their exact value."""
+    media_type = 'application/cbor'
+    format = 'cbor'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return cbor2.dumps(data)
+
+
+class CBORParser(BaseParser):
+    """Parses CBOR request bodies."""
+    media_type = 'application/cbor'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return cbor2.loads(stream.read())
+        except (ValueError, cbor2.CBORDecodeError) as exc:
+            raise ParseError(f'CBOR parse error - {exc}')
+
+
+BINARY_RENDERER_CLASSES = [
+    renderer for renderer, module in ((MessagePackRenderer, msgpack), (CBORRenderer, cbor2))
+    if module is not None
+]
+
+BINARY_PARSER_CLASSES = [
+    parser for parser, module in ((MessagePackParser, msgpack), (CBORParser, cbor2))
+    if module is not None
+]
+
+RENDERER_CLASSES = list(api_settings.DEFAULT_RENDERER_CLASSES) + BINARY_RENDERER_CLASSES
+PARSER_CLASSES = list(api_settings.DEFAULT_PARSER_CLASSES) + BINARY_PARSER_CLASSES
@@ -0,0 +1,240 @@
+"""
+Pre-trade risk limits, checked without aggregating order history.
+
+An order is checked against RISK_DEFAULT_LIMITS and every RiskLimit row
+matching its user and stock, the strictest value of each limit winning:
+
+- max_position against the user's Holding of the stock (holdings.py),
+- max_order_notional against quantity * price_minor, converted to
+  FX_REFERENCE_CURRENCY,
+- max_daily_volume against the user's RiskCounter rows for today.
+
+Each is an index lookup, so a check costs the same however many orders
+there are. Counters are incremented as orders are saved (post_save, or
+record_orders after bulk_create) and are keyed by UTC day, so yesterday's
+volume stops counting at midnight; the reset_risk_counters job deletes
+the old rows. Orders saved in batches (the order queue and bulk imports)
+are checked with a BatchCheck, which adds the batch's earlier orders to
+what the database holds.
+"""
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from api_trades import valuation
+from api_trades.models import MINOR_UNITS_PER_UNIT, Holding, RiskCounter, RiskLimit
+
+LIMIT_FIELDS = ('max_position', 'max_order_notional', 'max_daily_volume')
+
+
+def today():
+    """Return the UTC day counters are kept for."""
+    return timezone.now().date()
+
+
+def _strictest(current, value):
+    if value is None:
+        return current
+    return value if current is None or value < current else current
+
+
+def limits_for(user_id, stock_id):
+    """
+    Return the strictest limits applying to the user's orders in a stock.
+    Daily volume limits set for a stock are returned as
+    'max_daily_stock_volume'; the others cap the user's total.
+    """
+    limits = dict.fromkeys(LIMIT_FIELDS + ('max_daily_stock_volume',))
+    for field in LIMIT_FIELDS:
+        limits[field] = settings.RISK_DEFAULT_LIMITS.get(field)
+
+    rows = RiskLimit.objects.filter(
+        Q(user_id=user_id) | Q(user__isnull=True),
+        Q(stock_id=stock_id) | Q(stock__isnull=True),
+    ).values_list('stock_id', *LIMIT_FIELDS)
+    for limit_stock_id, max_position, max_order_notional, max_daily_volume in rows:
+        limits['max_position'] = _strictest(limits['max_position'], max_position)
+        limits['max_order_notional'] = _strictest(limits['max_order_notional'], max_order_notional)
+        volume_field = 'max_daily_volume' if limit_stock_id is None else 'max_daily_stock_volume'
+        limits[volume_field] = _strictest(limits[volume_field], max_daily_volume)
+    return limits
+
+
+def traded_today(user_id, stock_id, for_update=False):
+    """Return (volume in the stock, total volume) the user has traded today."""
+    day = today()
+    counters = RiskCounter.objects.filter(
+        Q(stock_id=stock_id) | Q(stock__isnull=True), user_id=user_id, day=day)
+    if for_update:
+        counters = counters.select_for_update()
+    volumes = dict(counters.values_list('stock_id', 'volume'))
+    if for_update and len(volumes) < 2:
+        # The first order of the day creates the rows so there is something to lock.
+        RiskCounter.objects.bulk_create(
+            [RiskCounter(user_id=user_id, stock_id=stock_id, day=day),
+             RiskCounter(user_id=user_id, stock_id=None, day=day)],
+            ignore_conflicts=True,
+        )
+        volumes = dict(counters.values_list('stock_id', 'volume'))
+    return volumes.get(stock_id, 0), volumes.get(None, 0)
+
+
+def _check_notional(limits, stock, quantity):
+    if limits['max_order_notional'] is None:
+        return
+    reference = settings.FX_REFERENCE_CURRENCY
+    rates = valuation.scaled_rates() if stock.currency != reference else {}
+    try:
+        notional = valuation.convert(
+            quantity * stock.price_minor, stock.currency, reference, rates)
+    except valuation.MissingRate as e:
+        raise ValidationError(
+            f'No exchange rate for {e.args[0]} to check the order value against.')
+    limit = limits['max_order_notional']
+    if notional > limit * MINOR_UNITS_PER_UNIT:
+        raise ValidationError(
+            f'Order value {valuation.to_decimal(notional)} {reference} exceeds '
+            f'the limit of {limit} {reference}.')
+
+
+def _check_position(limits, held, quantity):
+    if held + quantity > limits['max_position']:
+        raise ValidationError(
+            f'Order would take your position to {held + quantity}, '
+            f'above the limit of {limits["max_position"]}.')
+
+
+def _checks_volume(limits):
+    return limits['max_daily_volume'] is not None or limits['max_daily_stock_volume'] is not None
+
+
+def _check_volume(limits, stock_volume, total_volume, quantity):
+    for traded, limit in ((stock_volume, limits['max_daily_stock_volume']),
+                          (total_volume, limits['max_daily_volume'])):
+        if limit is not None and traded + quantity > limit:
+            raise ValidationError(
+                f'Order would take your volume traded today to {traded + quantity}, '
+                f'above the limit of {limit}.')
+
+
+def held_quantity(user_id, stock_id):
+    """Return the user's Holding of a stock."""
+    return Holding.objects.filter(user_id=user_id, stock_id=stock_id).values_list(
+        'quantity', flat=True).first() or 0
+
+
+def check_order(user_id, stock, order_type, quantity, for_update=False):
+    """
+    Raise a ValidationError if the order breaks a limit. With for_update
+    the user's counters stay locked until the surrounding transaction
+    ends, so concurrent orders cannot both squeeze under a daily limit.
+    """
+    limits = limits_for(user_id, stock.id)
+    _check_notional(limits, stock, quantity)
+    if order_type == 'buy' and limits['max_position'] is not None:
+        _check_position(limits, held_quantity(user_id, stock.id), quantity)
+    if _checks_volume(limits):
+        _check_volume(limits, *traded_today(user_id, stock.id, for_update), quantity)
+
+
+class BatchCheck:
+    """
+    check_order for orders saved together with bulk_create, whose holdings
+    and counters are only updated once the whole batch is saved. Each
+    order is checked against the database plus the orders of the batch
+    that passed before it, so a batch cannot squeeze past a limit that the
+    same orders placed one at a time would break.
+    """
+
+    def __init__(self, for_update=False):
+        self.for_update = for_update
+        self._limits = {}
+        self._held = {}
+        self._traded = {}
+        self._added = defaultdict(int)
+        self._volume = defaultdict(int)
+
+    def check(self, user_id, stock, order_type, quantity):
+        """Raise a ValidationError if the order breaks a limit, else count it."""
+        key = (user_id, stock.id)
+        if key not in self._limits:
+            self._limits[key] = limits_for(*key)
+        limits = self._limits[key]
+
+        _check_notional(limits, stock, quantity)
+        if order_type == 'buy' and limits['max_position'] is not None:
+            if key not in self._held:
+                self._held[key] = held_quantity(*key)
+            _check_position(limits, self._held[key] + self._added[key], quantity)
+        if _checks_volume(limits):
+            if key not in self._traded:
+                self._traded[key] = traded_today(user_id, stock.id, self.for_update)
+            stock_volume, total_volume = self._traded[key]
+            # Batch orders in other stocks count towards the user's total.
+            _check_volume(limits, stock_volume + self._volume[key],
+                          total_volume + self._volume[user_id, None], quantity)
+
+        self._added[key] += quantity if order_type == 'buy' else -quantity
+        self._volume[key] += quantity
+        self._volume[user_id, None] += quantity
+
+
+def record_orders(orders):
+    """Add the orders' quantities to today's counters."""
+    day = today()
+    volumes = defaultdict(int)
+    for order in orders:
+        volumes[order.user_id, order.stock_id] += int(order.quantity)
+        volumes[order.user_id, None] += int(order.quantity)
+    if not volumes:
+        return
+
+    def add(keys):
+        return [
+            (user_id, stock_id) for user_id, stock_id in keys
+            if not RiskCounter.objects.filter(user_id=user_id, stock_id=stock_id, day=day).update(
+                volume=F('volume') + volumes[user_id, stock_id])
+        ]
+
+    with transaction.atomic():
+        missing = add(volumes)
+        if missing:
+            RiskCounter.objects.bulk_create(
+                [RiskCounter(user_id=user_id, stock_id=stock_id, day=day)
+                 for user_id, stock_id in missing],
+                ignore_conflicts=True,
+            )
+            add(missing)
+
+
+def placed_today(order):
+    """Return True if an order counts towards today's counters."""
+    placed = order.date_time_placed
+    return placed is not None and placed.astimezone(dt_timezone.utc).date() == today()
+
+
+def unrecord_orders(orders):
+    """Take deleted or changed orders placed today back off today's counters."""
+    day = today()
+    volumes = defaultdict(int)
+    for order in orders:
+        if placed_today(order):
+            volumes[order.user_id, order.stock_id] += int(order.quantity)
+            volumes[order.user_id, None] += int(order.quantity)
+    for (user_id, stock_id), volume in volumes.items():
+        RiskCounter.objects.filter(user_id=user_id, stock_id=stock_id, day=day).update(
+            volume=Greatest(F('volume') - volume, 0))
+
+
+def purge_counters(batch_size=1000):
+    """Delete up to batch_size counters from earlier days. Returns the number deleted."""
+    ids = list(
+        RiskCounter.objects.filter(day__lt=today()).values_list('id', flat=True)[:batch_size])
+    RiskCounter.objects.filter(id__in=ids).delete()
+    return len(ids)
@@ -0,0 +1,228 @@
+"""
+In-process scheduler for the background jobs in api_trades/jobs.py.
+
+Jobs enabled in SCHEDULER_JOBS each have a Job row. A worker claims a due
+job by taking its lease with a conditional UPDATE, so a job is only ever
+run by one worker at a time, and runs it chunk by chunk. Each chunk commits
+together with the job's checkpoint and renews the lease; if the worker dies
+the lease expires and the next worker resumes from the last checkpoint.
+
+A worker hands a job back (still due) after SCHEDULER_SLICE_SECONDS so a
+long import does not hold up the other jobs, and runs at most
+`concurrency` jobs at once. Every run is recorded in JobRun with its
+duration, chunk count, items processed and slowest chunk.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, transaction
+from django.db.models import Avg, Q
+from django.utils import timezone
+
+from trading_app import profiling
+
+from api_trades.jobs import JOBS
+from api_trades.models import Job, JobRun
+
+logger = logging.getLogger(__name__)
+
+# Job settings the scheduler uses itself rather than passing to the job.
+SCHEDULE_KEYS = ('at', 'interval', 'profile')
+
+
+class LeaseLost(Exception):
+    """Another worker took over the job while this one was running it."""
+
+
+def next_run(config, now):
+    """Return when a job configured with config next runs after now."""
+    if 'at' in config:
+        hour, minute = (int(part) for part in config['at'].split(':'))
+        candidate = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        return candidate if candidate > now else candidate + timedelta(days=1)
+    return now + timedelta(seconds=config.get('interval', 24 * 60 * 60))
+
+
+def job_options(config):
+    """Return the options passed to the job function."""
+    return {key: value for key, value in config.items() if key not in SCHEDULE_KEYS}
+
+
+def default_worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+class Scheduler:
+    """Claims due jobs and runs them."""
+
+    def __init__(self, jobs=None, worker=None):
+        self.jobs = settings.SCHEDULER_JOBS if jobs is None else jobs
+        self.worker = worker or default_worker_name()
+        unknown = set(self.jobs) - set(JOBS)
+        if unknown:
+            raise ImproperlyConfigured(f'Unknown jobs in SCHEDULER_JOBS: {", ".join(sorted(unknown))}')
+
+    def sync(self):
+        """Create the Job rows of newly configured jobs."""
+        now = timezone.now()
+        for name, config in self.jobs.items():
+            first_run = next_run(config, now) if 'at' in config else now
+            Job.objects.get_or_create(name=name, defaults={'next_run_at': first_run})
+
+    def claim(self, name=None):
+        """
+        Take the lease on a due job (or on job name, due or not) and return
+        it, or None if there is nothing to run.
+        """
+        now = timezone.now()
+        free = Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lte=now)
+        candidates = Job.objects.filter(free, name__in=self.jobs)
+        if name is None:
+            candidates = candidates.filter(next_run_at__lte=now)
+        else:
+            candidates = candidates.filter(name=name)
+
+        lease_until = now + timedelta(seconds=settings.SCHEDULER_LEASE_SECONDS)
+        for job in candidates.order_by('next_run_at'):
+            claimed = Job.objects.filter(free, pk=job.pk).update(
+                lease_owner=self.worker, lease_expires_at=lease_until)
+            if claimed:
+                job.refresh_from_db()
+                return job
+        return None
+
+    def _save_checkpoint(self, job):
+        lease_until = timezone.now() + timedelta(seconds=settings.SCHEDULER_LEASE_SECONDS)
+        saved = Job.objects.filter(pk=job.pk, lease_owner=self.worker).update(
+            checkpoint=job.checkpoint, lease_expires_at=lease_until)
+        if not saved:
+            raise LeaseLost(job.name)
+
+    def _release(self, job, next_run_at, checkpoint):
+        Job.objects.filter(pk=job.pk, lease_owner=self.worker).update(
+            lease_owner=None, lease_expires_at=None,
+            next_run_at=next_run_at, checkpoint=checkpoint,
+        )
+
+    def _current_run(self, job):
+        """Continue the job's unfinished run, or start a new one."""
+        run = job.runs.filter(status=JobRun.RUNNING).order_by('-pk').first()
+        if run is None:
+            return JobRun.objects.create(job=job, worker=self.worker)
+        run.worker = self.worker
+        return run
+
+    def run_job(self, job):
+        """
+        Run chunks of a claimed job until it finishes, fails or uses up
+        its slice. Returns the JobRun.
+        """
+        config = self.jobs[job.name]
+        func = JOBS[job.name]
+        options = job_options(config)
+        run = self._current_run(job)
+        started = time.monotonic()
+
+        profiled = profiling.profile(f'job-{job.name}') if config.get('profile') else nullcontext()
+        try:
+            with profiled:
+                while True:
+                    chunk_started = time.monotonic()
+                    with transaction.atomic():
+                        items, done = func(job.checkpoint, **options)
+                        self._save_checkpoint(job)
+                    chunk_seconds = time.monotonic() - chunk_started
+                    run.chunks += 1
+                    run.items += items
+                    run.slowest_chunk_seconds = max(run.slowest_chunk_seconds, chunk_seconds)
+
+                    now = timezone.now()
+                    if done:
+                        run.status = JobRun.SUCCEEDED
+                        run.finished_at = now
+                        self._release(job, next_run(config, now), {})
+                        break
+                    if time.monotonic() - started >= settings.SCHEDULER_SLICE_SECONDS:
+                        self._release(job, now, job.checkpoint)
+                        break
+        except LeaseLost:
+            logger.warning('Lost the lease on job %s', job.name)
+        except Exception:
+            logger.exception('Job %s failed', job.name)
+            job.refresh_from_db(fields=['checkpoint'])
+            run.status = JobRun.FAILED
+            run.finished_at = timezone.now()
+            run.error = traceback.format_exc()
+            retry_at = run.finished_at + timedelta(seconds=settings.SCHEDULER_RETRY_SECONDS)
+            self._release(job, retry_at, job.checkpoint)
+
+        run.duration_seconds += time.monotonic() - started
+        run.save()
+        return run
+
+    def run_pending(self, name=None):
+        """Run due jobs (or just job name) until none are left. Returns the runs."""
+        runs = []
+        while (job := self.claim(name)) is not None:
+            run = self.run_job(job)
+            runs.append(run)
+            if name is not None and run.status != JobRun.RUNNING:
+                break
+        return runs
+
+    def serve(self, concurrency=1, stop=None):
+        """Run due jobs in concurrency threads until stop is set."""
+        stop = stop or threading.Event()
+
+        def work():
+            try:
+                while not stop.is_set():
+                    if not self.run_pending():
+                        stop.wait(settings.SCHEDULER_POLL_SECONDS)
+            finally:
+                connections.close_all()
+
+        self.sync()
+        threads = [
+            threading.Thread(target=work, name=f'scheduler-{number}', daemon=True)
+            for number in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+
+def job_stats():
+    """Return per-job timing metrics from the finished runs."""
+    stats = []
+    for job in Job.objects.order_by('name'):
+        finished = job.runs.filter(status=JobRun.SUCCEEDED)
+        last = job.runs.order_by('-pk').first()
+        stats.append({
+            'name': job.name,
+            'next_run_at': job.next_run_at,
+            'running': job.lease_owner,
+            'runs': finished.count(),
+            'failures': job.runs.filter(status=JobRun.FAILED).count(),
+            'average_seconds': finished.aggregate(value=Avg('duration_seconds'))['value'],
+            'last_status': last.status if last else None,
+            'last_seconds': last.duration_seconds if last else None,
+            'last_items': last.items if last else None,
+        })
+    return stats
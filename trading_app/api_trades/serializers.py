@@ -1,11 +1,21 @@
 """Serializers for api_trades app"""
+from django.db import transaction
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
 
-from django.db.models import Sum
+from . import positions, risk
+from .models import Order, OutboxEvent, Stock
+
+
+def check_holdings(quantity, net_quantity):
+    """Raise a ValidationError if a sell of quantity exceeds net_quantity."""
+    if quantity > net_quantity:
+        raise ValidationError(
+            f"You cannot sell more than your current holdings. "
+            f"Available quantity: {net_quantity}"
+        )
 
-from .models import Order, Stock
 
 class OrderSerializer(serializers.ModelSerializer):
     """Serializer for Order model"""
@@ -21,38 +31,33 @@ class OrderSerializer(serializers.ModelSerializer):
             'date_time_placed'
         ]
 
+    def validate(self, attrs):
+        """Orders must be for a whole number of lots."""
+        stock = attrs.get('stock')
+        quantity = attrs.get('quantity')
+        if stock is not None and quantity and quantity % stock.lot_size:
+            raise ValidationError({
+                'quantity': f'Quantity must be a multiple of the lot size ({stock.lot_size}).'
+            })
+        return attrs
+
     def create(self, validated_data):
-        """Create a trade order, ensuring that a sell order does not exceed the user's holdings."""
+        """
+        Create a trade order, ensuring that a sell order does not exceed the
+        user's holdings and that the order is within the user's risk limits.
+        """
         user = self.context['request'].user
         stock = validated_data['stock']
         order_type = validated_data['order_type']
         quantity = validated_data['quantity']
 
-        if order_type == 'sell':
-            # Calculate the user's total holdings of the stock
-            total_buy_quantity = Order.objects.filter(
-                user=user,
-                stock=stock,
-                order_type='buy'
-            ).aggregate(total_quantity=Sum('quantity'))['total_quantity'] or 0
-            total_sell_quantity = Order.objects.filter(
-                user=user,
-                stock=stock,
-                order_type='sell'
-            ).aggregate(total_quantity=Sum('quantity'))['total_quantity'] or 0
-
-            # Calculate net available quantity
-            net_quantity = total_buy_quantity - total_sell_quantity
-
-            if quantity > net_quantity:
-                raise ValidationError(
-                    f"You cannot sell more than your current holdings. "
-                    f"Available quantity: {net_quantity}"
-                )
-
-
-        # Create the order
-        order = Order.objects.create(**validated_data)
+        with transaction.atomic():
+            if order_type == 'sell':
+                check_holdings(quantity, positions.net_quantity(user.id, stock.id))
+            risk.check_order(user.id, stock, order_type, quantity, for_update=True)
+
+            # Create the order
+            order = Order.objects.create(**validated_data)
         return order
 
 
@@ -64,16 +69,138 @@ class StockSerializer(serializers.ModelSerializer):
         fields = [
             'id',
             'name',
-            'price'
+            'price',
+            'currency',
+            'lot_size'
         ]
         read_only_fields = ['id']
 
 
 class PortfolioSerializer(serializers.Serializer):
+    stock = serializers.IntegerField(source='stock_id')
     stock_name = serializers.CharField()
     quantity = serializers.IntegerField()
-    total_value = serializers.DecimalField(max_digits=10, decimal_places=2)
+    total_value = serializers.DecimalField(max_digits=20, decimal_places=2)
+    currency = serializers.CharField()
+    base_value = serializers.DecimalField(max_digits=20, decimal_places=2, required=False)
+
+
+class PortfolioQuerySerializer(serializers.Serializer):
+    """Serializer for the portfolio query parameters"""
+    ORDER_FIELDS = ['value', 'quantity', 'name']
+
+    stocks = serializers.CharField(required=False, help_text='Comma separated stock ids.')
+    order_by = serializers.ChoiceField(
+        choices=ORDER_FIELDS + [f'-{field}' for field in ORDER_FIELDS], default='name')
+    limit = serializers.IntegerField(min_value=1, max_value=1000, required=False)
+    base = serializers.CharField(max_length=3, required=False)
+
+    def validate_stocks(self, value):
+        try:
+            stock_ids = [int(stock_id) for stock_id in value.split(',') if stock_id.strip()]
+        except ValueError:
+            stock_ids = []
+        if not stock_ids:
+            raise ValidationError('Expected a comma separated list of stock ids.')
+        return stock_ids
+
+
+class CurrencyTotalSerializer(serializers.Serializer):
+    currency = serializers.CharField()
+    total_value = serializers.DecimalField(max_digits=20, decimal_places=2)
+
+
+class PortfolioValueSerializer(serializers.Serializer):
+    totals = CurrencyTotalSerializer(many=True)
+    updated_at = serializers.DateTimeField(allow_null=True)
+
+
+class ArchivedOrderSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    order_type = serializers.CharField()
+    stock = serializers.IntegerField(source='stock_id')
+    quantity = serializers.IntegerField()
+    date_time_placed = serializers.DateTimeField()
+
+
+class QueuedOrderSerializer(serializers.Serializer):
+    ticket = serializers.CharField()
+    status = serializers.CharField()
+    stock = serializers.IntegerField(source='stock_id')
+    order_type = serializers.CharField()
+    quantity = serializers.IntegerField()
+    order = serializers.IntegerField(source='order_id', allow_null=True)
+    error = serializers.CharField(allow_null=True)
 
 
 class EmptySerializer(serializers.Serializer):
     pass
+
+
+class AnalyticsQuerySerializer(serializers.Serializer):
+    """Serializer for the analytics query parameters"""
+    SORT_FIELDS = [
+        'orders', 'volume', 'buy_quantity', 'sell_quantity', 'net_quantity', 'notional',
+    ]
+
+    group_by = serializers.ChoiceField(choices=['stock', 'user', 'side', 'day'], default='stock')
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+    user = serializers.IntegerField(required=False)
+    stock = serializers.IntegerField(required=False)
+    sort = serializers.ChoiceField(
+        choices=SORT_FIELDS + [f'-{field}' for field in SORT_FIELDS], default='-volume')
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=50)
+
+
+class OrderFilterSerializer(serializers.Serializer):
+    """Serializer for the order list and summary query parameters"""
+    stock = serializers.IntegerField(required=False)
+    side = serializers.ChoiceField(choices=[choice for choice, _ in Order.ORDER_CHOICES],
+                                   required=False)
+    min_quantity = serializers.IntegerField(min_value=1, required=False)
+    max_quantity = serializers.IntegerField(min_value=1, required=False)
+    placed_after = serializers.DateTimeField(required=False)
+    placed_before = serializers.DateTimeField(required=False)
+    ordering = serializers.ChoiceField(
+        choices=['date_time_placed', '-date_time_placed', 'quantity', '-quantity'],
+        default='date_time_placed')
+
+
+class OrderSummarySerializer(serializers.Serializer):
+    day = serializers.DateField()
+    stock = serializers.IntegerField(source='stock_id')
+    stock_name = serializers.CharField(source='stock__name')
+    orders = serializers.IntegerField()
+    buy_quantity = serializers.IntegerField()
+    sell_quantity = serializers.IntegerField()
+    volume = serializers.IntegerField()
+
+
+class PositionCacheStatsSerializer(serializers.Serializer):
+    name = serializers.CharField()
+    entries = serializers.IntegerField()
+    max_entries = serializers.IntegerField()
+    ttl = serializers.FloatField()
+    hits = serializers.IntegerField()
+    misses = serializers.IntegerField()
+    hit_ratio = serializers.FloatField(allow_null=True)
+    evictions = serializers.IntegerField()
+    expirations = serializers.IntegerField()
+    invalidations = serializers.IntegerField()
+    memory_bytes = serializers.IntegerField()
+
+
+class EventFeedQuerySerializer(serializers.Serializer):
+    """Serializer for the event feed query parameters"""
+    after = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=100)
+    wait = serializers.FloatField(min_value=0, default=0)
+
+
+class OutboxEventSerializer(serializers.ModelSerializer):
+    """Serializer for OutboxEvent model"""
+
+    class Meta:
+        model = OutboxEvent
+        fields = ['seq', 'topic', 'key', 'payload', 'created_at']
@@ -0,0 +1,136 @@
+"""Signal handlers for api_trades app"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from trading_app.routers import CATALOGUE_PIN, pin_to_primary, user_pin
+
+from api_trades import caching, holdings, journal, outbox, positions, risk
+from api_trades.models import ExchangeRate, Order, Stock
+
+
+@receiver([post_save, post_delete], sender=Stock)
+def stock_changed(sender, instance, **kwargs):
+    """
+    Invalidate cached versions once a stock change is committed, so no
+    worker caches the old stock under the new version in between.
+    """
+    transaction.on_commit(partial(caching.bump_stock, instance.pk))
+    pin_to_primary(CATALOGUE_PIN)
+
+
+@receiver(post_save, sender=Stock)
+def publish_stock(sender, instance, created, **kwargs):
+    """Record stock changes in the outbox, in the saving transaction."""
+    outbox.record([outbox.stock_event(instance, 'stock.created' if created else 'stock.updated')])
+
+
+@receiver(post_delete, sender=Stock)
+def publish_stock_deleted(sender, instance, **kwargs):
+    """Record stock deletions in the outbox."""
+    outbox.record([outbox.stock_event(instance, 'stock.deleted')])
+
+
+@receiver([post_save, post_delete], sender=ExchangeRate)
+def exchange_rate_changed(sender, instance, **kwargs):
+    """Invalidate portfolios valued in another currency when a rate changes."""
+    transaction.on_commit(partial(caching.bump_version, caching.FX_KEY))
+
+
+@receiver([post_save, post_delete], sender=Order)
+def order_changed(sender, instance, **kwargs):
+    """Invalidate the owner's positions once their order change is committed."""
+    transaction.on_commit(partial(invalidate_positions, instance.user_id))
+    pin_to_primary(user_pin(instance.user_id))
+
+
+def invalidate_positions(user_id):
+    caching.bump_positions(user_id)
+    positions.invalidate(user_id)
+
+
+# Fields of an order that its holding and risk counters depend on.
+HELD_FIELDS = ('user_id', 'stock_id', 'order_type', 'quantity', 'date_time_placed')
+
+
+@receiver(pre_save, sender=Order)
+def remember_order(sender, instance, **kwargs):
+    """Keep the saved version of an order being changed, for hold_order."""
+    instance._saved = None
+    if not instance._state.adding:
+        instance._saved = Order.objects.filter(pk=instance.pk).only(*HELD_FIELDS).first()
+
+
+def changed_from(instance):
+    """Return the saved version of an updated order if a HELD_FIELDS value changed."""
+    saved = getattr(instance, '_saved', None)
+    if saved is None or all(getattr(saved, name) == getattr(instance, name) for name in HELD_FIELDS):
+        return None
+    return saved
+
+
+@receiver(post_save, sender=Order)
+def hold_order(sender, instance, created, **kwargs):
+    """
+    Add new orders to the holder index, the risk counters and the outbox,
+    and move changed ones from their old values to their new ones.
+    bulk_create callers do this themselves.
+    """
+    if created:
+        holdings.apply_orders([instance])
+        risk.record_orders([instance])
+        outbox.record_orders([instance])
+        return
+
+    saved = changed_from(instance)
+    if saved is None:
+        return
+    holdings.remove_orders([saved])
+    holdings.apply_orders([instance])
+    risk.unrecord_orders([saved])
+    if risk.placed_today(instance):
+        risk.record_orders([instance])
+    if saved.user_id != instance.user_id:
+        transaction.on_commit(partial(invalidate_positions, saved.user_id))
+
+
+@receiver(post_delete, sender=Order)
+def release_order(sender, instance, origin=None, **kwargs):
+    """
+    Take a deleted order back off the holder index and risk counters.
+    Orders deleted with their stock or user lose their holdings and
+    counters with them, and archive.py deletes orders without signals
+    since archiving leaves positions unchanged.
+    """
+    if getattr(origin, 'model', type(origin)) is not Order:
+        return
+    holdings.remove_orders([instance])
+    risk.unrecord_orders([instance])
+
+
+@receiver(post_save, sender=Order)
+def journal_order(sender, instance, created, **kwargs):
+    """
+    Append new orders to the order journal once they are committed, and
+    changed ones as their old values deleted and their new ones added.
+    """
+    if not journal.enabled():
+        return
+    if not created:
+        saved = changed_from(instance)
+        if saved is None:
+            return
+        transaction.on_commit(partial(journal.append, [saved], deleted=True))
+    transaction.on_commit(partial(journal.append, [instance]))
+
+
+@receiver(post_delete, sender=Order)
+def journal_deleted_order(sender, instance, **kwargs):
+    """
+    Append deleted orders to the order journal, cascades included, once
+    the deletion is committed. Archiving deletes without signals.
+    """
+    if journal.enabled():
+        transaction.on_commit(partial(journal.append, [instance], deleted=True))
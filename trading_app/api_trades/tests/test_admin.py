@@ -0,0 +1,103 @@
+"""
+Tests for the Order and Stock admin
+"""
+import unittest
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from api_trades.admin import EstimatedCountPaginator
+from api_trades.models import Order, Stock
+
+ORDER_CHANGELIST_URL = reverse('admin:api_trades_order_changelist')
+STOCK_CHANGELIST_URL = reverse('admin:api_trades_stock_changelist')
+
+
+class AdminTests(TestCase):
+    """Test the admin change lists stay cheap as the tables grow"""
+
+    def setUp(self):
+        self.admin = get_user_model().objects.create_superuser(
+            username='admin', email='admin@example.com', password='testpass123')
+        self.client.force_login(self.admin)
+        self.stock = Stock.objects.create(name='Stock 1', price=Decimal('5.00'))
+
+    def add_orders(self, count):
+        start = Order.objects.count()
+        users = [
+            get_user_model().objects.create_user(username=f'user{number}', password='testpass123')
+            for number in range(start, start + count)
+        ]
+        stocks = [Stock.objects.create(name=f'Listed {number}', price=Decimal('1.00'))
+                  for number in range(start, start + count)]
+        Order.objects.bulk_create(
+            Order(user=user, stock=stock, order_type='buy', quantity=1)
+            for user, stock in zip(users, stocks)
+        )
+
+    def changelist_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_order_changelist_queries_do_not_grow_with_rows(self):
+        self.add_orders(2)
+        few = self.changelist_queries(ORDER_CHANGELIST_URL)
+        self.add_orders(20)
+        many = self.changelist_queries(ORDER_CHANGELIST_URL)
+        self.assertEqual(few, many)
+
+    def test_order_changelist_filters(self):
+        self.add_orders(3)
+        response = self.client.get(ORDER_CHANGELIST_URL, {
+            'order_type__exact': 'buy', 'date_time_placed__year': Order.objects.first().date_time_placed.year,
+        })
+        self.assertContains(response, 'user2')
+
+    def test_orders_searched_by_stock_not_filtered(self):
+        self.add_orders(3)
+        response = self.client.get(ORDER_CHANGELIST_URL, {'q': '"Listed 1"'})
+        self.assertEqual(
+            [spec.field_path for spec in response.context['cl'].filter_specs], ['order_type'])
+        self.assertEqual([order.stock.name for order in response.context['cl'].result_list],
+                         ['Listed 1'])
+
+    def test_no_full_count(self):
+        self.add_orders(3)
+        response = self.client.get(ORDER_CHANGELIST_URL, {'order_type__exact': 'sell'})
+        self.assertNotContains(response, '3 total')
+
+    def test_stock_autocomplete(self):
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'api_trades', 'model_name': 'order', 'field_name': 'stock', 'term': 'Stock',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['text'], 'Stock 1')
+
+    def test_stock_changelist(self):
+        response = self.client.get(STOCK_CHANGELIST_URL, {'q': 'Stock'})
+        self.assertContains(response, 'Stock 1')
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    """Test the estimated count paginator"""
+
+    def setUp(self):
+        self.stock = Stock.objects.create(name='Stock 1', price=Decimal('5.00'))
+
+    def test_small_results_counted_exactly(self):
+        paginator = EstimatedCountPaginator(Stock.objects.order_by('pk'), 10)
+        self.assertEqual(paginator.count, 1)
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'PostgreSQL only')
+    def test_large_results_estimated(self):
+        paginator = EstimatedCountPaginator(Stock.objects.order_by('pk'), 10)
+        paginator.exact_count_limit = 0
+        with self.assertNumQueries(1) as context:
+            self.assertGreater(paginator.count, 0)
+        self.assertIn('EXPLAIN', context.captured_queries[0]['sql'])
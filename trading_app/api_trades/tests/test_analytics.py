@@ -0,0 +1,133 @@
+"""
+Tests for the columnar analytics snapshot and endpoint
+"""
+import tempfile
+from datetime import datetime, timezone
+from decimal import Decimal
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.test import TestCase, override_settings
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api_trades import analytics
+from api_trades.models import Job, JobRun, Order, Stock
+from api_trades.scheduler import Scheduler
+
+ANALYTICS_URL = reverse('orders:analytics')
+
+
+class AnalyticsTests(TestCase):
+    """Test building and querying the analytics snapshot"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.settings = override_settings(ANALYTICS_DIR=self.tmpdir.name)
+        self.settings.enable()
+        analytics.clear()
+
+        self.client = APIClient()
+        self.admin = get_user_model().objects.create_superuser(
+            username='admin', email='admin@example.com', password='testpass123')
+        self.alice = get_user_model().objects.create_user(username='alice', password='testpass123')
+        self.bob = get_user_model().objects.create_user(username='bob', password='testpass123')
+        self.stock_a = Stock.objects.create(name='Stock A', price=Decimal('2.50'))
+        self.stock_b = Stock.objects.create(name='Stock B', price=Decimal('10.00'))
+
+        self.place(self.alice, self.stock_a, 'buy', 100, datetime(2024, 1, 1, 9, tzinfo=timezone.utc))
+        self.place(self.alice, self.stock_a, 'sell', 40, datetime(2024, 1, 2, 9, tzinfo=timezone.utc))
+        self.place(self.bob, self.stock_a, 'buy', 10, datetime(2024, 1, 2, 10, tzinfo=timezone.utc))
+        self.place(self.bob, self.stock_b, 'buy', 5, datetime(2024, 1, 3, 9, tzinfo=timezone.utc))
+        self.client.force_authenticate(self.admin)
+
+    def tearDown(self):
+        analytics.clear()
+        self.settings.disable()
+        self.tmpdir.cleanup()
+
+    def place(self, user, stock, order_type, quantity, placed):
+        order = Order.objects.create(user=user, stock=stock, order_type=order_type, quantity=quantity)
+        Order.objects.filter(pk=order.pk).update(date_time_placed=placed)
+
+    def test_requires_superuser(self):
+        self.client.force_authenticate(self.alice)
+        res = self.client.get(ANALYTICS_URL)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_unavailable_before_first_snapshot(self):
+        res = self.client.get(ANALYTICS_URL)
+        self.assertEqual(res.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_volume_per_stock(self):
+        analytics.build_snapshot(chunk_size=3)
+
+        res = self.client.get(ANALYTICS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['orders'], 4)
+        self.assertEqual(res.data['results'], [
+            {'orders': 3, 'buy_quantity': 110, 'sell_quantity': 40, 'volume': 150,
+             'net_quantity': 70, 'imbalance': 0.4667, 'notional': 375.0,
+             'stock_id': self.stock_a.id, 'stock_name': 'Stock A'},
+            {'orders': 1, 'buy_quantity': 5, 'sell_quantity': 0, 'volume': 5,
+             'net_quantity': 5, 'imbalance': 1.0, 'notional': 50.0,
+             'stock_id': self.stock_b.id, 'stock_name': 'Stock B'},
+        ])
+
+    def test_top_traders_by_notional(self):
+        analytics.build_snapshot()
+
+        res = self.client.get(ANALYTICS_URL, {'group_by': 'user', 'sort': '-notional', 'limit': 1})
+
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['username'], 'alice')
+        self.assertEqual(res.data['results'][0]['notional'], 350.0)
+
+    def test_filters_and_day_groups(self):
+        analytics.build_snapshot()
+
+        res = self.client.get(ANALYTICS_URL, {
+            'group_by': 'day', 'sort': 'orders',
+            'since': '2024-01-02T00:00:00Z', 'until': '2024-01-03T00:00:00Z',
+        })
+        self.assertEqual([(row['date'].isoformat(), row['orders']) for row in res.data['results']],
+                         [('2024-01-02', 2)])
+
+        res = self.client.get(ANALYTICS_URL, {'group_by': 'side', 'stock': self.stock_a.id})
+        self.assertEqual(
+            [(row['order_type'], row['volume']) for row in res.data['results']],
+            [('buy', 110), ('sell', 40)])
+
+        res = self.client.get(ANALYTICS_URL, {'user': 999})
+        self.assertEqual(res.data['results'], [])
+
+    def test_invalid_query(self):
+        analytics.build_snapshot()
+        res = self.client.get(ANALYTICS_URL, {'group_by': 'colour'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_new_snapshot_is_picked_up(self):
+        analytics.build_snapshot()
+        first = analytics.current_snapshot()
+        self.place(self.bob, self.stock_b, 'sell', 5, datetime(2024, 1, 4, tzinfo=timezone.utc))
+        analytics.build_snapshot()
+        analytics.build_snapshot()
+
+        self.assertEqual(len(analytics.current_snapshot()), 5)
+        self.assertNotEqual(analytics.current_snapshot().name, first.name)
+        self.assertEqual(len(list(Path(self.tmpdir.name).glob('snapshot-*'))), 2)
+        self.assertEqual(list(Path(self.tmpdir.name).glob('build-*')), [])
+
+    def test_refresh_job_runs_in_chunks(self):
+        scheduler = Scheduler(jobs={'refresh_analytics': {'interval': 60, 'chunk_size': 2}})
+        scheduler.sync()
+
+        runs = scheduler.run_pending('refresh_analytics')
+
+        self.assertEqual(runs[-1].status, JobRun.SUCCEEDED)
+        self.assertEqual((runs[-1].chunks, runs[-1].items), (3, 4))
+        self.assertEqual(Job.objects.get(name='refresh_analytics').checkpoint, {})
+        self.assertEqual(len(analytics.current_snapshot()), 4)
@@ -10,6 +10,7 @@ from django.test import TestCase
 from rest_framework import status
 from rest_framework.test import APIClient
 
+from api_trades import catalogue, portfolio, positions
 from api_trades.models import Order, Stock
 from api_trades.serializers import OrderSerializer
 
@@ -167,6 +168,7 @@ class PublicStockAPITests(TestCase):
     """test unauthorized stock API requests"""
 
     def setUp(self):
+        catalogue.clear()
         self.client = APIClient()
 
     def test_auth_required(self):
@@ -177,6 +179,7 @@ class PublicStockAPITests(TestCase):
 class PrivateStockSuperUserAPITests(TestCase):
     """test authorized superuser stock API requests"""
     def setUp(self):
+        catalogue.clear()
         self.client = APIClient()
         self.user = create_user(
             username='Testusername',
@@ -238,6 +241,7 @@ class PrivateStockSuperUserAPITests(TestCase):
 class PrivateStockAPITests(TestCase):
     """test authorized stock API requests"""
     def setUp(self):
+        catalogue.clear()
         self.client = APIClient()
         self.user = create_user(
             username='Testusername',
@@ -294,6 +298,7 @@ class PortfolioAPITests(TestCase):
     """Tests to check users portfolio"""
 
     def setUp(self):
+        positions.invalidate()
         self.client = APIClient()
         self.user = create_user(
             username='Testusername',
@@ -317,18 +322,26 @@ class PortfolioAPITests(TestCase):
         self.assertEqual(res.status_code, 200)
 
         # Check if the res contains the correct data
-        expected_data = [
-            {
-                'stock_name': 'Stock 1',
-                'quantity': 10,
-                'total_value': '59.90'
-            },
-            {
-                'stock_name': 'Stock 2',
-                'quantity': 10,
-                'total_value': '100.00'
-            }
-        ]
+        expected_data = {
+            'positions': 2,
+            'totals': [{'currency': 'USD', 'total_value': '159.90'}],
+            'holdings': [
+                {
+                    'stock': self.stock1.id,
+                    'stock_name': 'Stock 1',
+                    'quantity': 10,
+                    'total_value': '59.90',
+                    'currency': 'USD'
+                },
+                {
+                    'stock': self.stock2.id,
+                    'stock_name': 'Stock 2',
+                    'quantity': 10,
+                    'total_value': '100.00',
+                    'currency': 'USD'
+                }
+            ],
+        }
         self.assertEqual(res.data, expected_data)
 
     def test_adjusted_portfolio(self):
@@ -349,19 +362,82 @@ class PortfolioAPITests(TestCase):
         # Stock2 shouldn't appear
         expected_data = [
             {
+                'stock': self.stock1.id,
                 'stock_name': 'Stock 1',
                 'quantity': 10,
-                'total_value': '59.90'
+                'total_value': '59.90',
+                'currency': 'USD'
             },
         ]
-        self.assertEqual(res.data, expected_data)
+        self.assertEqual(res.data['holdings'], expected_data)
+        self.assertEqual(res.data['positions'], 1)
 
     def test_empty_portfolio(self):
         """Test portfolio res when there are no orders"""
         Order.objects.all().delete()  # Ensure no orders exist for this user
         res = self.client.get(PORTFOLIO_URL)
         self.assertEqual(res.status_code, 200)
-        self.assertEqual(res.data, {'message': 'You currently have no stocks in your portfolio'})
+        self.assertEqual(res.data, {'positions': 0, 'totals': [], 'holdings': []})
+
+    def test_filter_sort_and_limit(self):
+        """Test the portfolio can be narrowed, sorted and limited"""
+        stock3 = create_stock(name='Stock 3', price=Decimal('1'))
+        create_order(user=self.user, stock=stock3, quantity=50)
+
+        with self.assertNumQueries(2):
+            res = self.client.get(PORTFOLIO_URL, {'order_by': '-value', 'limit': 2})
+        self.assertEqual([row['stock_name'] for row in res.data['holdings']],
+                         ['Stock 2', 'Stock 1'])
+        # Totals cover every position, not just those returned
+        self.assertEqual(res.data['positions'], 3)
+        self.assertEqual(res.data['totals'], [{'currency': 'USD', 'total_value': '209.90'}])
+
+        res = self.client.get(
+            PORTFOLIO_URL, {'stocks': f'{self.stock1.id},{stock3.id}', 'order_by': '-quantity'})
+        self.assertEqual([row['stock_name'] for row in res.data['holdings']],
+                         ['Stock 3', 'Stock 1'])
+        self.assertEqual(res.data['positions'], 2)
+
+    def test_portfolio_is_one_query(self):
+        """Test the holdings and totals come from a single query"""
+        with self.assertNumQueries(1):
+            res = self.client.get(PORTFOLIO_URL, {'order_by': 'quantity'})
+        self.assertEqual(res.data['positions'], 2)
+
+    def test_repeated_query_is_cached(self):
+        """Test the same query is answered from the cache until an order changes it"""
+        self.client.get(PORTFOLIO_URL, {'order_by': 'quantity'})
+        with self.assertNumQueries(0):
+            res = self.client.get(PORTFOLIO_URL, {'order_by': 'quantity'})
+        self.assertEqual(res.data['positions'], 2)
+
+        with self.assertNumQueries(1):
+            self.client.get(PORTFOLIO_URL, {'order_by': 'name'})
+        # Each query keeps its own entry.
+        with self.assertNumQueries(0):
+            self.client.get(PORTFOLIO_URL, {'order_by': 'quantity'})
+            self.client.get(PORTFOLIO_URL, {'order_by': 'name'})
+        stats = portfolio.portfolio_cache.stats()
+        self.assertEqual(stats['entries'], 2)
+        self.assertGreater(stats['memory_bytes'], 1000)
+
+        stock3 = create_stock(name='Stock 3')
+        with self.captureOnCommitCallbacks(execute=True):
+            create_order(user=self.user, stock=stock3)
+        res = self.client.get(PORTFOLIO_URL, {'order_by': 'name'})
+        self.assertEqual(res.data['positions'], 3)
+
+    def test_stock_changes_drop_cached_portfolios(self):
+        """Test deleting a stock drops every cached portfolio"""
+        self.client.get(PORTFOLIO_URL)
+        positions.invalidate_stock(self.stock2.id)
+        self.assertEqual(portfolio.portfolio_cache.stats()['entries'], 0)
+
+    def test_invalid_query(self):
+        """Test bad portfolio parameters are rejected"""
+        for params in ({'stocks': 'one,two'}, {'order_by': 'price'}, {'limit': 0}):
+            res = self.client.get(PORTFOLIO_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
 
 class TotalValueInvestedViewTest(TestCase):
@@ -0,0 +1,164 @@
+"""
+Tests for archiving old orders into rollups
+"""
+import gzip
+import json
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.urls import reverse
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api_trades import archive, positions
+from api_trades.models import ArchiveSegment, Order, PositionRollup, Stock
+
+ARCHIVE_URL = reverse('orders:archived-orders')
+PORTFOLIO_URL = reverse('orders:user-portfolio')
+
+
+class ArchiveOrdersTests(TestCase):
+    """Test moving old orders to cold storage"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.settings = override_settings(ORDER_ARCHIVE_DIR=self.tmpdir.name)
+        self.settings.enable()
+
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='Testusername', email='test@example.com', password='testpass123')
+        self.stock = Stock.objects.create(name='Stock 1', price=Decimal('5.00'))
+        self.client.force_authenticate(self.user)
+
+        old = timezone.now() - timedelta(days=400)
+        self.old_orders = [
+            self.create_order('buy', 10, old),
+            self.create_order('sell', 4, old),
+        ]
+        self.create_order('buy', 3)
+
+    def tearDown(self):
+        self.settings.disable()
+        self.tmpdir.cleanup()
+
+    def create_order(self, order_type, quantity, placed=None):
+        """Create an order, optionally back-dated"""
+        order = Order.objects.create(
+            user=self.user, stock=self.stock, order_type=order_type, quantity=quantity)
+        if placed:
+            Order.objects.filter(id=order.id).update(date_time_placed=placed)
+            order.refresh_from_db()
+        return order
+
+    def test_archive_command(self):
+        """Test old orders are moved into a rollup and an archive file"""
+        out = StringIO()
+        call_command('archive_orders', '--days', '365', '--batch-size', '1', stdout=out)
+
+        self.assertIn('Archived 2 orders', out.getvalue())
+        self.assertEqual(Order.objects.count(), 1)
+        rollup = PositionRollup.objects.get(user=self.user, stock=self.stock)
+        self.assertEqual((rollup.buy_quantity, rollup.sell_quantity, rollup.order_count), (10, 4, 2))
+        self.assertEqual(
+            [row['id'] for row in archive.read_archived()],
+            [order.id for order in self.old_orders])
+
+    def test_positions_include_rollups(self):
+        """Test positions are unchanged by archiving"""
+        before = positions.user_positions(self.user.id)
+        archive.archive_orders(timezone.now() - timedelta(days=365))
+
+        self.assertEqual(positions.user_positions(self.user.id), before)
+        self.assertEqual(positions.net_quantity(self.user.id, self.stock.id), 9)
+
+        res = self.client.get(PORTFOLIO_URL)
+        self.assertEqual(res.data['holdings'][0]['quantity'], 9)
+        self.assertEqual(res.data['holdings'][0]['total_value'], '45.00')
+
+    def test_archived_orders_endpoint(self):
+        """Test users can read their archived orders"""
+        other = get_user_model().objects.create_user(
+            username='OtherUser', email='other@example.com', password='testpass123')
+        Order.objects.filter(id=Order.objects.create(
+            user=other, stock=self.stock, order_type='buy', quantity=1).id
+        ).update(date_time_placed=timezone.now() - timedelta(days=400))
+        archive.archive_orders(timezone.now() - timedelta(days=365))
+
+        res = self.client.get(ARCHIVE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['count'], 2)
+        self.assertEqual([row['quantity'] for row in res.data['results']], [10, 4])
+        self.assertEqual(res.data['results'][0]['stock'], self.stock.id)
+
+        res = self.client.get(ARCHIVE_URL, {'limit': 1, 'offset': 1})
+        self.assertEqual([row['quantity'] for row in res.data['results']], [4])
+        self.assertIsNone(res.data['next'])
+
+    def test_only_the_users_segments_are_read(self):
+        """Test reading a user's archive skips other users' members"""
+        other = get_user_model().objects.create_user(
+            username='OtherUser', email='other@example.com', password='testpass123')
+        Order.objects.filter(id=Order.objects.create(
+            user=other, stock=self.stock, order_type='buy', quantity=1).id
+        ).update(date_time_placed=timezone.now() - timedelta(days=400))
+        archive.archive_orders(timezone.now() - timedelta(days=365))
+
+        segments = ArchiveSegment.objects.filter(user=self.user)
+        self.assertEqual([segment.order_count for segment in segments], [2])
+        with mock.patch('api_trades.archive.gzip.decompress', wraps=gzip.decompress) as decompress:
+            rows = list(archive.read_archived(user_id=self.user.id))
+        self.assertEqual(decompress.call_count, 1)
+        self.assertEqual([row['quantity'] for row in rows], [10, 4])
+
+    def test_pages_only_read_their_segments(self):
+        """Test a page of archived orders decompresses only the segments covering it"""
+        old = timezone.now() - timedelta(days=400)
+        for quantity in (5, 6, 7):
+            self.create_order('buy', quantity, old)
+        # One order per batch, so each lands in its own segment.
+        archive.archive_orders(timezone.now() - timedelta(days=365), batch_size=1)
+        self.assertEqual(ArchiveSegment.objects.filter(user=self.user).count(), 5)
+
+        with mock.patch('api_trades.archive.gzip.decompress', wraps=gzip.decompress) as decompress:
+            res = self.client.get(ARCHIVE_URL, {'limit': 2, 'offset': 2})
+
+        self.assertEqual(res.data['count'], 5)
+        self.assertEqual([row['quantity'] for row in res.data['results']], [5, 6])
+        self.assertEqual(decompress.call_count, 2)
+
+        res = self.client.get(ARCHIVE_URL, {'limit': 2, 'offset': 4})
+        self.assertEqual([row['quantity'] for row in res.data['results']], [7])
+        self.assertEqual(self.client.get(ARCHIVE_URL, {'offset': 9}).data['results'], [])
+
+    def test_index_existing_archives(self):
+        """Test files written before segments existed can be indexed"""
+        path = archive.archive_dir() / 'orders-1.ndjson.gz'
+        lines = ''.join(json.dumps(archive.serialize(order)) + '\n' for order in self.old_orders)
+        path.write_bytes(gzip.compress(lines.encode('utf-8')) + b'\x1f\x8b truncated')
+        self.assertEqual(list(archive.read_archived(user_id=self.user.id)), [])
+
+        out = StringIO()
+        call_command('archive_orders', '--index-existing', '--days', '1000', stdout=out)
+
+        self.assertIn('into 1 segments', out.getvalue())
+        self.assertEqual(
+            [row['id'] for row in archive.read_archived(user_id=self.user.id)],
+            [order.id for order in self.old_orders])
+
+    def test_reader_skips_duplicates(self):
+        """Test a batch archived twice after a crash is only read once"""
+        path = archive.archive_dir() / 'orders-1.ndjson.gz'
+        archive.write_batch(path, self.old_orders)
+        archive.write_batch(path, self.old_orders)
+
+        self.assertEqual(len(list(archive.read_archived())), 2)
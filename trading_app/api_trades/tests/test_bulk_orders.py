@@ -0,0 +1,180 @@
+"""
+Tests for resumable bulk order imports
+"""
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from api_trades import bulk_orders
+from api_trades.models import BulkImport, Order, RiskLimit, Stock
+
+
+class BulkOrderImportTests(TestCase):
+    """Test checkpointed, deduplicated CSV imports"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='Testusername', email='test@example.com', password='testpass123')
+        self.stock = Stock.objects.create(name='Stock 1', price=Decimal('5.00'))
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.csv_file = Path(self.tmpdir.name) / 'bulk_order.csv'
+        self.rows = [
+            f'{self.user.id},{self.stock.id},buy,10',
+            f'{self.user.id},{self.stock.id},buy,10',
+            f'{self.user.id},{self.stock.id},sell,5',
+            f'{self.user.id},{self.stock.id},sell,50',
+            f'{self.user.id},999,buy,1',
+            f'{self.user.id},{self.stock.id},buy,lots',
+        ]
+        self.write_file(self.rows)
+
+    def write_file(self, rows):
+        self.csv_file.write_text('user_id,stock_id,order_type,quantity\n' + '\n'.join(rows) + '\n')
+
+    def import_all(self, batch_size=2):
+        return list(bulk_orders.import_orders(self.csv_file, batch_size))
+
+    def booked(self):
+        return list(Order.objects.order_by('id').values_list('order_type', 'quantity'))
+
+    def test_imports_in_batches(self):
+        results = self.import_all()
+
+        self.assertEqual(len(results), 3)
+        self.assertTrue(results[-1].done)
+        self.assertEqual(self.booked(), [('buy', 10), ('buy', 10), ('sell', 5)])
+        self.assertEqual(sum(len(result.errors) for result in results), 3)
+        self.assertEqual(len({order.source_ref for order in Order.objects.all()}), 3)
+
+        progress = BulkImport.objects.get()
+        self.assertEqual(progress.offset, self.csv_file.stat().st_size)
+        self.assertEqual((progress.rows_placed, progress.rows_rejected), (3, 3))
+        self.assertIsNotNone(progress.completed_at)
+
+    def test_resumes_after_failure(self):
+        real_build = bulk_orders.build_orders
+        calls = []
+
+        def crash_on_second_batch(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError('worker killed')
+            return real_build(*args)
+
+        with mock.patch.object(bulk_orders, 'build_orders', crash_on_second_batch):
+            with self.assertRaises(RuntimeError):
+                self.import_all()
+
+        self.assertEqual(self.booked(), [('buy', 10), ('buy', 10)])
+        first_offset = BulkImport.objects.get().offset
+
+        with mock.patch.object(bulk_orders, 'read_rows', wraps=bulk_orders.read_rows) as read_rows:
+            self.import_all()
+        self.assertEqual(read_rows.call_args_list[0].args[1], first_offset)
+        self.assertEqual(self.booked(), [('buy', 10), ('buy', 10), ('sell', 5)])
+
+    def test_same_file_is_imported_once(self):
+        self.import_all()
+        results = self.import_all()
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0].rows, 0)
+        self.assertEqual(Order.objects.count(), 3)
+
+    def test_replayed_rows_are_skipped(self):
+        self.import_all()
+        BulkImport.objects.all().delete()
+
+        results = self.import_all()
+
+        self.assertEqual(sum(result.skipped for result in results), 3)
+        self.assertEqual(Order.objects.count(), 3)
+
+    def test_changed_file_is_a_new_import(self):
+        self.import_all()
+        self.write_file([f'{self.user.id},{self.stock.id},sell,15'])
+
+        self.import_all()
+
+        self.assertEqual(BulkImport.objects.count(), 2)
+        self.assertEqual(self.booked()[-1], ('sell', 15))
+
+    def test_appended_rows_are_imported_once(self):
+        self.write_file(self.rows[:1])
+        self.import_all()
+        self.write_file(self.rows[:1] + [f'{self.user.id},{self.stock.id},buy,7'])
+
+        results = self.import_all()
+
+        self.assertEqual(self.booked(), [('buy', 10), ('buy', 7)])
+        self.assertEqual(sum(result.skipped for result in results), 0)
+        first, appended = BulkImport.objects.order_by('id')
+        self.assertEqual(appended.source, first.source)
+        self.assertEqual(appended.rows_placed, 1)
+
+    def test_appended_to_file_without_final_newline(self):
+        self.csv_file.write_text(f'user_id,stock_id,order_type,quantity\n{self.rows[0]}')
+        self.import_all()
+        self.write_file(self.rows[:1] + [f'{self.user.id},{self.stock.id},buy,7'])
+
+        self.import_all()
+
+        self.assertEqual(self.booked(), [('buy', 10), ('buy', 7)])
+
+    def test_rewritten_file_is_not_an_append(self):
+        self.write_file(self.rows[:2])
+        self.import_all()
+        self.write_file(self.rows[:1] + [f'{self.user.id},{self.stock.id},buy,7'])
+
+        self.import_all()
+
+        self.assertEqual(self.booked(), [('buy', 10), ('buy', 10), ('buy', 10), ('buy', 7)])
+
+    def test_rejects_partial_lots(self):
+        Stock.objects.filter(id=self.stock.id).update(lot_size=10)
+        self.write_file([f'{self.user.id},{self.stock.id},buy,10',
+                         f'{self.user.id},{self.stock.id},buy,15'])
+
+        results = self.import_all()
+
+        self.assertEqual(self.booked(), [('buy', 10)])
+        self.assertIn('Quantity 15 is not a multiple of the lot size', results[0].errors[0])
+
+    def test_checks_risk_limits_across_the_batch(self):
+        RiskLimit.objects.create(user=self.user, max_position=15)
+        self.write_file([f'{self.user.id},{self.stock.id},buy,10',
+                         f'{self.user.id},{self.stock.id},buy,10',
+                         f'{self.user.id},{self.stock.id},sell,5',
+                         f'{self.user.id},{self.stock.id},buy,10'])
+
+        results = self.import_all(batch_size=4)
+
+        self.assertEqual(self.booked(), [('buy', 10), ('sell', 5), ('buy', 10)])
+        self.assertEqual(results[0].errors, [
+            f'Order for user {self.user.id} in stock ID {self.stock.id}: '
+            'Order would take your position to 20, above the limit of 15.',
+        ])
+
+    def test_fingerprint_covers_file_tail(self):
+        self.write_file(self.rows * 5000)
+        before, size = bulk_orders.fingerprint(self.csv_file)
+        with open(self.csv_file, 'r+b') as csvfile:
+            csvfile.seek(size - 3)
+            csvfile.write(b'9\n\n')
+        self.assertNotEqual(bulk_orders.fingerprint(self.csv_file)[0], before)
+
+    def test_command_summary(self):
+        out = StringIO()
+        call_command('place_bulk_order', str(self.csv_file), batch_size=4, stdout=out)
+        call_command('place_bulk_order', str(self.csv_file), stdout=out)
+
+        self.assertIn('3 placed, 3 rejected, 0 already placed', out.getvalue())
+        self.assertIn('Stock with ID 999 does not exist.', out.getvalue())
+        self.assertIn('This file has already been imported', out.getvalue())
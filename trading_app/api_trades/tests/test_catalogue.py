@@ -0,0 +1,109 @@
+"""
+Tests for the cached stock catalogue
+"""
+import gzip
+import json
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.test import TestCase
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api_trades import catalogue
+from api_trades.models import Stock
+
+STOCK_URL = reverse('orders:stock-list')
+
+
+def stock_detail_url(stock_id):
+    """create and return stock detail url for a specified stock"""
+    return reverse('orders:stock-detail', kwargs={'pk': stock_id})
+
+
+class CatalogueTests(TestCase):
+    """Test the catalogue cache behind the stock list"""
+
+    def setUp(self):
+        catalogue.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='Testusername',
+            email='test@example.com',
+            password='testpass123',
+            is_superuser=True,
+        )
+        for name in ['Apple', 'Amazon', 'Alphabet', 'Microsoft']:
+            Stock.objects.create(name=name, price=Decimal('10.00'))
+        self.client.force_authenticate(self.user)
+
+    def test_list_served_from_cache(self):
+        """Test a warm catalogue is listed without any queries"""
+        self.client.get(STOCK_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(STOCK_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([stock['name'] for stock in res.json()],
+                         ['Apple', 'Amazon', 'Alphabet', 'Microsoft'])
+
+    def test_list_gzip(self):
+        """Test the pre-compressed body is used when gzip is accepted"""
+        res = self.client.get(STOCK_URL, HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        self.assertEqual(res['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', res['Vary'])
+        self.assertEqual(len(json.loads(gzip.decompress(res.content))), 4)
+        self.assertTrue(res['ETag'].startswith('W/"catalogue-'))
+
+        res = self.client.get(STOCK_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_list_gzip_refused(self):
+        """Test gzip with a q-value of zero is not used"""
+        res = self.client.get(STOCK_URL, HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+
+        self.assertNotIn('Content-Encoding', res)
+        self.assertFalse(res['ETag'].startswith('W/'))
+        self.assertEqual(len(json.loads(res.content)), 4)
+
+    def test_search_prefix(self):
+        """Test searching returns stocks whose name starts with the value"""
+        res = self.client.get(STOCK_URL, {'search': 'am'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([stock['name'] for stock in res.data], ['Amazon'])
+
+        res = self.client.get(STOCK_URL, {'search': 'A'})
+        self.assertEqual([stock['name'] for stock in res.data], ['Apple', 'Amazon', 'Alphabet'])
+
+    def test_catalogue_rebuilt_on_write(self):
+        """Test create, update and delete are reflected in the list"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(STOCK_URL, {'name': 'Amgen', 'price': '3.00'}, format='json')
+            apple = Stock.objects.get(name='Apple')
+            self.client.patch(stock_detail_url(apple.id), {'price': '11.00'}, format='json')
+            self.client.delete(stock_detail_url(Stock.objects.get(name='Microsoft').id))
+
+        res = self.client.get(STOCK_URL)
+        prices = {stock['name']: stock['price'] for stock in res.data}
+        self.assertEqual(prices['Apple'], '11.00')
+        self.assertIn('Amgen', prices)
+        self.assertNotIn('Microsoft', prices)
+        self.assertEqual(len(self.client.get(STOCK_URL, {'search': 'amg'}).data), 1)
+
+    def test_catalogue_not_rebuilt_before_commit(self):
+        """Test an update rebuilds the catalogue only once it commits"""
+        before = catalogue.get_catalogue()
+        apple = Stock.objects.get(name='Apple')
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.patch(stock_detail_url(apple.id), {'price': '11.00'}, format='json')
+            self.assertIs(catalogue.get_catalogue(), before)
+
+        self.assertIn(catalogue.refresh, callbacks)
+        for callback in callbacks:
+            callback()
+        self.assertIsNot(catalogue.get_catalogue(), before)
@@ -0,0 +1,115 @@
+"""
+Tests for conditional GET support on stock and portfolio reads
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.test import TestCase
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api_trades.models import Order, Stock
+
+PORTFOLIO_URL = reverse('orders:user-portfolio')
+STOCK_URL = reverse('orders:stock-list')
+
+
+def stock_detail_url(stock_id):
+    """create and return stock detail url for a specified stock"""
+    return reverse('orders:stock-detail', kwargs={'pk': stock_id})
+
+
+class ConditionalGetTests(TestCase):
+    """Test ETag and Last-Modified handling"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='Testusername',
+            email='test@example.com',
+            password='testpass123',
+            is_superuser=True,
+        )
+        self.stock = Stock.objects.create(name='Stock 1', price=Decimal('5.99'))
+        Order.objects.create(user=self.user, stock=self.stock, order_type='buy', quantity=10)
+        self.client.force_authenticate(self.user)
+
+    def test_stock_list_not_modified(self):
+        """Test a matching ETag returns 304 without querying the database"""
+        res = self.client.get(STOCK_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('ETag', res)
+        self.assertIn('Last-Modified', res)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(STOCK_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_stock_list_modified_after_update(self):
+        """Test updating a stock invalidates the catalogue ETag"""
+        etag = self.client.get(STOCK_URL)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(stock_detail_url(self.stock.id), {'price': '6.50'}, format='json')
+
+        res = self.client.get(STOCK_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_stock_detail_not_modified(self):
+        """Test a single stock can be revalidated"""
+        etag = self.client.get(stock_detail_url(self.stock.id))['ETag']
+
+        with self.assertNumQueries(0):
+            res = self.client.get(stock_detail_url(self.stock.id), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_portfolio_modified_after_order(self):
+        """Test placing an order invalidates the portfolio ETag"""
+        etag = self.client.get(PORTFOLIO_URL)['ETag']
+        res = self.client.get(PORTFOLIO_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(user=self.user, stock=self.stock, order_type='buy', quantity=5)
+
+        res = self.client.get(PORTFOLIO_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['holdings'][0]['quantity'], 15)
+
+    def test_portfolio_modified_after_price_change(self):
+        """Test a price change invalidates the portfolio ETag"""
+        etag = self.client.get(PORTFOLIO_URL)['ETag']
+        self.stock.price = Decimal('7.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stock.save()
+
+        res = self.client.get(PORTFOLIO_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['holdings'][0]['total_value'], '70.00')
+
+    def test_portfolio_etag_names_the_validated_query(self):
+        """Test equivalent query strings share an ETag and different queries do not"""
+        other = Stock.objects.create(name='Stock 2', price=Decimal('1.00'))
+        etag = self.client.get(
+            PORTFOLIO_URL, {'stocks': f'{self.stock.id},{other.id}', 'limit': 5})['ETag']
+
+        res = self.client.get(
+            PORTFOLIO_URL, {'limit': '5', 'stocks': f'{other.id},{self.stock.id}', '_profile': 1},
+            HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertNotEqual(self.client.get(PORTFOLIO_URL, {'limit': 6})['ETag'], etag)
+        self.assertNotIn('ETag', self.client.get(PORTFOLIO_URL, {'limit': 0}))
+
+    def test_versions_move_on_commit(self):
+        """Test no worker can cache the old data under the new version"""
+        etag = self.client.get(PORTFOLIO_URL)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(user=self.user, stock=self.stock, order_type='buy', quantity=5)
+            res = self.client.get(PORTFOLIO_URL, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        res = self.client.get(PORTFOLIO_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
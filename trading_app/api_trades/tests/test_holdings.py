@@ -0,0 +1,177 @@
+"""
+Tests for the stock holder index and precomputed valuations
+"""
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.urls import reverse
+from django.test import TestCase
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api_trades import archive, holdings, risk
+from api_trades.models import Holding, Order, PortfolioValuation, Stock
+
+VALUE_URL = reverse('orders:portfolio-value')
+ORDERS_URL = reverse('orders:orders-list')
+
+# Validation, the insert, the holding upsert and revaluation, the risk
+# counters and the outbox event; see api_trades/holdings.py.
+SINGLE_ORDER_QUERIES = 20
+
+
+def stock_url(stock_id):
+    """Return the stock detail URL"""
+    return reverse('orders:stock-detail', kwargs={'pk': stock_id})
+
+
+class HoldingsTests(TestCase):
+    """Test holdings follow orders and prices"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.users = [
+            User.objects.create_user(username=f'user{i}', email=f'user{i}@example.com',
+                                     password='testpass123')
+            for i in range(3)
+        ]
+        self.stock = Stock.objects.create(name='Stock 1', price=Decimal('2.50'))
+        self.other = Stock.objects.create(name='Stock 2', price=Decimal('1.00'), currency='GBP')
+        self.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='testpass123')
+
+    def order(self, user, stock, order_type, quantity):
+        return Order.objects.create(user=user, stock=stock, order_type=order_type, quantity=quantity)
+
+    def totals(self, user):
+        return PortfolioValuation.objects.get(user=user).totals
+
+    def test_orders_update_holdings(self):
+        self.order(self.users[0], self.stock, 'buy', 10)
+        self.order(self.users[0], self.stock, 'sell', 4)
+        self.order(self.users[0], self.other, 'buy', 3)
+
+        holding = Holding.objects.get(user=self.users[0], stock=self.stock)
+        self.assertEqual((holding.quantity, holding.value_minor), (6, 1500))
+        self.assertEqual(self.totals(self.users[0]), {'USD': 1500, 'GBP': 300})
+
+    def test_holders(self):
+        self.order(self.users[0], self.stock, 'buy', 10)
+        self.order(self.users[1], self.stock, 'buy', 5)
+        self.order(self.users[1], self.stock, 'sell', 5)
+        self.order(self.users[2], self.other, 'buy', 1)
+
+        self.assertEqual(holdings.holders(self.stock.id), [self.users[0].id])
+
+    def test_bulk_orders_update_holdings(self):
+        created = Order.objects.bulk_create([
+            Order(user=self.users[0], stock=self.stock, order_type='buy', quantity=2),
+            Order(user=self.users[0], stock=self.stock, order_type='buy', quantity=3),
+        ])
+        holdings.apply_orders(created)
+
+        self.assertEqual(Holding.objects.get(user=self.users[0]).quantity, 5)
+
+    def test_price_update_revalues_only_holders(self):
+        self.order(self.users[0], self.stock, 'buy', 10)
+        self.order(self.users[1], self.other, 'buy', 10)
+        untouched = PortfolioValuation.objects.get(user=self.users[1]).updated_at
+
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        res = client.patch(stock_url(self.stock.id), {'price': '3.10'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.totals(self.users[0]), {'USD': 3100})
+        self.assertEqual(PortfolioValuation.objects.get(user=self.users[1]).updated_at, untouched)
+
+    def test_deleting_a_stock_revalues_holders(self):
+        deleted = Stock.objects.create(name='Stock 3', price=Decimal('10.00'))
+        self.order(self.users[0], deleted, 'buy', 3)
+        self.order(self.users[0], self.other, 'buy', 2)
+        self.assertEqual(self.totals(self.users[0]), {'USD': 3000, 'GBP': 200})
+
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        res = client.delete(stock_url(deleted.id))
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.totals(self.users[0]), {'GBP': 200})
+        client.force_authenticate(self.users[0])
+        self.assertEqual(client.get(VALUE_URL).data['totals'], [
+            {'currency': 'GBP', 'total_value': '2.00'},
+        ])
+
+    def test_changed_and_deleted_orders_update_holdings(self):
+        order = self.order(self.users[0], self.stock, 'buy', 10)
+        self.order(self.users[0], self.other, 'buy', 3)
+
+        order.quantity = 4
+        order.save()
+        self.assertEqual(Holding.objects.get(user=self.users[0], stock=self.stock).quantity, 4)
+        self.assertEqual(self.totals(self.users[0]), {'USD': 1000, 'GBP': 300})
+        self.assertEqual(risk.traded_today(self.users[0].id, self.stock.id), (4, 7))
+
+        order.stock = self.other
+        order.save()
+        self.assertEqual(holdings.holders(self.stock.id), [])
+        self.assertEqual(self.totals(self.users[0]), {'GBP': 700})
+
+        Order.objects.filter(user=self.users[0], quantity=3).delete()
+        order.delete()
+        self.assertEqual(self.totals(self.users[0]), {})
+        self.assertEqual(risk.traded_today(self.users[0].id, self.other.id), (0, 0))
+
+    def test_archiving_leaves_holdings(self):
+        order = self.order(self.users[0], self.stock, 'buy', 10)
+        Order.objects.filter(id=order.id).update(
+            date_time_placed=timezone.now() - timedelta(days=400))
+
+        with tempfile.TemporaryDirectory() as directory:
+            archive.archive_orders(timezone.now() - timedelta(days=365), directory=directory)
+
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.totals(self.users[0]), {'USD': 2500})
+
+    def test_single_order_query_count(self):
+        """Test placing an order updates the index, counters and outbox in fixed queries"""
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        self.order(self.users[0], self.stock, 'buy', 1)
+
+        with self.assertNumQueries(SINGLE_ORDER_QUERIES):
+            res = client.post(ORDERS_URL, {
+                'stock': self.other.id, 'order_type': 'buy', 'quantity': 5})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    def test_rebuild(self):
+        self.order(self.users[0], self.stock, 'buy', 10)
+        self.order(self.users[1], self.stock, 'buy', 4)
+        Order.objects.filter(user=self.users[1]).delete()
+
+        out = StringIO()
+        call_command('rebuild_holdings', stdout=out)
+
+        self.assertIn('Rebuilt holdings and valuations for 1 users', out.getvalue())
+        self.assertEqual(holdings.holders(self.stock.id), [self.users[0].id])
+        self.assertFalse(PortfolioValuation.objects.filter(user=self.users[1]).exists())
+
+    def test_value_endpoint(self):
+        self.order(self.users[0], self.stock, 'buy', 10)
+        self.order(self.users[0], self.other, 'buy', 3)
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+
+        res = client.get(VALUE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['totals'], [
+            {'currency': 'GBP', 'total_value': '3.00'},
+            {'currency': 'USD', 'total_value': '25.00'},
+        ])
@@ -0,0 +1,108 @@
+"""
+Tests for the order journal
+"""
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+
+from api_trades import journal
+from api_trades.models import Order, Stock
+
+
+class OrderJournalTests(TestCase):
+    """Test journaling and replaying orders"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpdir.name) / 'orders.journal'
+        self.settings = override_settings(ORDER_JOURNAL_PATH=str(self.path))
+        self.settings.enable()
+
+        self.user = get_user_model().objects.create_user(
+            username='Testusername', email='test@example.com', password='testpass123')
+        self.stock1 = Stock.objects.create(name='Stock 1', price=Decimal('5.99'))
+        self.stock2 = Stock.objects.create(name='Stock 2', price=Decimal('10'))
+
+    def tearDown(self):
+        self.settings.disable()
+        self.tmpdir.cleanup()
+
+    def place(self, stock, order_type, quantity):
+        """Create an order and run its on-commit journal write"""
+        with self.captureOnCommitCallbacks(execute=True):
+            return Order.objects.create(
+                user=self.user, stock=stock, order_type=order_type, quantity=quantity)
+
+    def test_orders_are_journaled(self):
+        """Test each order insert appends one fixed-width record"""
+        order = self.place(self.stock1, 'buy', 10)
+        self.place(self.stock1, 'sell', 4)
+
+        self.assertEqual(os.path.getsize(self.path), 2 * journal.RECORD.size)
+        records = journal.read()
+        self.assertEqual(records[0]['user_id'], self.user.id)
+        self.assertEqual(records[0]['stock_id'], self.stock1.id)
+        self.assertEqual(records[0]['quantity'], 10)
+        self.assertEqual(records[0]['side'], journal.BUY)
+        self.assertEqual(records[1]['side'], journal.SELL)
+        self.assertEqual(
+            records[0]['ts'], int(order.date_time_placed.timestamp() * 1_000_000))
+
+    def test_replay_positions(self):
+        """Test replaying the journal nets buys against sells"""
+        self.place(self.stock1, 'buy', 10)
+        self.place(self.stock2, 'buy', 5)
+        self.place(self.stock1, 'sell', 4)
+
+        self.assertEqual(journal.replay_positions(journal.read()), {
+            (self.user.id, self.stock1.id): 6,
+            (self.user.id, self.stock2.id): 5,
+        })
+
+    def test_torn_record_ignored(self):
+        """Test a partially written trailing record is skipped"""
+        self.place(self.stock1, 'buy', 10)
+        with open(self.path, 'ab') as journal_file:
+            journal_file.write(b'\x01\x02\x03')
+
+        self.assertEqual(len(journal.read()), 1)
+
+    def test_verify_command(self):
+        """Test the verify command passes on a matching journal and fails otherwise"""
+        self.place(self.stock1, 'buy', 10)
+        out = StringIO()
+        call_command('verify_order_journal', stdout=out)
+        self.assertIn('matches', out.getvalue())
+
+        # Not journaled because the on-commit callback never runs.
+        Order.objects.create(user=self.user, stock=self.stock2, order_type='buy', quantity=1)
+        with self.assertRaises(CommandError):
+            call_command('verify_order_journal', stdout=StringIO())
+
+    def test_deleted_and_changed_orders_are_journaled(self):
+        """Test deletes, cascades and edits keep the journal verifiable"""
+        order = self.place(self.stock1, 'buy', 10)
+        self.place(self.stock2, 'buy', 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            order.quantity = 7
+            order.save()
+        self.assertEqual(journal.replay_positions(journal.read())[self.user.id, self.stock1.id], 7)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.delete()
+            self.stock2.delete()
+
+        records = journal.read()
+        self.assertEqual(len(records), 6)
+        self.assertEqual(journal.order_count(records), 0)
+        self.assertEqual(set(journal.replay_positions(records).values()), {0})
+        out = StringIO()
+        call_command('verify_order_journal', stdout=out)
+        self.assertIn('matches', out.getvalue())
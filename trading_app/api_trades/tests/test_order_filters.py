@@ -0,0 +1,155 @@
+"""
+Tests for filtering, ordering and summarizing order history
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.urls import reverse
+from django.test import TestCase
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api_trades import filters
+from api_trades.models import Order, Stock
+
+ORDERS_URL = reverse('orders:orders-list')
+SUMMARY_URL = reverse('orders:orders-summary')
+
+
+class OrderFilterTests(TestCase):
+    """Test the order list filters and summary"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='Testusername', email='test@example.com', password='testpass123')
+        self.client.force_authenticate(self.user)
+        self.stock1 = Stock.objects.create(name='Stock 1', price=Decimal('5.00'))
+        self.stock2 = Stock.objects.create(name='Stock 2', price=Decimal('1.00'))
+
+        self.now = timezone.now()
+        self.orders = [
+            self.create_order(self.stock1, 'buy', 10, days_ago=2),
+            self.create_order(self.stock2, 'buy', 50, days_ago=2),
+            self.create_order(self.stock1, 'sell', 4, days_ago=1),
+            self.create_order(self.stock1, 'buy', 1, days_ago=0),
+        ]
+
+    def create_order(self, stock, order_type, quantity, days_ago):
+        order = Order.objects.create(
+            user=self.user, stock=stock, order_type=order_type, quantity=quantity)
+        placed = self.now - timedelta(days=days_ago)
+        Order.objects.filter(id=order.id).update(date_time_placed=placed)
+        return order.id
+
+    def ids(self, **params):
+        res = self.client.get(ORDERS_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [order['id'] for order in res.data]
+
+    def test_default_is_oldest_first(self):
+        self.assertEqual(self.ids(), self.orders)
+
+    def test_filters(self):
+        self.assertEqual(self.ids(stock=self.stock1.id), [self.orders[0], *self.orders[2:]])
+        self.assertEqual(self.ids(side='sell'), [self.orders[2]])
+        self.assertEqual(self.ids(stock=self.stock1.id, side='buy'),
+                         [self.orders[0], self.orders[3]])
+        self.assertEqual(self.ids(min_quantity=4, max_quantity=10),
+                         [self.orders[0], self.orders[2]])
+        self.assertEqual(
+            self.ids(placed_after=(self.now - timedelta(days=1, hours=1)).isoformat(),
+                     placed_before=(self.now - timedelta(hours=1)).isoformat()),
+            [self.orders[2]])
+
+    def test_ordering(self):
+        self.assertEqual(self.ids(ordering='-quantity'),
+                         [self.orders[1], self.orders[0], self.orders[2], self.orders[3]])
+        self.assertEqual(self.ids(ordering='-date_time_placed'), self.orders[::-1])
+
+    def test_invalid_filter(self):
+        res = self.client.get(ORDERS_URL, {'side': 'hold'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_summary(self):
+        res = self.client.get(SUMMARY_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        rows = [(row['stock_name'], row['orders'], row['buy_quantity'], row['sell_quantity'],
+                 row['volume']) for row in res.data]
+        self.assertEqual(rows, [
+            ('Stock 1', 1, 1, 0, 1),
+            ('Stock 1', 1, 0, 4, 4),
+            ('Stock 1', 1, 10, 0, 10),
+            ('Stock 2', 1, 50, 0, 50),
+        ])
+        self.assertEqual(res.data[0]['day'], self.now.date().isoformat())
+
+    def test_summary_is_filtered(self):
+        res = self.client.get(SUMMARY_URL, {'stock': self.stock2.id})
+        self.assertEqual([row['volume'] for row in res.data], [50])
+
+
+class OrderFilterPlanTests(TestCase):
+    """Test every supported filter is answered from an index"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='Testusername', email='test@example.com', password='testpass123')
+        self.queryset = Order.objects.filter(user=self.user)
+
+    def plan(self, params):
+        queryset = filters.filter_orders(self.queryset, params)
+        if connection.vendor == 'postgresql':
+            # The tables are tiny, so make the planner show whether an index
+            # could be used at all.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def assertUsesIndex(self, params, index, columns):
+        """
+        Assert the order list query for params is answered from index (or
+        one of several indexes), seeking on columns.
+        """
+        plan = self.plan(params)
+        indexes = '|'.join(index) if isinstance(index, tuple) else index
+        if connection.vendor == 'sqlite':
+            self.assertRegex(plan, rf'USING (COVERING )?INDEX ({indexes})\b')
+            self.assertNotIn('USE TEMP B-TREE', plan)
+        elif connection.vendor == 'postgresql':
+            self.assertNotIn('Seq Scan', plan)
+            conditions = ' '.join(line for line in plan.splitlines() if 'Index Cond' in line)
+            for column in columns:
+                self.assertIn(column, conditions)
+
+    def test_user(self):
+        self.assertUsesIndex({}, 'order_user_placed_idx', ['user_id'])
+
+    def test_date_range(self):
+        now = timezone.now()
+        self.assertUsesIndex(
+            {'placed_after': now - timedelta(days=7), 'placed_before': now},
+            'order_user_placed_idx', ['user_id', 'date_time_placed'])
+
+    def test_stock(self):
+        self.assertUsesIndex({'stock': 1}, 'order_user_stock_placed_idx', ['user_id', 'stock_id'])
+
+    def test_stock_and_side(self):
+        # Either index narrows to one user's orders in a stock or on a side.
+        self.assertUsesIndex(
+            {'stock': 1, 'side': 'buy'},
+            ('order_user_stock_placed_idx', 'order_user_type_placed_idx'), ['user_id'])
+
+    def test_side(self):
+        self.assertUsesIndex({'side': 'sell'}, 'order_user_type_placed_idx',
+                             ['user_id', 'order_type'])
+
+    def test_quantity_range(self):
+        self.assertUsesIndex(
+            {'min_quantity': 10, 'max_quantity': 100, 'ordering': 'quantity'},
+            'order_user_quantity_idx', ['user_id', 'quantity'])
@@ -0,0 +1,155 @@
+"""
+Tests for the accept-then-persist order queue
+"""
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.urls import reverse
+from django.test import TestCase, override_settings
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api_trades import order_queue, positions
+from api_trades.models import Order, RiskLimit, Stock
+
+ORDERS_URL = reverse('orders:orders-list')
+
+
+def queued_order_url(ticket):
+    """create and return the status url for a queued order"""
+    return reverse('orders:queued-order', kwargs={'ticket': ticket})
+
+
+class OrderQueueTests(TestCase):
+    """Test placing orders through the order queue"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.settings = override_settings(
+            ORDER_QUEUE_ENABLED=True,
+            ORDER_QUEUE_PATH=Path(self.tmpdir.name) / 'queue.sqlite3',
+        )
+        self.settings.enable()
+        positions.invalidate()
+
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='Testusername',
+            email='test@example.com',
+            password='testpass123',
+        )
+        self.stock = Stock.objects.create(name='Stock 1', price=Decimal('5.99'))
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        order_queue.get_queue().close()
+        self.settings.disable()
+        self.tmpdir.cleanup()
+
+    def test_order_accepted_then_persisted(self):
+        """Test an order is queued, then written by the worker"""
+        res = self.client.post(ORDERS_URL, {
+            'stock': self.stock.id, 'order_type': 'buy', 'quantity': 5})
+
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(Order.objects.exists())
+        ticket = res.data['ticket']
+        self.assertEqual(self.client.get(res.data['status_url']).data['status'], 'pending')
+
+        self.assertEqual(order_queue.drain(), 1)
+
+        res = self.client.get(queued_order_url(ticket))
+        order = Order.objects.get()
+        self.assertEqual(res.data['status'], 'done')
+        self.assertEqual(res.data['order'], order.id)
+        self.assertEqual(order.source_ref, ticket)
+        self.assertEqual(order.user, self.user)
+
+    def test_sell_checked_against_queued_orders(self):
+        """Test sells count buys that are still waiting in the queue"""
+        self.client.post(ORDERS_URL, {'stock': self.stock.id, 'order_type': 'buy', 'quantity': 5})
+
+        res = self.client.post(ORDERS_URL, {'stock': self.stock.id, 'order_type': 'sell', 'quantity': 5})
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+
+        res = self.client.post(ORDERS_URL, {'stock': self.stock.id, 'order_type': 'sell', 'quantity': 1})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_drain_rejects_oversell(self):
+        """Test the worker rejects sells the database cannot cover"""
+        ticket = order_queue.get_queue().enqueue(self.user.id, self.stock.id, 'sell', 3)
+
+        order_queue.drain()
+
+        row = order_queue.get_queue().get(ticket)
+        self.assertEqual(row['status'], 'rejected')
+        self.assertIn('Available quantity: 0', row['error'])
+        self.assertFalse(Order.objects.exists())
+
+    def test_drain_checks_risk_limits_across_the_batch(self):
+        """Test queued orders that together break a limit are rejected"""
+        RiskLimit.objects.create(user=self.user, max_daily_volume=10)
+        for quantity in (4, 4):
+            res = self.client.post(ORDERS_URL, {
+                'stock': self.stock.id, 'order_type': 'buy', 'quantity': quantity})
+            self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        late = order_queue.get_queue().enqueue(self.user.id, self.stock.id, 'buy', 4)
+
+        order_queue.drain()
+
+        row = order_queue.get_queue().get(late)
+        self.assertEqual(row['status'], 'rejected')
+        self.assertIn('volume traded today to 12, above the limit of 10', row['error'])
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_replay_does_not_duplicate(self):
+        """Test rows persisted before a crash are not inserted again"""
+        ticket = order_queue.get_queue().enqueue(self.user.id, self.stock.id, 'buy', 3)
+        order = Order.objects.create(
+            user=self.user, stock=self.stock, order_type='buy', quantity=3, source_ref=ticket)
+
+        call_command('process_order_queue', '--once', stdout=StringIO())
+
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(order_queue.get_queue().get(ticket)['order_id'], order.id)
+
+    def test_leased_rows_are_not_drained_twice(self):
+        """Test a batch claimed by another worker is left to it"""
+        other = get_user_model().objects.create_user(
+            username='OtherUser', email='other@example.com', password='testpass123')
+        queue = order_queue.get_queue()
+        queue.enqueue(self.user.id, self.stock.id, 'buy', 3)
+        queue.enqueue(self.user.id, self.stock.id, 'buy', 4)
+        queue.enqueue(other.id, self.stock.id, 'buy', 5)
+
+        worker = order_queue.OrderQueue(queue.path)
+        self.addCleanup(worker.close)
+        _, claimed = worker.claim(1, lease=60)
+        self.assertEqual([row['quantity'] for row in claimed], [3])
+
+        # The user's later order waits for the leased one.
+        self.assertEqual(order_queue.drain(), 1)
+        self.assertEqual(list(Order.objects.values_list('quantity', flat=True)), [5])
+
+    def test_expired_lease_is_claimed_again(self):
+        """Test the rows of a worker that died are drained after the lease"""
+        queue = order_queue.get_queue()
+        ticket = queue.enqueue(self.user.id, self.stock.id, 'buy', 3)
+        queue.claim(10, lease=-1)
+
+        self.assertEqual(order_queue.drain(), 1)
+        self.assertEqual(queue.get(ticket)['status'], 'done')
+
+    def test_status_limited_to_owner(self):
+        """Test other users cannot see a queued order"""
+        other = get_user_model().objects.create_user(
+            username='OtherUser', email='other@example.com', password='testpass123')
+        ticket = order_queue.get_queue().enqueue(other.id, self.stock.id, 'buy', 3)
+
+        res = self.client.get(queued_order_url(ticket))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
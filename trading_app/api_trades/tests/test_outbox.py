@@ -0,0 +1,152 @@
+"""
+Tests for the event outbox, change feed and relay
+"""
+import json
+import tempfile
+import time
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.urls import reverse
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api_trades import outbox
+from api_trades.models import OutboxCursor, OutboxEvent, RiskLimit, Stock
+
+EVENTS_URL = reverse('orders:events')
+ORDERS_URL = reverse('orders:orders-list')
+
+
+class OutboxTests(TestCase):
+    """Test events are recorded, numbered, served and relayed"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username='Testusername', email='test@example.com', password='testpass123')
+        self.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='testpass123')
+        self.stock = Stock.objects.create(name='Stock 1', price=Decimal('5.00'))
+        self.client = APIClient()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def topics(self):
+        return list(OutboxEvent.objects.order_by('id').values_list('topic', flat=True))
+
+    def place(self, quantity):
+        self.client.force_authenticate(self.user)
+        return self.client.post(
+            ORDERS_URL, {'stock': self.stock.id, 'order_type': 'buy', 'quantity': quantity})
+
+    def test_changes_are_recorded(self):
+        res = self.place(5)
+        self.client.force_authenticate(self.admin)
+        self.client.patch(
+            reverse('orders:stock-detail', kwargs={'pk': self.stock.id}), {'price': '6.00'})
+
+        self.assertEqual(self.topics(), ['stock.created', 'order.created', 'stock.updated'])
+        order_event, stock_event = OutboxEvent.objects.order_by('id')[1:]
+        self.assertEqual(order_event.payload['id'], res.data['id'])
+        self.assertEqual(order_event.payload['quantity'], 5)
+        self.assertEqual(stock_event.payload['price'], '6.00')
+
+    def test_rejected_orders_are_not_recorded(self):
+        RiskLimit.objects.create(max_position=1)
+        res = self.place(5)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.topics(), ['stock.created'])
+
+    def test_sequence_is_contiguous(self):
+        self.place(1)
+        self.assertEqual(outbox.sequence(), 2)
+        self.place(1)
+        self.place(1)
+        self.assertEqual(outbox.sequence(batch_size=1), 1)
+        self.assertEqual(outbox.sequence(), 1)
+
+        self.assertEqual(
+            list(OutboxEvent.objects.order_by('id').values_list('seq', flat=True)), [1, 2, 3, 4])
+        self.assertEqual(OutboxCursor.objects.get(name=outbox.SEQUENCER).position, 4)
+
+    def test_idle_feed_only_reads(self):
+        self.place(1)
+        outbox.sequence()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(outbox.events_after(0)), 2)
+
+        self.assertEqual(len(queries), 2)
+        for query in queries:
+            self.assertTrue(query['sql'].startswith('SELECT'), query['sql'])
+            self.assertNotIn('FOR UPDATE', query['sql'])
+
+    def test_feed(self):
+        self.place(1)
+        self.place(2)
+        self.client.force_authenticate(self.admin)
+
+        res = self.client.get(EVENTS_URL, {'after': 1, 'limit': 1})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([event['seq'] for event in res.data['events']], [2])
+        self.assertEqual(res.data['next'], 2)
+
+        res = self.client.get(EVENTS_URL, {'after': res.data['next']})
+        self.assertEqual([event['payload']['quantity'] for event in res.data['events']], [2])
+        self.assertEqual(res.data['next'], 3)
+
+    @override_settings(OUTBOX_LONG_POLL_SECONDS=0.3, OUTBOX_POLL_SECONDS=0.05)
+    def test_feed_long_polls(self):
+        self.client.force_authenticate(self.admin)
+        started = time.monotonic()
+        res = self.client.get(EVENTS_URL, {'after': 1, 'wait': 30})
+
+        self.assertEqual(res.data, {'events': [], 'next': 1})
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+
+    def test_feed_is_for_superusers(self):
+        self.client.force_authenticate(self.user)
+        res = self.client.get(EVENTS_URL)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_relay_to_file(self):
+        self.place(1)
+        path = Path(self.tmpdir.name) / 'events.ndjson'
+        sinks = {'file': {'BACKEND': 'api_trades.outbox.FileSink', 'OPTIONS': {'path': path}}}
+
+        out = StringIO()
+        with override_settings(OUTBOX_SINKS=sinks):
+            call_command('relay_outbox', 'file', once=True, stdout=out)
+            self.place(2)
+            call_command('relay_outbox', 'file', once=True, stdout=out)
+
+        self.assertIn('Published 2 events to file', out.getvalue())
+        self.assertIn('Published 1 events to file', out.getvalue())
+        events = [json.loads(line) for line in path.read_text().splitlines()]
+        self.assertEqual([event['seq'] for event in events], [1, 2, 3])
+        self.assertEqual(events[-1]['payload']['quantity'], 2)
+
+    def test_relay_to_broker(self):
+        self.place(1)
+        directory = Path(self.tmpdir.name) / 'broker'
+
+        published = outbox.relay('broker', outbox.BrokerSink(directory))
+
+        self.assertEqual(published, 2)
+        self.assertEqual(sorted(path.name for path in directory.iterdir()),
+                         ['order.created', 'stock.created'])
+        messages = json.loads((directory / 'order.created' / f'{2:020d}.json').read_text())
+        self.assertEqual([message['seq'] for message in messages], [2])
+        self.assertEqual(outbox.relay('broker', outbox.BrokerSink(directory)), 0)
+
+    def test_unknown_sink(self):
+        with self.assertRaisesMessage(CommandError, 'Unknown sink nowhere'):
+            call_command('relay_outbox', 'nowhere', once=True)
@@ -0,0 +1,108 @@
+"""
+Tests for Order table partitioning (PostgreSQL only)
+"""
+import tempfile
+import unittest
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from api_trades import partitions, positions
+from api_trades.models import Order, PositionRollup, Stock
+
+
+class PartitionNamingTests(SimpleTestCase):
+    """Test partition month arithmetic"""
+
+    def test_add_months(self):
+        """Test months roll over year boundaries"""
+        self.assertEqual(partitions.add_months(date(2024, 11, 1), 3), date(2025, 2, 1))
+        self.assertEqual(partitions.add_months(date(2024, 1, 1), -1), date(2023, 12, 1))
+
+    def test_partition_name_round_trip(self):
+        """Test a partition name maps back to its month"""
+        name = partitions.partition_name(date(2024, 8, 1))
+        self.assertEqual(name, 'api_trades_order_p2024_08')
+        self.assertEqual(partitions.partition_month(name), date(2024, 8, 1))
+        self.assertIsNone(partitions.partition_month(partitions.DEFAULT_PARTITION))
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Partitioning requires PostgreSQL')
+class OrderPartitionTests(TestCase):
+    """Test the partitioned Order table"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='Testusername', email='test@example.com', password='testpass123')
+        self.stock = Stock.objects.create(name='Stock 1', price=Decimal('5.99'))
+
+    def partition_of(self, order):
+        """Return the partition table an order was stored in"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT tableoid::regclass::text FROM api_trades_order WHERE id = %s', [order.id])
+            return cursor.fetchone()[0]
+
+    def test_order_table_partitioned(self):
+        """Test new orders land in the current month's partition"""
+        self.assertTrue(partitions.is_partitioned(connection))
+        order = Order.objects.create(
+            user=self.user, stock=self.stock, order_type='buy', quantity=1)
+
+        current = partitions.month_start(datetime.now(timezone.utc))
+        self.assertEqual(self.partition_of(order), partitions.partition_name(current))
+
+    def test_create_partition_moves_default_rows(self):
+        """Test creating a partition moves matching rows out of the default partition"""
+        order = Order.objects.create(
+            user=self.user, stock=self.stock, order_type='buy', quantity=1)
+        Order.objects.filter(id=order.id).update(
+            date_time_placed=datetime(2001, 5, 3, tzinfo=timezone.utc))
+        self.assertEqual(self.partition_of(order), partitions.DEFAULT_PARTITION)
+
+        partitions.create_partition(connection, date(2001, 5, 1))
+        self.assertEqual(self.partition_of(order), 'api_trades_order_p2001_05')
+
+    def old_order(self, quantity):
+        """Create an order placed in May 2001, in that month's partition"""
+        order = Order.objects.create(
+            user=self.user, stock=self.stock, order_type='buy', quantity=quantity)
+        Order.objects.filter(id=order.id).update(
+            date_time_placed=datetime(2001, 5, 3, tzinfo=timezone.utc))
+        return order
+
+    def test_manage_partitions_command(self):
+        """Test the command creates future partitions and detaches old ones"""
+        partitions.create_partition(connection, date(2001, 5, 1))
+        self.old_order(4)
+        Order.objects.create(user=self.user, stock=self.stock, order_type='buy', quantity=1)
+
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(ORDER_ARCHIVE_DIR=directory):
+            out = StringIO()
+            call_command('manage_order_partitions', '--months-ahead', '6',
+                         '--retain-months', '12', stdout=out)
+
+        self.assertIn('Archived 1 orders', out.getvalue())
+        self.assertEqual(PositionRollup.objects.get(user=self.user).buy_quantity, 4)
+        self.assertEqual(positions.net_quantity(self.user.id, self.stock.id), 5)
+        self.assertFalse(Order.objects.filter(quantity=4).exists())
+
+        attached = partitions.monthly_partitions(connection)
+        current = partitions.month_start(datetime.now(timezone.utc))
+        self.assertIn(partitions.add_months(current, 6), attached)
+        self.assertNotIn(date(2001, 5, 1), attached)
+
+    def test_partition_with_orders_is_not_detached(self):
+        """Test detaching refuses a partition whose orders have not been archived"""
+        partitions.create_partition(connection, date(2001, 5, 1))
+        self.old_order(4)
+
+        with self.assertRaises(partitions.PartitionNotEmpty):
+            partitions.detach_partition(connection, 'api_trades_order_p2001_05', drop=True)
+        self.assertIn(date(2001, 5, 1), partitions.monthly_partitions(connection))
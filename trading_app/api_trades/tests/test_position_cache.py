@@ -0,0 +1,144 @@
+"""
+Tests for the in-process position cache
+"""
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.test import TestCase
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api_trades import positions
+from api_trades.models import Order, Stock
+
+STATS_URL = reverse('orders:position-cache')
+
+
+class PositionCacheTests(TestCase):
+    """Test eviction, expiry and invalidation of cached positions"""
+
+    def setUp(self):
+        self.cache = positions.PositionCache('test', ttl=5, max_entries=2)
+        self.addCleanup(positions.caches.pop, 'test')
+        self.loads = []
+
+    def loader(self, user_id):
+        self.loads.append(user_id)
+        return {1: user_id * 10}
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.get(1, self.loader)
+        self.cache.get(2, self.loader)
+        self.cache.get(1, self.loader)
+        self.cache.get(3, self.loader)
+
+        self.cache.get(1, self.loader)
+        self.cache.get(2, self.loader)
+        self.assertEqual(self.loads, [1, 2, 3, 2])
+        stats = self.cache.stats()
+        self.assertEqual((stats['entries'], stats['evictions']), (2, 2))
+        self.assertEqual((stats['hits'], stats['misses']), (2, 4))
+        self.assertEqual(stats['hit_ratio'], 2 / 6)
+        self.assertGreater(stats['memory_bytes'], 0)
+
+    def test_entries_expire(self):
+        with mock.patch('api_trades.positions.time.monotonic', return_value=100):
+            self.cache.get(1, self.loader)
+        with mock.patch('api_trades.positions.time.monotonic', return_value=104):
+            self.cache.get(1, self.loader)
+        with mock.patch('api_trades.positions.time.monotonic', return_value=105):
+            self.cache.get(1, self.loader)
+
+        self.assertEqual(self.loads, [1, 1])
+        self.assertEqual(self.cache.stats()['expirations'], 1)
+
+    def test_other_version_is_reloaded(self):
+        self.cache.get(1, self.loader, version=1)
+        self.cache.get(1, self.loader, version=1)
+        self.cache.get(1, self.loader, version=2)
+        self.assertEqual(self.loads, [1, 1])
+
+    def test_invalidation(self):
+        self.cache.get(1, self.loader)
+        self.cache.get(2, lambda user_id: {2: 1})
+
+        self.cache.invalidate_stock(2)
+        self.cache.get(1, self.loader)
+        self.cache.get(2, self.loader)
+        self.cache.invalidate(1)
+        self.cache.get(1, self.loader)
+
+        self.assertEqual(self.loads, [1, 2, 1])
+        self.assertEqual(self.cache.stats()['invalidations'], 2)
+
+    def test_load_racing_invalidation_is_not_stored(self):
+        def loader(user_id):
+            self.cache.invalidate(user_id)
+            return self.loader(user_id)
+
+        self.cache.get(1, loader)
+        self.cache.get(1, self.loader)
+        self.assertEqual(self.loads, [1, 1])
+
+
+class PositionCacheApiTests(TestCase):
+    """Test positions are served from the cache and the stats endpoint"""
+
+    def setUp(self):
+        positions.invalidate()
+        User = get_user_model()
+        self.user = User.objects.create_user(
+            username='Testusername', email='test@example.com', password='testpass123')
+        self.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='testpass123')
+        self.stock = Stock.objects.create(name='Stock 1', price=Decimal('5.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def total_value(self):
+        res = self.client.get(reverse(
+            'orders:total_value_invested', kwargs={'stock_id': self.stock.id}))
+        return res.data['total_value']
+
+    def test_new_orders_invalidate(self):
+        Order.objects.create(user=self.user, stock=self.stock, order_type='buy', quantity=5)
+        self.assertEqual(self.total_value(), Decimal('25.00'))
+
+        hits = positions.position_cache.hits
+        self.assertEqual(self.total_value(), Decimal('25.00'))
+        self.assertEqual(positions.position_cache.hits, hits + 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(user=self.user, stock=self.stock, order_type='buy', quantity=2)
+        self.assertEqual(self.total_value(), Decimal('35.00'))
+
+    def test_deleting_a_stock_invalidates(self):
+        Order.objects.create(user=self.user, stock=self.stock, order_type='buy', quantity=5)
+        self.total_value()
+
+        self.client.force_authenticate(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse('orders:stock-detail', kwargs={'pk': self.stock.id}))
+
+        self.assertNotIn(self.user.id, positions.position_cache._entries)
+
+    def test_stats(self):
+        Order.objects.create(user=self.user, stock=self.stock, order_type='buy', quantity=5)
+        self.total_value()
+        self.total_value()
+
+        self.client.force_authenticate(self.admin)
+        res = self.client.get(STATS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        stats = {cache['name']: cache for cache in res.data}
+        self.assertEqual(stats['positions']['entries'], 1)
+        self.assertGreaterEqual(stats['positions']['hits'], 1)
+        self.assertIn('order_queue', stats)
+
+    def test_stats_are_for_superusers(self):
+        res = self.client.get(STATS_URL)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
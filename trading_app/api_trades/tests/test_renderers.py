@@ -0,0 +1,73 @@
+"""
+Tests for the MessagePack and CBOR formats
+"""
+import unittest
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.test import TestCase
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api_trades import catalogue
+from api_trades.models import Order, Stock
+from api_trades.renderers import cbor2, msgpack
+
+ORDERS_URL = reverse('orders:orders-list')
+PORTFOLIO_URL = reverse('orders:user-portfolio')
+STOCK_URL = reverse('orders:stock-list')
+
+
+class BinaryFormatTests(TestCase):
+    """Test negotiating binary request and response bodies"""
+
+    def setUp(self):
+        catalogue.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='Testusername', email='test@example.com', password='testpass123')
+        self.stock = Stock.objects.create(name='Stock 1', price=Decimal('5.99'))
+        self.client.force_authenticate(self.user)
+
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed')
+    def test_msgpack_order_round_trip(self):
+        """Test placing an order in MessagePack and reading the reply"""
+        payload = msgpack.packb({'stock': self.stock.id, 'order_type': 'buy', 'quantity': 5})
+        res = self.client.post(
+            ORDERS_URL, payload, content_type='application/msgpack',
+            HTTP_ACCEPT='application/msgpack')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res['Content-Type'], 'application/msgpack')
+        body = msgpack.unpackb(res.content)
+        self.assertEqual(body['quantity'], 5)
+        self.assertEqual(Order.objects.get().quantity, 5)
+
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed')
+    def test_msgpack_stock_list(self):
+        """Test the catalogue can be read as MessagePack"""
+        res = self.client.get(STOCK_URL, HTTP_ACCEPT='application/msgpack')
+
+        self.assertEqual(msgpack.unpackb(res.content), [
+            {'id': self.stock.id, 'name': 'Stock 1', 'price': '5.99',
+             'currency': 'USD', 'lot_size': 1}])
+
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed')
+    def test_msgpack_invalid_body(self):
+        """Test a malformed MessagePack body is a 400"""
+        res = self.client.post(ORDERS_URL, b'\xc1', content_type='application/msgpack')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @unittest.skipIf(cbor2 is None, 'cbor2 is not installed')
+    def test_cbor_portfolio(self):
+        """Test the portfolio can be read as CBOR"""
+        Order.objects.create(user=self.user, stock=self.stock, order_type='buy', quantity=2)
+
+        res = self.client.get(PORTFOLIO_URL, HTTP_ACCEPT='application/cbor')
+
+        self.assertEqual(res['Content-Type'], 'application/cbor')
+        self.assertEqual(cbor2.loads(res.content)['holdings'], [
+            {'stock': self.stock.id, 'stock_name': 'Stock 1', 'quantity': 2,
+             'total_value': '11.98', 'currency': 'USD'}])
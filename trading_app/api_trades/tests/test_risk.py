@@ -0,0 +1,120 @@
+"""
+Tests for pre-trade risk limits
+"""
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.urls import reverse
+from django.test import TestCase, override_settings
+
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from api_trades import jobs, risk
+from api_trades.models import ExchangeRate, Order, RiskCounter, RiskLimit, Stock
+
+ORDERS_URL = reverse('orders:orders-list')
+
+
+class RiskLimitTests(TestCase):
+    """Test orders are checked against limits and counters"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='Testusername', email='test@example.com', password='testpass123')
+        self.client.force_authenticate(self.user)
+        self.stock = Stock.objects.create(name='Stock 1', price=Decimal('2.00'))
+        self.other = Stock.objects.create(name='Stock 2', price=Decimal('1.00'))
+
+    def place(self, stock, quantity, order_type='buy'):
+        return self.client.post(
+            ORDERS_URL, {'stock': stock.id, 'order_type': order_type, 'quantity': quantity})
+
+    def test_no_limits(self):
+        res = self.place(self.stock, 1000)
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    def test_max_position(self):
+        RiskLimit.objects.create(user=self.user, max_position=10)
+
+        self.assertEqual(self.place(self.stock, 8).status_code, status.HTTP_201_CREATED)
+        res = self.place(self.stock, 3)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('position to 11', str(res.data))
+        # Selling and other stocks are unaffected.
+        self.assertEqual(self.place(self.stock, 8, 'sell').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.place(self.other, 10).status_code, status.HTTP_201_CREATED)
+
+    def test_max_order_notional_in_reference_currency(self):
+        RiskLimit.objects.create(stock=self.stock, max_order_notional=Decimal('100.00'))
+        pounds = Stock.objects.create(name='Stock 3', price=Decimal('2.00'), currency='GBP')
+        RiskLimit.objects.create(stock=pounds, max_order_notional=Decimal('100.00'))
+        ExchangeRate.objects.create(currency='GBP', rate=Decimal('1.25'))
+
+        self.assertEqual(self.place(self.stock, 50).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.place(self.stock, 51).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.place(pounds, 40).status_code, status.HTTP_201_CREATED)
+        res = self.place(pounds, 41)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('102.50 USD', str(res.data))
+
+    def test_strictest_limit_wins(self):
+        RiskLimit.objects.create(max_daily_volume=100)
+        RiskLimit.objects.create(user=self.user, max_daily_volume=20)
+
+        self.assertEqual(self.place(self.stock, 15).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.place(self.other, 6).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_daily_volume_per_stock(self):
+        RiskLimit.objects.create(user=self.user, stock=self.stock, max_daily_volume=10)
+
+        self.assertEqual(self.place(self.stock, 10).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.place(self.stock, 5, 'sell').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.place(self.other, 50).status_code, status.HTTP_201_CREATED)
+
+    @override_settings(RISK_DEFAULT_LIMITS={'max_daily_volume': 10})
+    def test_default_limits(self):
+        self.assertEqual(self.place(self.stock, 11).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_counters_follow_orders(self):
+        Order.objects.create(user=self.user, stock=self.stock, order_type='buy', quantity=4)
+        created = Order.objects.bulk_create([
+            Order(user=self.user, stock=self.other, order_type='buy', quantity=3)])
+        risk.record_orders(created)
+
+        self.assertEqual(risk.traded_today(self.user.id, self.stock.id), (4, 7))
+        self.assertEqual(risk.traded_today(self.user.id, self.other.id), (3, 7))
+
+    def test_batch_counts_its_earlier_orders(self):
+        RiskLimit.objects.create(user=self.user, max_daily_volume=10)
+        Order.objects.create(user=self.user, stock=self.stock, order_type='buy', quantity=4)
+        batch = risk.BatchCheck()
+
+        batch.check(self.user.id, self.stock, 'buy', 3)
+        with self.assertRaisesMessage(ValidationError, 'volume traded today to 11'):
+            batch.check(self.user.id, self.other, 'buy', 4)
+        batch.check(self.user.id, self.other, 'sell', 3)
+        with self.assertRaisesMessage(ValidationError, 'volume traded today to 11'):
+            batch.check(self.user.id, self.stock, 'buy', 1)
+
+    def test_counters_reset_daily(self):
+        RiskLimit.objects.create(user=self.user, max_daily_volume=10)
+        Order.objects.create(user=self.user, stock=self.stock, order_type='buy', quantity=10)
+        RiskCounter.objects.update(day=risk.today() - timedelta(days=1))
+
+        self.assertEqual(self.place(self.stock, 10).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(jobs.JOBS['reset_risk_counters']({}), (2, True))
+        self.assertEqual(RiskCounter.objects.filter(stock__isnull=True).get().volume, 10)
+
+    def test_benchmark_rolls_back(self):
+        out = StringIO()
+        call_command('benchmark_risk_checks', orders=5, history=20, stdout=out)
+
+        self.assertIn('added latency per order', out.getvalue())
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(RiskLimit.objects.exists())
@@ -0,0 +1,185 @@
+"""
+Tests for the background job scheduler
+"""
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from api_trades import jobs
+from api_trades.models import Job, JobRun, Order, Stock
+from api_trades.scheduler import Scheduler, next_run
+
+
+def count_to(checkpoint, target=3):
+    """Test job: one item per chunk until target."""
+    checkpoint['count'] = checkpoint.get('count', 0) + 1
+    Stock.objects.create(name=f'Stock {checkpoint["count"]}', price=Decimal('1.00'))
+    return 1, checkpoint['count'] >= target
+
+
+def fail_on_second_chunk(checkpoint):
+    """Test job: fails after committing its first chunk."""
+    if checkpoint.get('count'):
+        Stock.objects.create(name='Rolled back', price=Decimal('1.00'))
+        raise RuntimeError('boom')
+    checkpoint['count'] = 1
+    return 1, False
+
+
+TEST_JOBS = {
+    'count': {'interval': 3600, 'target': 3},
+    'fail': {'interval': 3600},
+}
+
+
+@override_settings(SCHEDULER_SLICE_SECONDS=3600, SCHEDULER_LEASE_SECONDS=60,
+                   SCHEDULER_RETRY_SECONDS=300)
+class SchedulerTests(TestCase):
+    """Test leases, checkpoints and run metrics"""
+
+    def setUp(self):
+        registry = mock.patch.dict(jobs.JOBS, {'count': count_to, 'fail': fail_on_second_chunk})
+        registry.start()
+        self.addCleanup(registry.stop)
+        self.scheduler = Scheduler(jobs=TEST_JOBS, worker='worker-1')
+        self.scheduler.sync()
+
+    def test_unknown_job_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            Scheduler(jobs={'missing': {}})
+
+    def test_next_run_at_time(self):
+        now = datetime(2024, 5, 1, 12, 30, tzinfo=dt_timezone.utc)
+        self.assertEqual(next_run({'at': '13:00'}, now), now.replace(hour=13, minute=0))
+        self.assertEqual(next_run({'at': '00:00'}, now), datetime(2024, 5, 2, tzinfo=dt_timezone.utc))
+        self.assertEqual(next_run({'interval': 60}, now), now + timedelta(seconds=60))
+
+    def test_only_one_worker_holds_a_job(self):
+        other = Scheduler(jobs=TEST_JOBS, worker='worker-2')
+        first = self.scheduler.claim('count')
+        self.assertEqual(first.lease_owner, 'worker-1')
+        self.assertIsNone(other.claim('count'))
+
+    def test_expired_lease_can_be_taken_over(self):
+        self.scheduler.claim('count')
+        Job.objects.filter(name='count').update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        other = Scheduler(jobs=TEST_JOBS, worker='worker-2')
+        self.assertEqual(other.claim('count').lease_owner, 'worker-2')
+
+    def test_run_to_completion(self):
+        run = self.scheduler.run_job(self.scheduler.claim('count'))
+
+        self.assertEqual(run.status, JobRun.SUCCEEDED)
+        self.assertEqual((run.chunks, run.items), (3, 3))
+        self.assertGreater(run.duration_seconds, 0)
+        self.assertEqual(Stock.objects.count(), 3)
+        job = Job.objects.get(name='count')
+        self.assertIsNone(job.lease_owner)
+        self.assertEqual(job.checkpoint, {})
+        self.assertGreater(job.next_run_at, timezone.now() + timedelta(minutes=59))
+
+    @override_settings(SCHEDULER_SLICE_SECONDS=0)
+    def test_slices_resume_from_checkpoint(self):
+        run = self.scheduler.run_job(self.scheduler.claim('count'))
+        self.assertEqual(run.status, JobRun.RUNNING)
+        job = Job.objects.get(name='count')
+        self.assertEqual(job.checkpoint, {'count': 1})
+        self.assertIsNone(job.lease_owner)
+        self.assertLessEqual(job.next_run_at, timezone.now())
+
+        other = Scheduler(jobs=TEST_JOBS, worker='worker-2')
+        runs = other.run_pending('count')
+        self.assertEqual(runs[-1].pk, run.pk)
+        self.assertEqual(runs[-1].status, JobRun.SUCCEEDED)
+        self.assertEqual(runs[-1].items, 3)
+        self.assertEqual(Stock.objects.count(), 3)
+
+    def test_failure_keeps_checkpoint(self):
+        with self.assertLogs('api_trades.scheduler', 'ERROR'):
+            run = self.scheduler.run_job(self.scheduler.claim('fail'))
+
+        self.assertEqual(run.status, JobRun.FAILED)
+        self.assertIn('boom', run.error)
+        self.assertFalse(Stock.objects.filter(name='Rolled back').exists())
+        job = Job.objects.get(name='fail')
+        self.assertEqual(job.checkpoint, {'count': 1})
+        self.assertIsNone(job.lease_owner)
+        self.assertGreater(job.next_run_at, timezone.now())
+
+    def test_lost_lease_rolls_back_chunk(self):
+        job = self.scheduler.claim('count')
+        Job.objects.filter(pk=job.pk).update(lease_owner='worker-2')
+
+        with self.assertLogs('api_trades.scheduler', 'WARNING'):
+            run = self.scheduler.run_job(job)
+
+        self.assertEqual(run.status, JobRun.RUNNING)
+        self.assertEqual(run.chunks, 0)
+        self.assertEqual(Stock.objects.count(), 0)
+
+    def test_run_pending_only_runs_due_jobs(self):
+        Job.objects.filter(name='fail').update(next_run_at=timezone.now() + timedelta(hours=1))
+        runs = self.scheduler.run_pending()
+        self.assertEqual([run.job.name for run in runs], ['count'])
+        self.assertEqual(self.scheduler.run_pending(), [])
+
+
+class BulkOrderJobTests(TestCase):
+    """Test the bulk order import job and command"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='Testusername', email='test@example.com', password='testpass123')
+        self.stock = Stock.objects.create(name='Stock 1', price=Decimal('5.00'))
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.csv_file = Path(self.tmpdir.name) / 'bulk_order.csv'
+        self.csv_file.write_text(
+            'user_id,stock_id,order_type,quantity\n'
+            f'{self.user.id},{self.stock.id},buy,10\n'
+            f'{self.user.id},{self.stock.id},sell,4\n'
+            f'{self.user.id},{self.stock.id},sell,50\n'
+        )
+
+    def test_job_runs_in_chunks(self):
+        config = {'place_bulk_order': {'at': '00:00', 'csv_file': str(self.csv_file), 'batch_size': 1}}
+        scheduler = Scheduler(jobs=config)
+        scheduler.sync()
+
+        with self.assertLogs('api_trades.jobs', 'WARNING') as logs:
+            runs = scheduler.run_pending('place_bulk_order')
+
+        self.assertIn('does not have enough stock', logs.output[0])
+        self.assertEqual(runs[-1].status, JobRun.SUCCEEDED)
+        self.assertEqual(runs[-1].items, 3)
+        self.assertEqual(runs[-1].chunks, 3)
+        self.assertEqual(
+            list(Order.objects.order_by('id').values_list('order_type', 'quantity')),
+            [('buy', 10), ('sell', 4)],
+        )
+
+    def test_command_reads_given_file(self):
+        out = StringIO()
+        call_command('place_bulk_order', str(self.csv_file), stdout=out)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertIn('does not have enough stock', out.getvalue())
+
+    def test_run_scheduler_command(self):
+        config = {'place_bulk_order': {'at': '00:00', 'csv_file': str(self.csv_file)}}
+        out = StringIO()
+        with override_settings(SCHEDULER_JOBS=config), self.assertLogs('api_trades.jobs', 'WARNING'):
+            call_command('run_scheduler', job='place_bulk_order', stdout=out)
+            call_command('run_scheduler', status=True, stdout=out)
+
+        self.assertIn('place_bulk_order: succeeded, 3 items in 1 chunks', out.getvalue())
+        self.assertIn('1 runs, 0 failures', out.getvalue())
+        self.assertEqual(Order.objects.count(), 2)
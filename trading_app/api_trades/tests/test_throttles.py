@@ -0,0 +1,127 @@
+"""
+Tests for rate limiting and in-flight caps on the trade endpoints
+"""
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.urls import reverse
+from django.test import TestCase, override_settings
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api_trades.models import Stock
+from api_trades.throttles import PortfolioThrottle, TokenBucketThrottle
+
+ARCHIVE_URL = reverse('orders:archived-orders')
+ORDERS_URL = reverse('orders:orders-list')
+PORTFOLIO_URL = reverse('orders:user-portfolio')
+STOCK_URL = reverse('orders:stock-list')
+
+
+class ThrottleTests(TestCase):
+    """Test the per-user token buckets"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='Testusername', email='test@example.com', password='testpass123')
+        self.stock = Stock.objects.create(name='Stock 1', price=Decimal('5.99'))
+        self.client.force_authenticate(self.user)
+
+    def set_rates(self, **rates):
+        """Override throttle rates for the duration of a test"""
+        patcher = mock.patch.dict(TokenBucketThrottle.THROTTLE_RATES, rates)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_portfolio_throttled(self):
+        """Test exceeding the portfolio budget returns 429 with Retry-After"""
+        self.set_rates(portfolio='2/minute')
+
+        self.assertEqual(self.client.get(PORTFOLIO_URL).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(PORTFOLIO_URL).status_code, status.HTTP_200_OK)
+        res = self.client.get(PORTFOLIO_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreater(int(res['Retry-After']), 0)
+
+    def test_archive_throttled(self):
+        """Test reading archived orders has its own budget"""
+        self.set_rates(archive='1/minute')
+
+        self.assertEqual(self.client.get(ARCHIVE_URL).status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            self.client.get(ARCHIVE_URL).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(self.client.get(PORTFOLIO_URL).status_code, status.HTTP_200_OK)
+
+    def test_order_budget_only_counts_writes(self):
+        """Test listing orders does not use the order placement budget"""
+        self.set_rates(orders='1/minute')
+
+        for _ in range(3):
+            self.assertEqual(self.client.get(ORDERS_URL).status_code, status.HTTP_200_OK)
+        payload = {'stock': self.stock.id, 'order_type': 'buy', 'quantity': 1}
+        self.assertEqual(self.client.post(ORDERS_URL, payload).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            self.client.post(ORDERS_URL, payload).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_budgets_are_per_user(self):
+        """Test one user's usage does not throttle another"""
+        self.set_rates(catalogue='1/minute')
+        self.client.get(STOCK_URL)
+        self.assertEqual(self.client.get(STOCK_URL).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        other = get_user_model().objects.create_user(
+            username='OtherUser', email='other@example.com', password='testpass123')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(STOCK_URL).status_code, status.HTTP_200_OK)
+
+    def bucket(self, scope, rate, now):
+        """Return a throttle for scope at rate with its clock stopped at now"""
+        self.set_rates(**{scope: rate})
+        throttle = PortfolioThrottle()
+        throttle.timer = lambda: now
+        return throttle
+
+    def test_bucket_refills(self):
+        """Test tokens come back at the budget's average rate"""
+        request = mock.Mock(user=self.user)
+        throttle = self.bucket('portfolio', '2/minute', 1000.0)
+        self.assertTrue(throttle.allow_request(request, None))
+        self.assertTrue(throttle.allow_request(request, None))
+        self.assertFalse(throttle.allow_request(request, None))
+        self.assertEqual(throttle.wait(), 30)
+
+        throttle.timer = lambda: 1030.0
+        self.assertTrue(throttle.allow_request(request, None))
+        self.assertFalse(throttle.allow_request(request, None))
+
+    def test_concurrent_requests_cannot_overspend(self):
+        """Test requests that read the bucket at once spend separate tokens"""
+        request = mock.Mock(user=self.user)
+        throttle = self.bucket('portfolio', '1/minute', 1000.0)
+        # Both requests read the bucket before either has updated it.
+        stale = throttle.cache.get
+        with mock.patch.object(throttle.cache, 'get', lambda key, default=None: default):
+            allowed = [throttle.allow_request(request, None) for _ in range(2)]
+        self.assertEqual(allowed, [True, False])
+        self.assertEqual(stale(throttle.key), 1_060_000_000)
+
+    @override_settings(MAX_IN_FLIGHT_REQUESTS_PER_USER=2)
+    def test_in_flight_cap(self):
+        """Test requests beyond the in-flight cap are rejected and the counter released"""
+        key = f'in_flight_{self.user.pk}'
+        cache.set(key, 2)
+
+        res = self.client.get(PORTFOLIO_URL)
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['Retry-After'], '1')
+        self.assertEqual(cache.get(key), 2)
+
+        cache.set(key, 1)
+        self.assertEqual(self.client.get(PORTFOLIO_URL).status_code, status.HTTP_200_OK)
+        self.assertEqual(cache.get(key), 1)
@@ -0,0 +1,143 @@
+"""
+Tests for currencies, lot sizes and minor-unit valuation
+"""
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.test import TestCase
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api_trades import positions, valuation
+from api_trades.models import ExchangeRate, Order, Stock
+
+ORDERS_URL = reverse('orders:orders-list')
+PORTFOLIO_URL = reverse('orders:user-portfolio')
+
+
+def total_value_url(stock_id):
+    """Return the total value invested URL for a stock"""
+    return reverse('orders:total_value_invested', kwargs={'stock_id': stock_id})
+
+
+class ConversionTests(TestCase):
+    """Test integer currency conversion"""
+
+    rates = {'USD': valuation.RATE_SCALE, 'GBP': 125_000_000, 'JPY': 666_667}
+
+    def test_same_currency_is_unchanged(self):
+        self.assertEqual(valuation.convert(12345, 'GBP', 'GBP', self.rates), 12345)
+
+    def test_rounds_half_away_from_zero(self):
+        # 0.01 GBP is 0.0125 USD and -0.03 GBP is -0.0375 USD
+        self.assertEqual(valuation.convert(1, 'GBP', 'USD', self.rates), 1)
+        self.assertEqual(valuation.convert(-3, 'GBP', 'USD', self.rates), -4)
+        self.assertEqual(valuation.convert(2, 'GBP', 'USD', self.rates), 3)
+
+    def test_cross_rate(self):
+        self.assertEqual(valuation.convert(100_00, 'GBP', 'JPY', self.rates), 18_749_99)
+
+    def test_missing_rate(self):
+        with self.assertRaises(valuation.MissingRate):
+            valuation.convert(100, 'EUR', 'USD', self.rates)
+
+    def test_to_decimal(self):
+        self.assertEqual(valuation.to_decimal(-1999), Decimal('-19.99'))
+        self.assertEqual(valuation.to_decimal(10 ** 20), Decimal('1000000000000000000.00'))
+
+
+class ValuationAPITests(TestCase):
+    """Test multi-currency portfolio valuation"""
+
+    def setUp(self):
+        positions.invalidate()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='Testusername', email='test@example.com', password='testpass123')
+        self.client.force_authenticate(self.user)
+        self.usd = Stock.objects.create(name='Stock 1', price=Decimal('0.10'))
+        self.gbp = Stock.objects.create(
+            name='Stock 2', price=Decimal('3.33'), currency='GBP', lot_size=100)
+        ExchangeRate.objects.create(currency='GBP', rate=Decimal('1.25'))
+
+    def test_price_minor_is_generated(self):
+        self.gbp.refresh_from_db()
+        self.assertEqual(self.gbp.price_minor, 333)
+
+        Stock.objects.filter(id=self.gbp.id).update(price=Decimal('1234.56'))
+        self.gbp.refresh_from_db()
+        self.assertEqual(self.gbp.price_minor, 123456)
+
+    def test_order_must_be_whole_lots(self):
+        res = self.client.post(
+            ORDERS_URL, {'stock': self.gbp.id, 'order_type': 'buy', 'quantity': 150})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('quantity', res.data)
+
+        res = self.client.post(
+            ORDERS_URL, {'stock': self.gbp.id, 'order_type': 'buy', 'quantity': 200})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+    def test_sums_are_exact(self):
+        # 0.10 * 3 would be 0.30000000000000004 in floating point
+        Order.objects.create(user=self.user, stock=self.usd, order_type='buy', quantity=3)
+
+        res = self.client.get(total_value_url(self.usd.id))
+
+        self.assertEqual(res.data['total_value'], Decimal('0.30'))
+        self.assertEqual(res.data['currency'], 'USD')
+
+    def test_portfolio_in_base_currency(self):
+        Order.objects.create(user=self.user, stock=self.usd, order_type='buy', quantity=3)
+        Order.objects.create(user=self.user, stock=self.gbp, order_type='buy', quantity=100)
+
+        res = self.client.get(PORTFOLIO_URL, {'base': 'USD'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['base_currency'], 'USD')
+        self.assertEqual(res.data['total_value'], Decimal('416.55'))
+        self.assertEqual(
+            [(row['currency'], row['total_value'], row['base_value']) for row in res.data['holdings']],
+            [('USD', '0.30', '0.30'), ('GBP', '333.00', '416.25')],
+        )
+
+    def test_limited_portfolio_totals_every_currency(self):
+        Order.objects.create(user=self.user, stock=self.usd, order_type='buy', quantity=3)
+        Order.objects.create(user=self.user, stock=self.gbp, order_type='buy', quantity=100)
+
+        res = self.client.get(PORTFOLIO_URL, {'base': 'USD', 'order_by': '-value', 'limit': 1})
+
+        self.assertEqual([row['currency'] for row in res.data['holdings']], ['GBP'])
+        self.assertEqual(
+            [(row['currency'], row['total_value']) for row in res.data['totals']],
+            [('GBP', '333.00'), ('USD', '0.30')],
+        )
+        self.assertEqual(res.data['total_value'], Decimal('416.55'))
+
+    def test_total_value_in_base_currency(self):
+        Order.objects.create(user=self.user, stock=self.gbp, order_type='buy', quantity=100)
+
+        res = self.client.get(total_value_url(self.gbp.id), {'base': 'USD'})
+
+        self.assertEqual(res.data['total_value'], Decimal('333.00'))
+        self.assertEqual(res.data['base_value'], Decimal('416.25'))
+
+    def test_missing_rate_is_rejected(self):
+        Order.objects.create(user=self.user, stock=self.gbp, order_type='buy', quantity=100)
+
+        res = self.client.get(PORTFOLIO_URL, {'base': 'EUR'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('base', res.data)
+
+    def test_rate_change_invalidates_portfolio(self):
+        Order.objects.create(user=self.user, stock=self.gbp, order_type='buy', quantity=100)
+        res = self.client.get(PORTFOLIO_URL, {'base': 'USD'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ExchangeRate.objects.filter(currency='GBP').delete()
+        again = self.client.get(PORTFOLIO_URL, {'base': 'USD'}, HTTP_IF_NONE_MATCH=res['ETag'])
+
+        self.assertEqual(again.status_code, status.HTTP_400_BAD_REQUEST)
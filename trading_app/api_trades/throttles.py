@@ -0,0 +1,143 @@
+"""
+Per-user rate limits and in-flight request caps for the trade endpoints.
+
+Rates are configured per scope in REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']
+as 'number/period'. Each is enforced as a token bucket holding `number`
+tokens that refills at number / period per second, so clients may burst
+up to the full budget and are then held to the average rate. Buckets and
+in-flight counters live in the Django cache.
+
+A bucket is stored as the time at which it would be full again, in
+microseconds (the generic cell rate algorithm). Each request moves that
+time on by one token's worth with an atomic cache.incr and is allowed if
+it stays within one period of now, so concurrent requests in different
+workers can never spend the same token. Buckets are keyed on the rate as
+well, so changing a rate starts everyone with a full bucket.
+"""
+from django.conf import settings
+from rest_framework.exceptions import Throttled
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """Token bucket keyed on the authenticated user (or client IP)."""
+    cache_format = 'throttle_bucket_%(scope)s_%(rate)s_%(ident)s'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        rate = f'{self.num_requests}-{self.duration}'
+        return self.cache_format % {'scope': self.scope, 'rate': rate, 'ident': ident}
+
+    def applies_to(self, request):
+        """Return False for requests this throttle ignores."""
+        return True
+
+    def allow_request(self, request, view):
+        if self.rate is None or not self.applies_to(request):
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        period = int(self.duration * 1_000_000)
+        interval = period // self.num_requests
+        # A bucket left alone for a period is full, so it may expire then.
+        timeout = 2 * self.duration
+        now = int(self.timer() * 1_000_000)
+
+        self.cache.add(self.key, now, timeout)
+        # A bucket that has refilled starts again from now. If another request
+        # moves it on in between, both steps count and the later request is
+        # refused: never more tokens than the budget.
+        step = max(now - self.cache.get(self.key, now), 0) + interval
+        try:
+            full_at = self.cache.incr(self.key, step)
+        except ValueError:
+            self.cache.set(self.key, now + interval, timeout)
+            return True
+
+        if full_at - now > period:
+            try:
+                self.cache.decr(self.key, step)
+            except ValueError:
+                pass
+            self.wait_seconds = (full_at - step + interval - period - now) / 1_000_000
+            return False
+
+        self.cache.touch(self.key, timeout)
+        return True
+
+    def wait(self):
+        return getattr(self, 'wait_seconds', None)
+
+
+class OrderWriteThrottle(TokenBucketThrottle):
+    """Budget for placing orders."""
+    scope = 'orders'
+
+    def applies_to(self, request):
+        return request.method not in SAFE_METHODS
+
+
+class PortfolioThrottle(TokenBucketThrottle):
+    """Budget for portfolio and valuation reads."""
+    scope = 'portfolio'
+
+
+class CatalogueThrottle(TokenBucketThrottle):
+    """Budget for reading the stock catalogue."""
+    scope = 'catalogue'
+
+    def applies_to(self, request):
+        return request.method in SAFE_METHODS
+
+
+class ArchiveThrottle(TokenBucketThrottle):
+    """Budget for reading archived orders, which are decompressed per request."""
+    scope = 'archive'
+
+
+class InFlightLimitMixin:
+    """
+    DRF view mixin capping how many requests a user may have running at
+    once (MAX_IN_FLIGHT_REQUESTS_PER_USER). Counters expire so a worker
+    that dies mid-request cannot lock a user out for long.
+    """
+    in_flight_timeout = 60
+
+    def _in_flight_key(self, request):
+        return f'in_flight_{request.user.pk}'
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        limit = settings.MAX_IN_FLIGHT_REQUESTS_PER_USER
+        if not limit or not request.user.is_authenticated:
+            return
+
+        key = self._in_flight_key(request)
+        throttles = SimpleRateThrottle.cache
+        throttles.add(key, 0, timeout=self.in_flight_timeout)
+        try:
+            running = throttles.incr(key)
+        except ValueError:
+            throttles.set(key, 1, timeout=self.in_flight_timeout)
+            running = 1
+        self._in_flight_key_held = key
+
+        if running > limit:
+            raise Throttled(
+                wait=1,
+                detail='Too many concurrent requests. Expected available in 1 second.'
+            )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        key = getattr(self, '_in_flight_key_held', None)
+        if key is not None:
+            self._in_flight_key_held = None
+            try:
+                SimpleRateThrottle.cache.decr(key)
+            except ValueError:
+                pass
+        return super().finalize_response(request, response, *args, **kwargs)
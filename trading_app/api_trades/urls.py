@@ -21,6 +21,12 @@ urlpatterns += [
         views.TotalValueInvestedView.as_view(),
         name='total_value_invested'),
     path('portfolio/', views.PortfolioView.as_view(), name='user-portfolio'),
+    path('portfolio/value/', views.PortfolioValueView.as_view(), name='portfolio-value'),
+    path('analytics/', views.AnalyticsView.as_view(), name='analytics'),
+    path('events/', views.EventFeedView.as_view(), name='events'),
+    path('position_cache/', views.PositionCacheStatsView.as_view(), name='position-cache'),
+    path('archive/', views.ArchivedOrdersView.as_view(), name='archived-orders'),
+    path('queue/<str:ticket>/', views.QueuedOrderView.as_view(), name='queued-order'),
 ]
 
 app_name = 'orders'
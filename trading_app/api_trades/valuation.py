@@ -0,0 +1,51 @@
+"""
+Exact valuation in integer minor units.
+
+Quantities are multiplied by Stock.price_minor and summed as integers;
+to_decimal turns the result back into a Decimal only for serialization.
+Conversion between currencies goes through ExchangeRate, scaled to
+integers, and rounds half away from zero to the minor unit.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+
+from api_trades.models import MINOR_UNITS_PER_UNIT, ExchangeRate
+
+RATE_SCALE = 10 ** 8
+CENTS = Decimal('0.01')
+
+
+class MissingRate(Exception):
+    """No exchange rate is known for a currency."""
+
+
+def to_decimal(minor):
+    """Return an amount in minor units as a Decimal in currency units."""
+    return (Decimal(int(minor)) / MINOR_UNITS_PER_UNIT).quantize(CENTS)
+
+
+def scaled_rates():
+    """Return {currency: value in the reference currency * RATE_SCALE}."""
+    rates = {
+        currency: int(rate * RATE_SCALE)
+        for currency, rate in ExchangeRate.objects.values_list('currency', 'rate')
+    }
+    rates.setdefault(settings.FX_REFERENCE_CURRENCY, RATE_SCALE)
+    return rates
+
+
+def convert(minor, from_currency, to_currency, rates):
+    """Convert an amount in minor units from one currency to another."""
+    if from_currency == to_currency:
+        return minor
+    for currency in (from_currency, to_currency):
+        if currency not in rates:
+            raise MissingRate(currency)
+
+    numerator = abs(minor) * rates[from_currency]
+    denominator = rates[to_currency]
+    quotient, remainder = divmod(numerator, denominator)
+    if remainder * 2 >= denominator:
+        quotient += 1
+    return quotient if minor >= 0 else -quotient
@@ -1,27 +1,65 @@
 '''Views for api trades'''
-from django.shortcuts import get_object_or_404
+from datetime import date, timedelta
+from functools import partial
 
-from drf_spectacular.utils import extend_schema_view, extend_schema
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
 
-from rest_framework import generics, viewsets, mixins
+from rest_framework import generics, viewsets, mixins, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, ValidationError
+
+from trading_app.middleware import accepted_encodings
+from trading_app.routers import ReplicaReadMixin
+from trading_app.schema import extend_schema_view, extend_schema, OpenApiParameter
+from user.authentication import ExpiringTokenAuthentication
 
+from api_trades import (
+    analytics, archive, caching, catalogue, filters, holdings, order_queue, outbox, portfolio,
+    positions, valuation
+)
 from api_trades.models import Order, Stock
+from api_trades.pagination import ArchivedOrderPagination
+from api_trades.permissions import IsSuperUser
+from api_trades.renderers import PARSER_CLASSES, RENDERER_CLASSES
+from api_trades.throttles import (
+    ArchiveThrottle,
+    CatalogueThrottle,
+    InFlightLimitMixin,
+    OrderWriteThrottle,
+    PortfolioThrottle
+)
 from api_trades.serializers import (
+    AnalyticsQuerySerializer,
+    ArchivedOrderSerializer,
+    CurrencyTotalSerializer,
     OrderSerializer,
     StockSerializer,
     EmptySerializer,
-    PortfolioSerializer
+    EventFeedQuerySerializer,
+    OrderFilterSerializer,
+    OrderSummarySerializer,
+    OutboxEventSerializer,
+    PortfolioQuerySerializer,
+    PortfolioSerializer,
+    PortfolioValueSerializer,
+    PositionCacheStatsSerializer,
+    QueuedOrderSerializer
 )
 
 @extend_schema_view(
     list=extend_schema(
         summary="List all orders",
-        description="Retrieve a list of all orders placed by the authenticated user."
+        description="Retrieve a list of all orders placed by the authenticated user, \
+            optionally filtered by stock, side, quantity range and date range.",
+        parameters=[OrderFilterSerializer],
     ),
     create=extend_schema(
         summary="Create a new order",
@@ -29,6 +67,8 @@ from api_trades.serializers import (
     ),
 )
 class OrdersViewSet(
+    InFlightLimitMixin,
+    ReplicaReadMixin,
     viewsets.GenericViewSet,
     mixins.CreateModelMixin,
     mixins.ListModelMixin,
@@ -36,22 +76,93 @@ class OrdersViewSet(
     """View for managing orders"""
     serializer_class = OrderSerializer
     queryset = Order.objects.all()
-    authentication_classes =[TokenAuthentication]
+    authentication_classes = [ExpiringTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = [OrderWriteThrottle]
+    renderer_classes = RENDERER_CLASSES
+    parser_classes = PARSER_CLASSES
 
     def get_queryset(self):
-        queryset = self.queryset
-        return queryset.filter(user=self.request.user)
+        queryset = self.queryset.filter(user=self.request.user)
+        if self.action in ('list', 'summary'):
+            query = OrderFilterSerializer(data=self.request.query_params)
+            query.is_valid(raise_exception=True)
+            queryset = filters.filter_orders(queryset, query.validated_data)
+        return queryset
+
+    @extend_schema(
+        summary="Summarize orders per day",
+        description="Order counts and buy, sell and total quantities per stock per day, \
+            newest day first. Accepts the same filters as the order list.",
+        parameters=[OrderFilterSerializer],
+        responses=OrderSummarySerializer(many=True),
+    )
+    @action(detail=False, methods=['get'], url_path='orders/summary', url_name='summary')
+    def summary(self, request):
+        """
+        Gets the user's order counts and volumes grouped by day and stock
+        """
+        rows = filters.daily_summary(self.get_queryset())
+        return Response(OrderSummarySerializer(rows, many=True).data)
+
+    def create(self, request, *args, **kwargs):
+        """
+        Place an order. With the order queue enabled the order is accepted
+        and queued, and the response points at its status endpoint.
+        """
+        if not order_queue.enabled():
+            return super().create(request, *args, **kwargs)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ticket = order_queue.accept(request.user, serializer.validated_data)
+        status_url = reverse('orders:queued-order', kwargs={'ticket': ticket})
+        return Response(
+            {'ticket': ticket, 'status': order_queue.PENDING, 'status_url': status_url},
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': status_url},
+        )
 
     def perform_create(self, serializer):
         # Adds the user to the create.
         serializer.save(user=self.request.user)
 
 
+class QueuedOrderView(APIView):
+    """
+    API view to check on an order accepted through the order queue.
+    """
+    authentication_classes = [ExpiringTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    serializer_class = QueuedOrderSerializer
+
+    @extend_schema(
+        summary="Get a queued order's status",
+        description="Retrieve the status of an order accepted through the order queue: \
+            pending, done (with the persisted order id) or rejected (with the reason)."
+    )
+    def get(self, request, ticket):
+        """
+        Gets the status of a queued order
+        """
+        row = order_queue.get_queue().get(ticket)
+        if row is None or row['user_id'] != request.user.id:
+            raise Http404
+        serializer = self.serializer_class(dict(row))
+        return Response(serializer.data)
+
+
 @extend_schema_view(
     list=extend_schema(
         summary="List all stocks",
-        description="Retrieve a list of all available stocks."
+        description="Retrieve a list of all available stocks.",
+        parameters=[
+            OpenApiParameter(
+                'search',
+                str,
+                description="Only return stocks whose name starts with this value (case-insensitive)."
+            ),
+        ]
     ),
     retrieve=extend_schema(
         summary="Retrieve a stock",
@@ -74,46 +185,98 @@ class OrdersViewSet(
         description="Delete an existing stock."
     ),
 )
-class StockViewSet(viewsets.ModelViewSet):
+class StockViewSet(InFlightLimitMixin, ReplicaReadMixin, viewsets.ModelViewSet):
     '''viewset for the stock endpoints'''
     serializer_class = StockSerializer
     queryset = Stock.objects.all()
-    authentication_classes =[TokenAuthentication]
+    authentication_classes = [ExpiringTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = [CatalogueThrottle]
+    renderer_classes = RENDERER_CLASSES
+    parser_classes = PARSER_CLASSES
 
     def get_queryset(self):
         queryset = self.queryset
         return queryset
 
+    @caching.conditional(caching.catalogue_etag, caching.catalogue_last_modified)
+    def list(self, request, *args, **kwargs):
+        """List stocks from the cached catalogue rather than the database."""
+        snapshot = catalogue.get_catalogue()
+
+        search = request.query_params.get('search')
+        if search:
+            return Response(snapshot.search(search))
+
+        response = Response(snapshot.rows)
+        if request.accepted_renderer.format == 'json' and 'indent' not in request.accepted_media_type:
+            # Serve the pre-rendered body, skipping the renderer entirely.
+            encodings = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+            if encodings.get('gzip', 0) > 0:
+                response.content = snapshot.compressed
+                response['Content-Encoding'] = 'gzip'
+                # The gzipped body is not byte-for-byte the one the ETag names.
+                response['ETag'] = f'W/{caching.catalogue_etag(request)}'
+            else:
+                response.content = snapshot.content
+            response['Content-Type'] = request.accepted_renderer.media_type
+            patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+    @caching.conditional(caching.stock_etag, caching.stock_last_modified)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         """Handle the creation of a new Stock instance."""
         if self.request.user.is_superuser:
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
+                transaction.on_commit(catalogue.refresh)
         else:
             raise PermissionDenied("Only superusers can create stocks.")
 
     def perform_update(self, serializer):
         """Handle the update of an existing Stock instance."""
         if self.request.user.is_superuser:
-            serializer.save()
+            before = serializer.instance.price, serializer.instance.currency
+            with transaction.atomic():
+                stock = serializer.save()
+                if (stock.price, stock.currency) != before:
+                    # Only the stock's holders need revaluing.
+                    holdings.reprice(stock.id)
+                # After stock_changed's version bump, which is queued first.
+                transaction.on_commit(catalogue.refresh)
         else:
             raise PermissionDenied("Only superusers can update stocks.")
 
     def perform_destroy(self, instance):
         """Handle the deletion of a Stock instance."""
         if self.request.user.is_superuser:
-            instance.delete()
+            stock_id = instance.id
+            with transaction.atomic():
+                user_ids = holdings.holders(stock_id)
+                instance.delete()
+                # The stock's holdings went with it; value its holders without them.
+                holdings.revalue(user_ids)
+                transaction.on_commit(catalogue.refresh)
+                # Positions in the stock went with its orders.
+                transaction.on_commit(partial(positions.invalidate_stock, stock_id))
         else:
             raise PermissionDenied("Only superusers can update stocks.")
 
 class TotalValueInvestedView(
+    InFlightLimitMixin,
+    ReplicaReadMixin,
     generics.GenericAPIView
 ):
     """
     API view to get the total value invested in a specific stock by the authenticated user.
     """
-    authentication_classes =[TokenAuthentication]
+    authentication_classes = [ExpiringTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = [PortfolioThrottle]
+    renderer_classes = RENDERER_CLASSES
     serializer_class = EmptySerializer # prevents throwing error in console.
 
     @extend_schema(
@@ -128,91 +291,272 @@ class TotalValueInvestedView(
         """
         stock = get_object_or_404(Stock, id=stock_id)
 
-        # Get all buy orders
-        buy_orders = Order.objects.filter(
-            user=request.user, stock=stock, order_type='buy')
-        total_buy_value = sum(order.quantity * stock.price for order in buy_orders)
+        # Net holding across archived and live orders, from this process's
+        # cache while the user's positions version is unchanged
+        version = caching.get_version(caching.positions_key(request.user.id))
+        held = positions.position_cache.get(request.user.id, version=version)
+        net_quantity = held.get(stock.id, 0)
 
-        # Get all sell orders
-        sell_orders = Order.objects.filter(
-            user=request.user, stock=stock, order_type='sell')
-        total_sell_value = sum(order.quantity * stock.price for order in sell_orders)
+        # Calculate net total value invested in minor units
+        value_minor = net_quantity * stock.price_minor
+        data = {'total_value': valuation.to_decimal(value_minor), 'currency': stock.currency}
 
-        # Calculate net total value invested
-        net_total_value = total_buy_value - total_sell_value
+        base = request.query_params.get('base')
+        if base:
+            try:
+                base_minor = valuation.convert(
+                    value_minor, stock.currency, base, valuation.scaled_rates())
+            except valuation.MissingRate as e:
+                raise ValidationError({'base': f'No exchange rate for {e.args[0]}.'})
+            data.update(base_currency=base, base_value=valuation.to_decimal(base_minor))
 
-        return Response({'total_value': net_total_value})
+        return Response(data)
 
 
-class PortfolioView(APIView):
+class PortfolioView(InFlightLimitMixin, ReplicaReadMixin, APIView):
     """
     API view to return the user's portfolio with the total quantity and value of each stock.
     """
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [ExpiringTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = [PortfolioThrottle]
+    renderer_classes = RENDERER_CLASSES
     serializer_class = PortfolioSerializer
 
     @extend_schema(
         summary="Get user's portfolio",
         description="Retrieve the portfolio of the authenticated user,\
-            showing the total quantity and value of each stock they hold."
+            showing the total quantity and value of each stock they hold, optionally \
+            only for some stocks, sorted and limited, with totals over every position.",
+        parameters=[PortfolioQuerySerializer],
     )
+    @caching.conditional(caching.portfolio_etag, caching.portfolio_last_modified)
     def get(self, request):
         """
         Gets portfolio of user
         """
-        user = request.user
-
-        # Retrieve all orders for the user
-        orders = Order.objects.filter(user=user)
-
-        # Dictionary to store total quantities and values for each stock
-        stock_summary = {}
-
-        # Process each order
-        for order in orders:
-            stock_id = order.stock.id
-            stock_name = order.stock.name
-            quantity = order.quantity
-
-            if stock_id not in stock_summary:
-                stock_summary[stock_id] = {
-                    'stock_name': stock_name,
-                    'total_buy_quantity': 0,
-                    'total_sell_quantity': 0,
-                    'net_quantity': 0,
-                    'total_value': 0
-                }
-
-            if order.order_type == 'buy':
-                stock_summary[stock_id]['total_buy_quantity'] += quantity
-            elif order.order_type == 'sell':
-                stock_summary[stock_id]['total_sell_quantity'] += quantity
-
-        # Compute net quantities and values
-        for stock_id, summary in stock_summary.items():
-            summary['net_quantity'] = summary['total_buy_quantity'] - summary['total_sell_quantity']
-            if summary['net_quantity'] > 0:
-                summary['total_value'] = summary['net_quantity'] * Stock.objects.get(id=stock_id).price
+        query = PortfolioQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        # Repeated queries are answered from this process's cache while the
+        # user's positions, prices and rates are unchanged.
+        data = portfolio.portfolio_cache.get(
+            request.user.id,
+            caching.portfolio_query(query.validated_data),
+            loader=partial(self.load, request.user.id, query.validated_data),
+            version=caching.portfolio_version(request),
+        )
+        return Response(data)
+
+    def load(self, user_id, params):
+        """Return the response data for a validated portfolio query."""
+        base = params.get('base')
+
+        rates = None
+        if base or params['order_by'].lstrip('-') == 'value':
+            rates = valuation.scaled_rates()
+
+        # One query groups the user's orders by stock, sorts, limits and
+        # totals them; values stay in integer minor units until serialization
+        rows, count, totals = portfolio.portfolio(
+            user_id, params.get('stocks'), params['order_by'], params.get('limit'), rates)
+
+        if base:
+            try:
+                for row in rows:
+                    row['base_value'] = valuation.to_decimal(valuation.convert(
+                        row['value_minor'], row['currency'], base, rates))
+                base_total = sum(
+                    valuation.convert(value_minor, currency, base, rates)
+                    for currency, value_minor in totals.items()
+                )
+            except valuation.MissingRate as e:
+                raise ValidationError({'base': f'No exchange rate for {e.args[0]}.'})
+
+        for row in rows:
+            row['total_value'] = valuation.to_decimal(row['value_minor'])
+
+        data = {
+            'positions': count,
+            'totals': CurrencyTotalSerializer([
+                {'currency': currency, 'total_value': valuation.to_decimal(value_minor)}
+                for currency, value_minor in sorted(totals.items())
+            ], many=True).data,
+            'holdings': self.serializer_class(rows, many=True).data,
+        }
+        if base:
+            data.update(base_currency=base, total_value=valuation.to_decimal(base_total))
+        return data
+
+
+class PortfolioValueView(InFlightLimitMixin, APIView):
+    """
+    API view to return the precomputed value of the user's portfolio in each currency.
+    """
+    authentication_classes = [ExpiringTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [PortfolioThrottle]
+    renderer_classes = RENDERER_CLASSES
+    serializer_class = PortfolioValueSerializer
+
+    @extend_schema(
+        summary="Get user's portfolio value",
+        description="Retrieve the value of the authenticated user's holdings in each currency,\
+            as last recomputed after one of their orders or a price change."
+    )
+    def get(self, request):
+        """
+        Gets the cached valuation of the user's portfolio
+        """
+        valuation_row = holdings.valuation(request.user.id)
+        totals = valuation_row.totals if valuation_row else {}
+        data = {
+            'totals': [
+                {'currency': currency, 'total_value': valuation.to_decimal(value_minor)}
+                for currency, value_minor in sorted(totals.items())
+            ],
+            'updated_at': valuation_row.updated_at if valuation_row else None,
+        }
+        return Response(self.serializer_class(data).data)
+
+
+class ArchivedOrdersView(generics.ListAPIView):
+    """
+    API view to list the user's orders that have been moved to the archive.
+    """
+    authentication_classes = [ExpiringTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    serializer_class = ArchivedOrderSerializer
+    pagination_class = ArchivedOrderPagination
+    throttle_classes = [ArchiveThrottle]
+
+    def get_queryset(self):
+        """The user's archived orders in archive order, read a page at a time."""
+        return archive.ArchivedOrders(self.request.user.id)
+
+    @extend_schema(
+        summary="List archived orders",
+        description="Retrieve the authenticated user's orders that have been moved \
+            out of the orders table by archive_orders, read from the archive files. \
+            Paginated with limit (default 100, at most 1000) and offset."
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
+class AnalyticsView(ReplicaReadMixin, APIView):
+    """
+    API view for superusers to aggregate orders by stock, user, side or day,
+    answered from the columnar snapshot built by the refresh_analytics job.
+    """
+    authentication_classes = [ExpiringTokenAuthentication]
+    permission_classes = [IsSuperUser]
+    serializer_class = AnalyticsQuerySerializer
+
+    @extend_schema(
+        summary="Order analytics",
+        description="Volume, order counts, buy/sell imbalance and notional value \
+            grouped by stock, user, side or day, from a periodically refreshed snapshot.",
+        parameters=[AnalyticsQuerySerializer],
+    )
+    def get(self, request):
+        """
+        Gets aggregated order statistics
+        """
+        query = self.serializer_class(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        snapshot = analytics.current_snapshot()
+        if snapshot is None:
+            return Response(
+                {'detail': 'The analytics snapshot has not been built yet.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        groups = snapshot.group_by(
+            params['group_by'],
+            since=params.get('since'),
+            until=params.get('until'),
+            user_id=params.get('user'),
+            stock_id=params.get('stock'),
+        )
+        rows = analytics.report(groups, params['sort'], params['limit'])
+        self.label(params['group_by'], rows)
+
+        return Response({
+            'snapshot_at': snapshot.taken_at,
+            'orders': len(snapshot),
+            'group_by': params['group_by'],
+            'results': rows,
+        })
+
+    def label(self, group_by, rows):
+        """Replace each row's group key with named fields."""
+        keys = [row['key'] for row in rows]
+        if group_by == 'stock':
+            names = dict(Stock.objects.filter(id__in=keys).values_list('id', 'name'))
+        elif group_by == 'user':
+            names = dict(User.objects.filter(id__in=keys).values_list('id', 'username'))
+
+        for row in rows:
+            key = row.pop('key')
+            if group_by == 'stock':
+                row.update(stock_id=key, stock_name=names.get(key))
+            elif group_by == 'user':
+                row.update(user_id=key, username=names.get(key))
+            elif group_by == 'side':
+                row['order_type'] = 'buy' if key else 'sell'
             else:
-                # If no net quantity, set total value to 0
-                summary['total_value'] = 0
-
-        # Filter out stocks with no net quantity
-        portfolio_with_value = [
-            {
-                'stock_name': summary['stock_name'],
-                'quantity': summary['net_quantity'],
-                'total_value': summary['total_value']
-            }
-            for summary in stock_summary.values()
-            if summary['net_quantity'] > 0
-        ]
+                row['date'] = date(1970, 1, 1) + timedelta(days=key)
 
-        if not portfolio_with_value:
-            return Response({
-                'message': 'You currently have no stocks in your portfolio'}, status=200)
 
-        # Serialize the data
-        serializer = self.serializer_class(portfolio_with_value, many=True)
-        return Response(serializer.data)
+class EventFeedView(APIView):
+    """
+    API view for downstream systems to read order and stock changes from
+    the outbox in sequence order.
+    """
+    authentication_classes = [ExpiringTokenAuthentication]
+    permission_classes = [IsSuperUser]
+    serializer_class = EventFeedQuerySerializer
+
+    @extend_schema(
+        summary="Change feed",
+        description="Order and stock change events numbered after `after`, oldest first. \
+            With `wait` the request is held for up to that many seconds until an event \
+            is committed. Pass the returned `next` as `after` to read on.",
+        parameters=[EventFeedQuerySerializer],
+    )
+    def get(self, request):
+        """
+        Gets the next batch of events
+        """
+        query = self.serializer_class(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        events = outbox.wait_for_events(params['after'], params['limit'], params['wait'])
+        return Response({
+            'events': OutboxEventSerializer(events, many=True).data,
+            'next': events[-1].seq if events else params['after'],
+        })
+
+
+class PositionCacheStatsView(APIView):
+    """
+    API view showing how well this worker's position caches are doing.
+    """
+    authentication_classes = [ExpiringTokenAuthentication]
+    permission_classes = [IsSuperUser]
+    serializer_class = PositionCacheStatsSerializer
+
+    @extend_schema(
+        summary="Position cache statistics",
+        description="Size, hit ratio, evictions and approximate memory use of the \
+            in-process position caches of the worker answering the request.",
+        responses=PositionCacheStatsSerializer(many=True),
+    )
+    def get(self, request):
+        """
+        Gets the stats of every position cache in this process
+        """
+        stats = [cache.stats() for cache in positions.caches.values()]
+        return Response(self.serializer_class(stats, many=True).data)
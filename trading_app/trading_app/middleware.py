@@ -0,0 +1,132 @@
+"""
+Response compression negotiated from Accept-Encoding, and request
+profiling.
+
+Brotli is preferred when the optional brotli package is installed and the
+client accepts it, otherwise gzip is used. Bodies smaller than
+COMPRESSION_MIN_SIZE bytes are sent as they are. Both encodings add up to
+max_random_bytes of random padding, as GZipMiddleware does, to mitigate
+BREACH-style attacks that recover secrets from the compressed length.
+"""
+import secrets
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from rest_framework.exceptions import APIException
+
+from trading_app import profiling
+from user.authentication import ExpiringTokenAuthentication
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+
+def accepted_encodings(header):
+    """Return {coding: q} for an Accept-Encoding header."""
+    encodings = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        encodings[coding.strip().lower()] = quality
+    return encodings
+
+
+def compress_brotli(content, quality, max_random_bytes=0):
+    """
+    Brotli-compress content. With max_random_bytes, a metadata block of
+    1 to max_random_bytes (at most 256) random bytes, which decoders skip,
+    is inserted before the end of the stream.
+    """
+    compressor = brotli.Compressor(quality=quality)
+    # flush() ends on a byte boundary, where a metadata block can start.
+    compressed = compressor.process(content) + compressor.flush()
+    if max_random_bytes:
+        length = secrets.randbelow(min(max_random_bytes, 256)) + 1
+        # ISLAST=0, MNIBBLES=0 (metadata), reserved bit, MSKIPBYTES=1 and
+        # MSKIPLEN-1, packed least significant bit first into two bytes.
+        header = 0b010110 | (length - 1) << 6
+        compressed += header.to_bytes(2, 'little') + secrets.token_bytes(length)
+    return compressed + compressor.finish()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """GZipMiddleware with brotli support and a configurable size threshold."""
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        encodings = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if (
+            brotli is None
+            or response.streaming
+            or encodings.get('br', 0) <= 0
+            or encodings.get('br', 0) < encodings.get('gzip', 0)
+        ):
+            if encodings.get('gzip', 0) <= 0:
+                patch_vary_headers(response, ('Accept-Encoding',))
+                return response
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        compressed_content = compress_brotli(
+            response.content, settings.BROTLI_QUALITY, self.max_random_bytes)
+        if len(compressed_content) >= len(response.content):
+            return response
+        response.content = compressed_content
+        response.headers['Content-Length'] = str(len(response.content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
+
+
+def is_superuser(request):
+    """
+    Return whether the request comes from a superuser, logged in to the
+    admin or sending a token. The API views authenticate tokens themselves,
+    after the middleware has run.
+    """
+    if request.user.is_authenticated:
+        return request.user.is_superuser
+    try:
+        authenticated = ExpiringTokenAuthentication().authenticate(request)
+    except APIException:
+        return False
+    return authenticated is not None and authenticated[0].is_superuser
+
+
+class ProfilingMiddleware:
+    """
+    Profile requests a superuser sends with ?_profile=1, see
+    trading_app/profiling.py. The response names the profile's files in an
+    X-Profile header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.GET.get('_profile') != '1' or not is_superuser(request):
+            return self.get_response(request)
+
+        with profiling.profile(f'{request.method}{request.path}') as result:
+            response = self.get_response(request)
+        if result.paths:
+            response['X-Profile'] = result.paths['pstats'].stem
+        return response
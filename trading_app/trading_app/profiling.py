@@ -0,0 +1,175 @@
+"""
+Opt-in profiling of management commands, scheduled jobs and requests.
+
+`python manage.py <command> --profile`, `'profile': True` on a job in
+SCHEDULER_JOBS and `?_profile=1` on a superuser's request (see
+ProfilingMiddleware) each run the work under profile(), which writes
+three files to PROFILE_DIR sharing one name:
+
+- <name>.pstats, cProfile statistics for `python -m pstats` or snakeviz,
+- <name>.collapsed, stacks sampled every PROFILE_SAMPLE_INTERVAL seconds
+  in the folded format read by flamegraph.pl and speedscope,
+- <name>.sql, every query run, with its duration and database alias.
+
+Only the thread that started the profile is profiled, and one profile
+runs at a time per process; work started while another profile is
+running goes unprofiled.
+"""
+import cProfile
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_active = threading.Lock()
+
+
+def profile_dir():
+    return Path(settings.PROFILE_DIR)
+
+
+def frame_label(code):
+    """Return a frame's name in collapsed stacks; semicolons separate frames."""
+    return f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})'.replace(';', ':')
+
+
+class StackSampler(threading.Thread):
+    """Count the stacks of one thread, sampled every interval seconds."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_sampling = threading.Event()
+
+    def run(self):
+        while not self._stop_sampling.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_sampling.set()
+        self.join()
+
+
+class QueryLog:
+    """execute_wrapper recording each query's alias, duration and SQL."""
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((self.alias, time.perf_counter() - started, sql, params))
+
+
+class Profile:
+    """The output of one profile(); paths is None if it did not run."""
+    paths = None
+
+
+def _write(name, profiler, sampler, query_logs):
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = {
+        'pstats': directory / f'{name}.pstats',
+        'collapsed': directory / f'{name}.collapsed',
+        'sql': directory / f'{name}.sql',
+    }
+    profiler.dump_stats(paths['pstats'])
+
+    paths['collapsed'].write_text(
+        ''.join(f'{stack} {count}\n' for stack, count in sampler.stacks.most_common()),
+        encoding='utf-8')
+
+    queries = [query for log in query_logs for query in log.queries]
+    total = sum(duration for _, duration, _, _ in queries)
+    lines = [f'-- {len(queries)} queries in {total * 1000:.3f} ms\n']
+    lines += [
+        f'-- {duration * 1000:.3f} ms on {alias}, params {params!r}\n{sql};\n'
+        for alias, duration, sql, params in queries
+    ]
+    paths['sql'].write_text(''.join(lines), encoding='utf-8')
+    return paths
+
+
+@contextmanager
+def profile(label):
+    """
+    Profile the block, writing its output to PROFILE_DIR under a name made
+    from label. Yields a Profile whose paths are set once the block exits.
+    """
+    result = Profile()
+    if not _active.acquire(blocking=False):
+        logger.warning('Not profiling %s: another profile is running', label)
+        yield result
+        return
+
+    try:
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+        name = f'{re.sub(r"[^A-Za-z0-9_.-]+", "-", label).strip("-")}-{stamp}-{os.getpid()}'
+        query_logs = []
+        sampler = StackSampler(threading.get_ident(), settings.PROFILE_SAMPLE_INTERVAL)
+        profiler = cProfile.Profile()
+
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    query_logs.append(QueryLog(connection.alias))
+                    stack.enter_context(connection.execute_wrapper(query_logs[-1]))
+                sampler.start()
+                profiler.enable()
+                try:
+                    yield result
+                finally:
+                    profiler.disable()
+                    sampler.stop()
+        finally:
+            # Written even when the block fails, which is often when it is wanted.
+            result.paths = _write(name, profiler, sampler, query_logs)
+            logger.info('Profile of %s written to %s', label, result.paths['pstats'])
+    finally:
+        _active.release()
+
+
+class ProfiledCommand(BaseCommand):
+    """BaseCommand with a --profile option that runs handle() under profile()."""
+
+    def create_parser(self, prog_name, subcommand, **kwargs):
+        self._name = subcommand
+        parser = super().create_parser(prog_name, subcommand, **kwargs)
+        parser.add_argument(
+            '--profile', action='store_true',
+            help='Write cProfile stats, sampled stacks and a SQL log to PROFILE_DIR')
+        return parser
+
+    def execute(self, *args, **options):
+        if not options.get('profile'):
+            return super().execute(*args, **options)
+        with profile(f'command-{self._name}') as result:
+            output = super().execute(*args, **options)
+        if result.paths:
+            self.stderr.write(f'Profile written to {result.paths["pstats"].with_suffix("")}.*')
+        return output
@@ -0,0 +1,105 @@
+"""
+Database routing for read replicas.
+
+Reads go to the primary unless a view opts in with ReplicaReadMixin. Views
+that opt in send safe-method requests to a replica, except while the
+requesting user (or the stock catalogue) is pinned to the primary after a
+write, so clients always read their own writes. A replica's connection is
+checked at most once every REPLICA_CHECK_SECONDS per worker, and a replica
+that cannot be reached is skipped for REPLICA_RETRY_SECONDS.
+"""
+import contextvars
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import DatabaseError
+from rest_framework.permissions import SAFE_METHODS
+
+CATALOGUE_PIN = 'trading_app:pin:catalogue'
+
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+
+
+def user_pin(user_id):
+    """pin key for a user's own writes"""
+    return f'trading_app:pin:user:{user_id}'
+
+
+def pin_to_primary(key):
+    """Send reads guarded by key to the primary for a short while."""
+    cache.set(key, True, timeout=settings.READ_YOUR_WRITES_SECONDS)
+
+
+def is_pinned(*keys):
+    """Return True if any of the keys was pinned recently."""
+    return bool(cache.get_many(keys))
+
+
+class ReplicaRouter:
+    """Route reads to a healthy replica when the current request allows it."""
+
+    def __init__(self):
+        self._down_until = {}
+        self._up_until = {}
+        self._lock = threading.Lock()
+
+    def _healthy(self, alias):
+        now = time.monotonic()
+        with self._lock:
+            if self._down_until.get(alias, 0) > now:
+                return False
+            if self._up_until.get(alias, 0) > now:
+                return True
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            with self._lock:
+                self._down_until[alias] = time.monotonic() + settings.REPLICA_RETRY_SECONDS
+            return False
+        with self._lock:
+            self._up_until[alias] = time.monotonic() + settings.REPLICA_CHECK_SECONDS
+        return True
+
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get():
+            return DEFAULT_DB_ALIAS
+        replicas = list(settings.DATABASE_REPLICAS)
+        random.shuffle(replicas)
+        for alias in replicas:
+            if self._healthy(alias):
+                return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+
+class ReplicaReadMixin:
+    """
+    DRF view mixin allowing safe-method requests to read from a replica.
+    Runs after authentication so the requesting user's pin can be checked.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method in SAFE_METHODS
+            and not is_pinned(CATALOGUE_PIN, user_pin(request.user.id))
+        ):
+            self._replica_token = _replica_reads.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            _replica_reads.reset(token)
+            self._replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,24 @@
+"""
+drf_spectacular's schema decorators for the views, or stand-ins that leave
+the views unchanged when drf_spectacular is not installed (as in
+settings_production), so workers serving a pre-generated schema never
+import it.
+"""
+from django.conf import settings
+
+if 'drf_spectacular' in settings.INSTALLED_APPS:
+    from drf_spectacular.utils import OpenApiParameter, extend_schema, extend_schema_view
+else:
+    class OpenApiParameter:
+        """Accepts and ignores the arguments of drf_spectacular's OpenApiParameter."""
+
+        def __init__(self, *args, **kwargs):
+            pass
+
+    def extend_schema(*args, **kwargs):
+        return lambda view: view
+
+    def extend_schema_view(**kwargs):
+        return lambda view: view
+
+__all__ = ['OpenApiParameter', 'extend_schema', 'extend_schema_view']
@@ -14,6 +14,8 @@ from pathlib import Path
 import os
 from urllib.parse import urlparse
 
+from trading_app.database import database_from_url
+
 # if os.path.exists("env.py"):
 #     import env
 
@@ -62,21 +64,26 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework.authtoken',
     'drf_spectacular',
-    'django_crontab',
     'api_trades',
     'user',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'trading_app.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'trading_app.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Responses smaller than this many bytes are not compressed.
+COMPRESSION_MIN_SIZE = 1024
+BROTLI_QUALITY = 4
+
 ROOT_URLCONF = 'trading_app.urls'
 
 TEMPLATES = [
@@ -100,14 +107,53 @@ WSGI_APPLICATION = 'trading_app.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+# Configured from DATABASE_URL, see trading_app/database.py. PostgreSQL uses
+# a psycopg 3 connection pool unless DATABASE_POOL=False, in which case
+# connections persist for CONN_MAX_AGE seconds.
 
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_from_url(os.environ.get('DATABASE_URL'), BASE_DIR, os.environ),
 }
 
+# Read replicas, as a comma separated list of urls. Safe-method requests to
+# the trade endpoints read from a replica unless the user wrote within the
+# last READ_YOUR_WRITES_SECONDS; see trading_app/routers.py.
+DATABASE_REPLICAS = []
+
+for index, replica_url in enumerate(
+        filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), start=1):
+    alias = f'replica_{index}'
+    DATABASES[alias] = database_from_url(replica_url.strip(), BASE_DIR, os.environ)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['trading_app.routers.ReplicaRouter']
+READ_YOUR_WRITES_SECONDS = 5
+REPLICA_RETRY_SECONDS = 30
+REPLICA_CHECK_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Conditional GET versions are stored in the cache, so deployments running
+# more than one worker process must point REDIS_URL at a shared instance.
+
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -161,12 +207,136 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # Per-user token buckets, see api_trades/throttles.py. A rate of n/period
+    # allows bursts of n requests refilled at n per period.
+    'DEFAULT_THROTTLE_RATES': {
+        'orders': '30/second',
+        'portfolio': '20/second',
+        'catalogue': '50/second',
+        'archive': '30/minute',
+    },
 }
 
+# Auth tokens, see user/authentication.py. Tokens expire TOKEN_TTL_SECONDS
+# after they are issued; workers trust a token they have checked for
+# TOKEN_CACHE_SECONDS (or until the user is saved), remembering up to
+# TOKEN_CACHE_MAX_ENTRIES of them, and pick up revocations from other
+# workers within TOKEN_REVOCATION_REFRESH_SECONDS.
+TOKEN_TTL_SECONDS = int(os.environ.get('TOKEN_TTL_SECONDS', 7 * 24 * 60 * 60))
+TOKEN_CACHE_SECONDS = 60
+TOKEN_CACHE_MAX_ENTRIES = 10000
+TOKEN_REVOCATION_REFRESH_SECONDS = 5
+TOKEN_REVOCATION_RELOAD_SECONDS = 60 * 60
+
+# Requests a single user may have running at once on the trade endpoints.
+MAX_IN_FLIGHT_REQUESTS_PER_USER = 8
+
 SPECTACULAR_SETTINGS = {
     'COMPONENT_SPLIT_REQUEST': True,
 }
 
-CRONJOBS = [
-    ('0 0 * * *', 'django.core.management.call_command', ['place_bulk_order']),
-]
+# Serve /api/schema/ from this file (see settings_production.py) instead of
+# generating the schema on each request.
+API_SCHEMA_FILE = os.environ.get('API_SCHEMA_FILE')
+
+# Order queue
+# When enabled, order creation returns 202 with a ticket and the order is
+# persisted by `python manage.py process_order_queue`.
+
+ORDER_QUEUE_ENABLED = os.environ.get('ORDER_QUEUE_ENABLED', 'False') == 'True'
+ORDER_QUEUE_PATH = os.environ.get('ORDER_QUEUE_PATH', BASE_DIR / 'data' / 'order_queue.sqlite3')
+ORDER_QUEUE_BATCH_SIZE = 500
+# Seconds a worker holds the batch it is persisting; a batch must be
+# committed within it, and a crashed worker's batch is retried after it.
+ORDER_QUEUE_LEASE = 60
+
+# Binary journal of every persisted order, see api_trades/journal.py.
+# Disabled unless a path is given.
+ORDER_JOURNAL_PATH = os.environ.get('ORDER_JOURNAL_PATH')
+
+# Where archive_orders writes old orders, see api_trades/archive.py.
+ORDER_ARCHIVE_DIR = os.environ.get('ORDER_ARCHIVE_DIR', BASE_DIR / 'data' / 'archive')
+
+# Currency that ExchangeRate.rate is quoted in; portfolios can be valued in
+# any currency with a rate, see api_trades/valuation.py.
+FX_REFERENCE_CURRENCY = 'USD'
+
+# Limits applied to every user's orders on top of the RiskLimit rows, see
+# api_trades/risk.py. None disables a limit; max_order_notional is in
+# FX_REFERENCE_CURRENCY and max_daily_volume caps a user's total quantity
+# traded per UTC day.
+RISK_DEFAULT_LIMITS = {
+    'max_position': None,
+    'max_order_notional': None,
+    'max_daily_volume': None,
+}
+
+# Where `python manage.py relay_outbox <name>` publishes order and stock
+# events, see api_trades/outbox.py. A sink is any class with a
+# publish(events) method.
+OUTBOX_SINKS = {
+    'file': {
+        'BACKEND': 'api_trades.outbox.FileSink',
+        'OPTIONS': {'path': BASE_DIR / 'data' / 'outbox' / 'events.ndjson'},
+    },
+    'broker': {
+        'BACKEND': 'api_trades.outbox.BrokerSink',
+        'OPTIONS': {'directory': BASE_DIR / 'data' / 'outbox' / 'broker'},
+    },
+}
+# Longest /api/trades/events/ holds a request waiting for new events, and
+# how often it checks for them meanwhile. Each waiting request occupies a
+# worker thread.
+OUTBOX_LONG_POLL_SECONDS = 20
+OUTBOX_POLL_SECONDS = 0.5
+
+# Worker processes used to hash passwords when provisioning users in bulk,
+# see user/provisioning.py.
+PROVISIONING_HASH_WORKERS = int(os.environ.get('PROVISIONING_HASH_WORKERS', os.cpu_count() or 1))
+# Rows accepted by /api/user/bulk_create/, which hashes them in the request
+# (about half a second each with the default hasher); larger files go
+# through the bulk_create_users command.
+PROVISIONING_MAX_ROWS = 20
+
+# Where refresh_analytics publishes the columnar order snapshot served by
+# /api/trades/analytics/, see api_trades/analytics.py.
+ANALYTICS_DIR = os.environ.get('ANALYTICS_DIR', BASE_DIR / 'data' / 'analytics')
+
+# Where `--profile` on a management command, 'profile': True on a scheduled
+# job and ?_profile=1 on a superuser's request write cProfile stats, sampled
+# stacks and SQL logs, see trading_app/profiling.py.
+PROFILE_DIR = os.environ.get('PROFILE_DIR', BASE_DIR / 'data' / 'profiles')
+PROFILE_SAMPLE_INTERVAL = 0.005
+
+# Seconds a worker trusts its in-memory copy of a user's positions, and how
+# many users' positions each cache keeps before evicting the least recently
+# used, see api_trades/positions.py.
+POSITION_CACHE_TTL = 5
+POSITION_CACHE_MAX_ENTRIES = 10000
+
+# The same for whole portfolio responses, one entry per user and query, see
+# api_trades/portfolio.py.
+PORTFOLIO_CACHE_TTL = 5
+PORTFOLIO_CACHE_MAX_ENTRIES = 10000
+
+# CSV file read by place_bulk_order.
+BULK_ORDER_CSV = os.environ.get('BULK_ORDER_CSV', BASE_DIR / 'data' / 'bulk_order.csv')
+
+# Background jobs run by `python manage.py run_scheduler`, see
+# api_trades/scheduler.py. Each job runs daily at 'at' (UTC, HH:MM) or every
+# 'interval' seconds, and is profiled (see PROFILE_DIR) when 'profile' is
+# True; any other keys are passed to the job in api_trades/jobs.py.
+SCHEDULER_JOBS = {
+    'place_bulk_order': {'at': '00:00'},
+    'manage_order_partitions': {'at': '01:00', 'months_ahead': 3},
+    'refresh_analytics': {'interval': 15 * 60},
+    'purge_tokens': {'at': '03:00'},
+    'reset_risk_counters': {'at': '00:00'},
+    # 'archive_orders': {'at': '02:00', 'days': 365},
+}
+# A job's lease must outlast its slowest chunk.
+SCHEDULER_LEASE_SECONDS = 300
+SCHEDULER_SLICE_SECONDS = 60
+SCHEDULER_RETRY_SECONDS = 300
+SCHEDULER_POLL_SECONDS = 5
+SCHEDULER_CONCURRENCY = 2
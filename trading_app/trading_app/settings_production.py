@@ -0,0 +1,32 @@
+"""
+Production settings for trading_app project.
+
+Use with DJANGO_SETTINGS_MODULE=trading_app.settings_production. Compared
+with the development settings this turns DEBUG off, drops the browsable
+API and drf_spectacular, and serves the OpenAPI schema from a file
+generated at build time instead of building it on request:
+
+    python manage.py spectacular --file schema.yml
+    API_SCHEMA_FILE=schema.yml
+"""
+import os
+
+from trading_app.settings import *  # noqa: F401,F403
+from trading_app.settings import INSTALLED_APPS, REST_FRAMEWORK
+
+DEBUG = False
+
+ALLOWED_HOSTS = [host for host in os.environ.get('ALLOWED_HOSTS', '').split(',') if host]
+
+# drf_spectacular is only needed to build the schema and serve Swagger UI.
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app != 'drf_spectacular']
+
+# The views take their schema decorators from trading_app.schema, which
+# does not import drf_spectacular without it; DRF's own schema class is
+# only imported if a view's schema is asked for.
+REST_FRAMEWORK = {
+    **{key: value for key, value in REST_FRAMEWORK.items() if key != 'DEFAULT_SCHEMA_CLASS'},
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+}
+
+API_SCHEMA_FILE = os.environ.get('API_SCHEMA_FILE')
@@ -0,0 +1,81 @@
+"""
+Tests for response compression
+"""
+import gzip
+import unittest
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from trading_app.middleware import CompressionMiddleware, accepted_encodings, brotli
+
+BODY = b'{"name": "stock", "price": "10.00"}' * 100
+
+
+def get_response(request):
+    """Return a compressible response with a strong ETag"""
+    response = HttpResponse(BODY, content_type='application/json')
+    response['ETag'] = '"abc"'
+    return response
+
+
+@override_settings(COMPRESSION_MIN_SIZE=1024)
+class CompressionMiddlewareTests(SimpleTestCase):
+    """Test negotiated gzip and brotli compression"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = CompressionMiddleware(get_response)
+
+    def test_accepted_encodings(self):
+        """Test q-values are parsed from Accept-Encoding"""
+        self.assertEqual(
+            accepted_encodings('gzip;q=0.5, br, identity;q=0'),
+            {'gzip': 0.5, 'br': 1.0, 'identity': 0.0})
+
+    def test_gzip(self):
+        """Test gzip is used when it is the only accepted encoding"""
+        response = self.middleware(self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip'))
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), BODY)
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    @unittest.skipIf(brotli is None, 'brotli is not installed')
+    def test_brotli_preferred(self):
+        """Test brotli is used when accepted"""
+        response = self.middleware(self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip, br'))
+
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), BODY)
+
+    @unittest.skipIf(brotli is None, 'brotli is not installed')
+    def test_compressed_length_is_padded(self):
+        """Test both encodings vary in length for the same body"""
+        for encoding in ('gzip', 'br'):
+            with self.subTest(encoding=encoding):
+                lengths = {
+                    len(self.middleware(
+                        self.factory.get('/', HTTP_ACCEPT_ENCODING=encoding)).content)
+                    for _ in range(10)
+                }
+                self.assertGreater(len(lengths), 1)
+
+    @unittest.skipIf(brotli is None, 'brotli is not installed')
+    def test_brotli_refused(self):
+        """Test br;q=0 falls back to gzip"""
+        response = self.middleware(self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip, br;q=0'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    @override_settings(COMPRESSION_MIN_SIZE=len(BODY) + 1)
+    def test_below_threshold(self):
+        """Test small responses are not compressed"""
+        response = self.middleware(self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip, br'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, BODY)
+
+    def test_identity(self):
+        """Test nothing is compressed without Accept-Encoding"""
+        response = self.middleware(self.factory.get('/'))
+        self.assertFalse(response.has_header('Content-Encoding'))
@@ -0,0 +1,106 @@
+"""
+Tests for profiling commands, jobs and requests
+"""
+import pstats
+import tempfile
+import time
+from io import StringIO
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.urls import reverse
+from django.test import TestCase, override_settings
+
+from rest_framework.test import APIClient
+
+from api_trades import positions
+from api_trades.scheduler import job_options
+from trading_app import profiling
+from user.authentication import issue_token
+
+PORTFOLIO_URL = reverse('orders:user-portfolio')
+
+
+class ProfilingTests(TestCase):
+    """Test profiles are written for commands, jobs and superusers' requests"""
+
+    def setUp(self):
+        positions.invalidate()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.settings = override_settings(
+            PROFILE_DIR=Path(self.tmpdir.name), PROFILE_SAMPLE_INTERVAL=0.001)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+    def files(self):
+        return sorted(path.suffix for path in Path(self.tmpdir.name).iterdir())
+
+    def test_profile(self):
+        with profiling.profile('test run') as result:
+            get_user_model().objects.count()
+            time.sleep(0.05)
+
+        self.assertEqual(self.files(), ['.collapsed', '.pstats', '.sql'])
+        self.assertTrue(result.paths['pstats'].name.startswith('test-run-'))
+        self.assertGreater(pstats.Stats(str(result.paths['pstats'])).total_calls, 0)
+
+        stacks = result.paths['collapsed'].read_text().splitlines()
+        self.assertTrue(stacks)
+        for line in stacks:
+            self.assertRegex(line, r'^[^;]+(;[^;]+)* \d+$')
+        self.assertTrue(any('test_profile' in line for line in stacks))
+
+        sql = result.paths['sql'].read_text()
+        self.assertTrue(sql.startswith('-- 1 queries in '))
+        self.assertIn('auth_user', sql)
+
+    def test_one_profile_at_a_time(self):
+        with profiling.profile('outer'), self.assertLogs('trading_app.profiling', 'WARNING'):
+            with profiling.profile('inner') as inner:
+                pass
+        self.assertIsNone(inner.paths)
+        self.assertEqual(len(self.files()), 3)
+
+    def test_command(self):
+        err = StringIO()
+        call_command('rebuild_holdings', profile=True, stdout=StringIO(), stderr=err)
+
+        self.assertIn('Profile written to', err.getvalue())
+        self.assertEqual(self.files(), ['.collapsed', '.pstats', '.sql'])
+        self.assertTrue(next(Path(self.tmpdir.name).iterdir()).name.startswith(
+            'command-rebuild_holdings-'))
+
+    def test_command_without_profile(self):
+        call_command('rebuild_holdings', stdout=StringIO())
+        self.assertEqual(self.files(), [])
+
+    def test_job_profile_setting_is_not_passed_to_the_job(self):
+        self.assertEqual(job_options({'at': '00:00', 'profile': True, 'days': 7}), {'days': 7})
+
+    def test_superuser_request(self):
+        admin = get_user_model().objects.create_superuser(
+            username='admin', email='admin@example.com', password='testpass123')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {issue_token(admin).key}')
+
+        res = client.get(PORTFOLIO_URL, {'_profile': 1})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertRegex(res['X-Profile'], r'^GET-api-trades-portfolio-\d')
+        self.assertEqual(self.files(), ['.collapsed', '.pstats', '.sql'])
+        sql = (Path(self.tmpdir.name) / f'{res["X-Profile"]}.sql').read_text()
+        self.assertIn('api_trades_order', sql)
+
+    def test_other_requests_are_not_profiled(self):
+        user = get_user_model().objects.create_user(
+            username='Testusername', email='test@example.com', password='testpass123')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {issue_token(user).key}')
+
+        res = client.get(PORTFOLIO_URL, {'_profile': 1})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('X-Profile', res)
+        self.assertEqual(self.files(), [])
@@ -0,0 +1,116 @@
+"""
+Tests for read replica routing
+"""
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.utils import OperationalError
+from django.urls import reverse
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from rest_framework.test import APIClient
+
+from api_trades.models import Order, Stock
+from trading_app import routers
+
+PORTFOLIO_URL = reverse('orders:user-portfolio')
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReplicaRouterTests(SimpleTestCase):
+    """Test the router's choice of database"""
+
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+        self.token = routers._replica_reads.set(True)
+
+    def tearDown(self):
+        routers._replica_reads.reset(self.token)
+
+    def test_primary_outside_replica_requests(self):
+        """Test reads default to the primary"""
+        routers._replica_reads.set(False)
+        self.assertEqual(self.router.db_for_read(Stock), DEFAULT_DB_ALIAS)
+
+    def test_replica_for_replica_requests(self):
+        """Test reads go to a healthy replica"""
+        with mock.patch.object(routers, 'connections') as connections:
+            self.assertEqual(self.router.db_for_read(Stock), 'replica_1')
+        connections['replica_1'].ensure_connection.assert_called()
+
+    def test_replica_health_is_reused(self):
+        """Test a healthy replica is not checked again on every read"""
+        with mock.patch.object(routers, 'connections') as connections:
+            for _ in range(3):
+                self.assertEqual(self.router.db_for_read(Stock), 'replica_1')
+        connections['replica_1'].ensure_connection.assert_called_once()
+
+    @override_settings(REPLICA_CHECK_SECONDS=0)
+    def test_replica_health_is_rechecked(self):
+        """Test a replica is checked again once REPLICA_CHECK_SECONDS pass"""
+        with mock.patch.object(routers, 'connections') as connections:
+            self.router.db_for_read(Stock)
+            connections['replica_1'].ensure_connection.side_effect = OperationalError
+            self.assertEqual(self.router.db_for_read(Stock), DEFAULT_DB_ALIAS)
+
+    def test_writes_use_primary(self):
+        """Test writes always go to the primary"""
+        self.assertEqual(self.router.db_for_write(Order), DEFAULT_DB_ALIAS)
+
+    def test_failover_to_primary(self):
+        """Test an unreachable replica is skipped and not retried immediately"""
+        with mock.patch.object(routers, 'connections') as connections:
+            connections['replica_1'].ensure_connection.side_effect = OperationalError
+            self.assertEqual(self.router.db_for_read(Stock), DEFAULT_DB_ALIAS)
+
+            connections['replica_1'].ensure_connection.reset_mock()
+            self.assertEqual(self.router.db_for_read(Stock), DEFAULT_DB_ALIAS)
+            connections['replica_1'].ensure_connection.assert_not_called()
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReplicaReadMixinTests(TestCase):
+    """Test which requests are allowed to read from a replica"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='Testusername', email='test@example.com', password='testpass123')
+        self.stock = Stock.objects.create(name='Stock 1', price=Decimal('5.99'))
+        self.client.force_authenticate(self.user)
+        # Creating the stock pinned the catalogue to the primary.
+        cache.clear()
+
+        self.replica_reads = []
+        patcher = mock.patch.object(
+            routers.ReplicaRouter, 'db_for_read', autospec=True,
+            side_effect=self.record_read)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def record_read(self, router, model, **hints):
+        """Record whether a read was allowed on a replica, then use the primary"""
+        self.replica_reads.append(routers._replica_reads.get())
+        return DEFAULT_DB_ALIAS
+
+    def test_safe_request_reads_replica(self):
+        """Test GET requests are routed to replicas"""
+        self.client.get(PORTFOLIO_URL)
+        self.assertTrue(self.replica_reads)
+        self.assertTrue(all(self.replica_reads))
+
+    def test_user_pinned_after_order(self):
+        """Test a user reads from the primary right after placing an order"""
+        Order.objects.create(user=self.user, stock=self.stock, order_type='buy', quantity=1)
+        self.assertTrue(routers.is_pinned(routers.user_pin(self.user.id)))
+
+        self.client.get(PORTFOLIO_URL)
+        self.assertFalse(any(self.replica_reads))
+
+    def test_replica_context_reset(self):
+        """Test the replica flag does not leak past the request"""
+        self.client.get(PORTFOLIO_URL)
+        self.assertFalse(routers._replica_reads.get())
@@ -0,0 +1,94 @@
+"""
+Tests for the production settings profile and startup checks
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from django.test import SimpleTestCase, override_settings
+
+from api_trades.management.commands.check_startup import BOOT_SCRIPT, parse_importtime
+from trading_app import settings_production
+from trading_app.views import _schema_content, schema_file_view
+
+IMPORTTIME_OUTPUT = '''import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:      2500 |       4000 | django.db
+import time:      1500 |       1500 |     django.db.utils
+'''
+
+
+class ProductionSettingsTests(SimpleTestCase):
+    """Test the production settings module"""
+
+    def test_debug_off(self):
+        self.assertFalse(settings_production.DEBUG)
+
+    def test_drops_build_time_apps(self):
+        self.assertNotIn('drf_spectacular', settings_production.INSTALLED_APPS)
+        self.assertIn('api_trades', settings_production.INSTALLED_APPS)
+
+    def test_boot_skips_build_time_modules(self):
+        """Test a worker boots without drf_spectacular or numpy"""
+        script = BOOT_SCRIPT + (
+            'import json, sys\n'
+            "print(json.dumps(sorted({name.split('.')[0] for name in sys.modules})))\n"
+        )
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': 'trading_app.settings_production',
+            'API_SCHEMA_FILE': 'schema.yml',
+            'SECRET_KEY': 'boot-test',
+        }
+        result = subprocess.run(
+            [sys.executable, '-c', script], env=env, capture_output=True, text=True,
+            cwd=Path(__file__).resolve().parents[2], check=False)
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        modules = json.loads(result.stdout.splitlines()[-1])
+        self.assertIn('api_trades', modules)
+        self.assertNotIn('drf_spectacular', modules)
+        self.assertNotIn('numpy', modules)
+
+    def test_json_renderer_only(self):
+        self.assertEqual(
+            settings_production.REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'],
+            ['rest_framework.renderers.JSONRenderer'],
+        )
+        self.assertIn('DEFAULT_THROTTLE_RATES', settings_production.REST_FRAMEWORK)
+
+
+class SchemaFileViewTests(SimpleTestCase):
+    """Test serving the pre-generated schema"""
+
+    def setUp(self):
+        _schema_content.cache_clear()
+        self.addCleanup(_schema_content.cache_clear)
+
+    def test_serves_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'schema.yml'
+            path.write_text('openapi: 3.0.3\n')
+            with override_settings(API_SCHEMA_FILE=str(path)):
+                response = schema_file_view(None)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'openapi: 3.0.3\n')
+        self.assertEqual(response['Content-Type'], 'application/vnd.oai.openapi')
+
+
+class CheckStartupTests(SimpleTestCase):
+    """Test parsing of python -X importtime output"""
+
+    def test_parse_importtime(self):
+        self.assertEqual(parse_importtime(IMPORTTIME_OUTPUT), [
+            ('_io', 120, 120),
+            ('django.db', 2500, 4000),
+            ('django.db.utils', 1500, 1500),
+        ])
+
+    def test_ignores_other_lines(self):
+        self.assertEqual(parse_importtime('Traceback\nimport time: bad\n'), [])
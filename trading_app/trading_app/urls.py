@@ -14,20 +14,32 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from drf_spectacular.views import (
-    SpectacularSwaggerView,
-    SpectacularAPIView
-)
-
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    # API schema
-    path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'),
-    # Swagger UI
-    path('api/docs/', SpectacularSwaggerView.as_view(url_name='api-schema'), name='api-docs'),
     path('api/user/', include('user.urls')),
     path('api/trades/', include('api_trades.urls')),
 ]
+
+if settings.API_SCHEMA_FILE:
+    # Pre-generated schema; drf_spectacular is not imported at all.
+    from trading_app.views import schema_file_view
+
+    urlpatterns += [
+        path('api/schema/', schema_file_view, name='api-schema'),
+    ]
+else:
+    from drf_spectacular.views import (
+        SpectacularSwaggerView,
+        SpectacularAPIView
+    )
+
+    urlpatterns += [
+        # API schema
+        path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'),
+        # Swagger UI
+        path('api/docs/', SpectacularSwaggerView.as_view(url_name='api-schema'), name='api-docs'),
+    ]
@@ -0,0 +1,23 @@
+"""
+Views for the trading_app project
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from django.http import HttpResponse
+
+
+@lru_cache(maxsize=1)
+def _schema_content(path):
+    with open(path, 'rb') as schema_file:
+        return schema_file.read()
+
+
+def schema_file_view(request):
+    """Serve the OpenAPI schema pre-generated into API_SCHEMA_FILE."""
+    path = settings.API_SCHEMA_FILE
+    content_type = (
+        'application/vnd.oai.openapi+json' if str(path).endswith('.json')
+        else 'application/vnd.oai.openapi'
+    )
+    return HttpResponse(_schema_content(path), content_type=content_type)
@@ -0,0 +1,174 @@
+"""
+Expiring, rotatable auth tokens.
+
+Tokens are rest_framework.authtoken tokens that expire TOKEN_TTL_SECONDS
+after they were created. Each worker remembers the tokens it has recently
+authenticated for TOKEN_CACHE_SECONDS, up to TOKEN_CACHE_MAX_ENTRIES of them,
+so repeat requests are authenticated from memory; a token that is deleted before it expires is recorded in
+RevokedToken and refused through the in-memory revocation set
+(user/revocation.py), which every worker refreshes every few seconds.
+
+Each user also has a version in the Django cache, moved on whenever the
+user is saved. A worker checks it on every cache hit, so a user who is
+deactivated or loses superuser status stops being served from any
+worker's memory as soon as the change commits.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+from user.models import RevokedToken
+from user.revocation import revocations
+
+
+def expires_at(token):
+    """Return when token expires."""
+    return token.created + timedelta(seconds=settings.TOKEN_TTL_SECONDS)
+
+
+def is_expired(token):
+    return expires_at(token) <= timezone.now()
+
+
+def issue_token(user):
+    """Return the user's token, replacing it with a new one if it has expired."""
+    with transaction.atomic():
+        token, created = Token.objects.select_for_update().get_or_create(user=user)
+        if not created and is_expired(token):
+            token.delete()
+            token = Token.objects.create(user=user)
+    return token
+
+
+def rotate_token(token):
+    """Revoke token and return a new one for the same user."""
+    with transaction.atomic():
+        user = token.user
+        token.delete()
+        return Token.objects.create(user=user)
+
+
+def purge_expired(batch_size=1000):
+    """
+    Delete up to batch_size expired tokens and up to batch_size revocation
+    records that are no longer needed. Returns the two counts.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=settings.TOKEN_TTL_SECONDS)
+    keys = list(Token.objects.filter(created__lte=cutoff).values_list('key', flat=True)[:batch_size])
+    Token.objects.filter(key__in=keys).delete()
+
+    revoked = list(RevokedToken.objects.filter(expires_at__lte=now).values_list('id', flat=True)[:batch_size])
+    RevokedToken.objects.filter(id__in=revoked).delete()
+    return len(keys), len(revoked)
+
+
+# Versions are recreated on a cache miss, which only costs one database read.
+USER_VERSION_TIMEOUT = 60 * 60 * 24
+
+
+def user_version_key(user_id):
+    """cache key for the version of a user's details"""
+    return f'user:{user_id}:version'
+
+
+def user_version(user_id):
+    """Return the current version of a user's details, creating it if missing."""
+    key = user_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = time.time()
+        if not cache.add(key, version, timeout=USER_VERSION_TIMEOUT):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_user(user_id):
+    """Mark a user's details as changed for every worker."""
+    cache.set(user_version_key(user_id), time.time(), timeout=USER_VERSION_TIMEOUT)
+
+
+class TokenCache:
+    """
+    Tokens this process authenticated recently, with their users: an LRU
+    of at most TOKEN_CACHE_MAX_ENTRIES keys, each trusted for
+    TOKEN_CACHE_SECONDS while its user's version is unchanged.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        if cache.get(user_version_key(entry[1].pk)) != entry[3]:
+            self.discard(key)
+            return None
+        return entry[1], entry[2]
+
+    def set(self, key, user, token):
+        version = user_version(user.pk)
+        with self._lock:
+            self._entries[key] = (
+                time.monotonic() + settings.TOKEN_CACHE_SECONDS, user, token, version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.TOKEN_CACHE_MAX_ENTRIES:
+                self._entries.popitem(last=False)
+
+    def discard(self, key=None, user_id=None):
+        """Forget one key, every key of a user, or everything."""
+        with self._lock:
+            if key is None and user_id is None:
+                self._entries.clear()
+            elif key is not None:
+                self._entries.pop(key, None)
+            else:
+                for cached_key in [cached_key for cached_key, (_, user, _, _) in self._entries.items()
+                                   if user.pk == user_id]:
+                    del self._entries[cached_key]
+
+
+token_cache = TokenCache()
+
+
+class ExpiringTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that refuses expired and revoked tokens and only
+    reads the database for tokens this worker has not seen recently.
+    """
+
+    def authenticate_credentials(self, key):
+        if key in revocations:
+            token_cache.discard(key)
+            raise AuthenticationFailed(_('Invalid token.'))
+
+        cached = token_cache.get(key)
+        if cached is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, user, token)
+        else:
+            user, token = cached
+
+        if is_expired(token):
+            token_cache.discard(key)
+            raise AuthenticationFailed(_('Token has expired.'))
+        # Each request gets its own copy of the cached user.
+        return copy.copy(user), token
@@ -0,0 +1,82 @@
+import csv
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import CommandError
+from django.db import transaction
+
+from trading_app.profiling import ProfiledCommand
+
+from user import provisioning
+
+
+class Command(ProfiledCommand):
+    help = 'Create users and auth tokens from a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', type=str, nargs='?',
+                            help='CSV or NDJSON (.ndjson/.jsonl) file of users')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Processes used to hash passwords (defaults to PROVISIONING_HASH_WORKERS)')
+        parser.add_argument('--output', type=str, default=None,
+                            help='Write the username and token of each created user to this CSV file')
+        parser.add_argument('--benchmark', type=int, default=None, metavar='N',
+                            help='Create N generated users, report users/sec and roll back')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['benchmark']:
+            self.benchmark(kwargs['benchmark'], kwargs['workers'])
+            return
+        if not kwargs['file']:
+            raise CommandError('Give a file of users or --benchmark N')
+
+        try:
+            with open(kwargs['file'], 'rb') as users_file:
+                rows = provisioning.read_rows(users_file, kwargs['file'])
+        except FileNotFoundError:
+            raise CommandError(f'The file {kwargs["file"]} does not exist.')
+        except provisioning.InvalidFile as e:
+            raise CommandError(str(e))
+
+        try:
+            result = provisioning.provision_users(rows, workers=kwargs['workers'])
+        except provisioning.Conflict as e:
+            raise CommandError(str(e))
+
+        for error in result.errors:
+            problems = '; '.join(f'{key}: {message}' for key, message in error['errors'].items())
+            self.stdout.write(self.style.ERROR(f'Row {error["row"]} ({error["username"]}): {problems}'))
+
+        if kwargs['output']:
+            with open(kwargs['output'], 'w', newline='', encoding='utf-8') as output:
+                writer = csv.DictWriter(output, fieldnames=['row', 'username', 'token'])
+                writer.writeheader()
+                writer.writerows(result.created)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(result.created)} users ({len(result.errors)} rejected) '
+            f'in {result.seconds:.2f}s, {result.users_per_second:.0f} users/sec'))
+
+    def benchmark(self, count, workers):
+        """Compare bulk provisioning with creating users one at a time."""
+        prefix = f'benchmark{int(time.time())}'
+        rows = [
+            {'username': f'{prefix}_{number}', 'email': f'{prefix}_{number}@example.com',
+             'password': f'password-{number}'}
+            for number in range(count)
+        ]
+        single = rows[:min(count, 100)]
+
+        with transaction.atomic():
+            started = time.perf_counter()
+            for row in single:
+                get_user_model().objects.create_user(**row)
+            single_rate = len(single) / (time.perf_counter() - started)
+            transaction.set_rollback(True)
+
+        with transaction.atomic():
+            result = provisioning.provision_users(rows, workers=workers)
+            transaction.set_rollback(True)
+
+        self.stdout.write(f'create_user one at a time: {single_rate:.0f} users/sec ({len(single)} users)')
+        self.stdout.write(f'bulk provisioning: {result.users_per_second:.0f} users/sec ({count} users)')
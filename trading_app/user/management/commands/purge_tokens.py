@@ -0,0 +1,24 @@
+from trading_app.profiling import ProfiledCommand
+
+from user.authentication import purge_expired
+
+
+class Command(ProfiledCommand):
+    help = 'Delete expired auth tokens and revocation records in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rows deleted per batch')
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs['batch_size']
+        total_tokens = total_revoked = 0
+        while True:
+            tokens, revoked = purge_expired(batch_size)
+            total_tokens += tokens
+            total_revoked += revoked
+            if max(tokens, revoked) < batch_size:
+                break
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {total_tokens} expired tokens and {total_revoked} revocation records'))
@@ -0,0 +1,15 @@
+from django.db import models
+
+
+class RevokedToken(models.Model):
+    """
+    An auth token deleted before it expired (rotated, revoked or removed in
+    the admin). Kept until expires_at so every worker can refuse it without
+    looking the token up; see user/revocation.py.
+    """
+    key = models.CharField(max_length=40, unique=True)
+    revoked_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'{self.key[:8]}... revoked {self.revoked_at}'
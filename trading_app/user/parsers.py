@@ -0,0 +1,29 @@
+"""
+Parsers for bulk user uploads
+"""
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from user import provisioning
+
+
+class CSVParser(BaseParser):
+    """Parse a CSV body into a list of rows."""
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return provisioning.read_csv(stream)
+        except provisioning.InvalidFile as e:
+            raise ParseError(str(e)) from e
+
+
+class NDJSONParser(BaseParser):
+    """Parse a body of one JSON object per line into a list of rows."""
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return provisioning.read_ndjson(stream)
+        except provisioning.InvalidFile as e:
+            raise ParseError(str(e)) from e
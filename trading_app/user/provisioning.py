@@ -0,0 +1,187 @@
+"""
+Creating many users at once.
+
+provision_users validates every row up front (with one query for existing
+usernames and emails rather than one per row), hashes the passwords of the
+valid rows in a process pool, then inserts the users and an auth Token for
+each with bulk_create in a single transaction. Rows that fail validation
+are reported with their row number and are not created.
+"""
+import csv
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from rest_framework.authtoken.models import Token
+
+FIELDS = ('username', 'email', 'password', 'first_name', 'last_name')
+PASSWORD_MIN_LENGTH = 5
+# Below this many passwords starting worker processes costs more than it saves.
+POOL_MIN_ROWS = 50
+
+
+class InvalidFile(ValueError):
+    """The upload could not be read as CSV or NDJSON."""
+
+
+class Conflict(Exception):
+    """A user in the batch was created by someone else after validation."""
+
+
+def read_csv(stream):
+    """Return the rows of a CSV file with a header line."""
+    try:
+        text = stream.read().decode('utf-8-sig')
+        return [dict(row) for row in csv.DictReader(io.StringIO(text, newline=''))]
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise InvalidFile(f'Invalid CSV: {e}') from e
+
+
+def read_ndjson(stream):
+    """Return the rows of a file with one JSON object per line."""
+    rows = []
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise InvalidFile(f'Line {number} is not valid JSON') from e
+        if not isinstance(row, dict):
+            raise InvalidFile(f'Line {number} is not a JSON object')
+        rows.append(row)
+    return rows
+
+
+def read_rows(stream, name):
+    """Read rows from a binary stream, choosing the format from the file name."""
+    if str(name).endswith(('.ndjson', '.jsonl')):
+        return read_ndjson(stream)
+    return read_csv(stream)
+
+
+@dataclass
+class ProvisionResult:
+    """Users created and rows rejected by provision_users."""
+    created: list = field(default_factory=list)
+    errors: list = field(default_factory=list)
+    seconds: float = 0
+
+    @property
+    def users_per_second(self):
+        return len(self.created) / self.seconds if self.seconds else 0
+
+
+def validate_rows(rows):
+    """Return ([(row number, cleaned row)], [row errors])."""
+    User = get_user_model()
+    usernames = {str(row.get('username') or '').strip() for row in rows}
+    emails = {str(row.get('email') or '').strip().lower() for row in rows}
+    taken_usernames = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+    taken_emails = {
+        email.lower() for email in User.objects.filter(email__in=emails).values_list('email', flat=True)
+    }
+
+    valid, errors = [], []
+    for number, row in enumerate(rows, start=1):
+        cleaned = {key: str(row.get(key) or '').strip() for key in FIELDS}
+        cleaned['password'] = str(row.get('password') or '')
+        problems = {}
+
+        # The model fields' own validators: username characters and every
+        # field's max_length, which the database would otherwise enforce.
+        for key in ('username', 'email', 'first_name', 'last_name'):
+            if cleaned[key]:
+                try:
+                    User._meta.get_field(key).run_validators(cleaned[key])
+                except ValidationError as e:
+                    problems[key] = ' '.join(e.messages)
+        if not cleaned['username']:
+            problems['username'] = 'This field is required.'
+        elif cleaned['username'] in taken_usernames:
+            problems['username'] = 'A user with that username already exists.'
+        if not cleaned['email']:
+            problems['email'] = 'This field is required.'
+        elif cleaned['email'].lower() in taken_emails:
+            problems['email'] = 'A user with that email already exists.'
+        if len(cleaned['password']) < PASSWORD_MIN_LENGTH:
+            problems['password'] = (
+                f'Ensure this field has at least {PASSWORD_MIN_LENGTH} characters.')
+
+        if problems:
+            errors.append({'row': number, 'username': cleaned['username'], 'errors': problems})
+            continue
+        # Later rows may not reuse a username or email from an earlier one.
+        taken_usernames.add(cleaned['username'])
+        taken_emails.add(cleaned['email'].lower())
+        valid.append((number, cleaned))
+    return valid, errors
+
+
+def _setup_worker(settings_module):
+    # Needed when workers are spawned rather than forked.
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+def hash_passwords(passwords, workers=None):
+    """Hash passwords with the configured hasher, in worker processes if worth it."""
+    workers = workers or settings.PROVISIONING_HASH_WORKERS
+    if workers <= 1 or len(passwords) < POOL_MIN_ROWS:
+        return [make_password(password) for password in passwords]
+
+    settings_module = os.environ.get('DJANGO_SETTINGS_MODULE', 'trading_app.settings')
+    with ProcessPoolExecutor(workers, initializer=_setup_worker,
+                             initargs=(settings_module,)) as pool:
+        chunksize = max(1, len(passwords) // (workers * 4))
+        return list(pool.map(make_password, passwords, chunksize=chunksize))
+
+
+def provision_users(rows, workers=None, batch_size=1000):
+    """
+    Create a user and auth token for every valid row. Raises Conflict,
+    creating nobody, if another user with one of the usernames is created
+    between validation and the insert.
+    """
+    started = time.perf_counter()
+    User = get_user_model()
+    valid, errors = validate_rows(rows)
+    hashes = hash_passwords([row['password'] for _, row in valid], workers)
+
+    users = [
+        User(
+            username=row['username'],
+            email=User.objects.normalize_email(row['email']),
+            first_name=row['first_name'],
+            last_name=row['last_name'],
+            password=password_hash,
+        )
+        for (_, row), password_hash in zip(valid, hashes)
+    ]
+    try:
+        with transaction.atomic():
+            users = User.objects.bulk_create(users, batch_size=batch_size)
+            tokens = Token.objects.bulk_create(
+                [Token(user=user, key=Token.generate_key()) for user in users],
+                batch_size=batch_size,
+            )
+    except IntegrityError as e:
+        raise Conflict('A user with one of these usernames was created meanwhile; '
+                       'no users were created.') from e
+
+    result = ProvisionResult(errors=errors)
+    result.created = [
+        {'row': number, 'username': user.username, 'token': token.key}
+        for (number, _), user, token in zip(valid, users, tokens)
+    ]
+    result.seconds = time.perf_counter() - started
+    return result
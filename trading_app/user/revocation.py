@@ -0,0 +1,100 @@
+"""
+In-memory set of revoked token keys.
+
+Every worker keeps the keys in RevokedToken in a Bloom filter backed by an
+exact set. Most tokens presented are not revoked and are rejected by the
+filter alone; the rare filter hit is confirmed against the exact set. The
+set is topped up from the database with the rows added since the last
+refresh at most every TOKEN_REVOCATION_REFRESH_SECONDS, and rebuilt from
+scratch every TOKEN_REVOCATION_RELOAD_SECONDS so purged rows are dropped.
+"""
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+
+from user.models import RevokedToken
+
+
+class BloomFilter:
+    """A fixed-size Bloom filter of strings."""
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(capacity, 1)
+        self.size = math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + number * second) % self.size for number in range(self.hashes))
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(value))
+
+
+class RevocationSet:
+    """Revoked token keys, refreshed from RevokedToken."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self._keys = set()
+        self._filter = BloomFilter(1024)
+        self._last_id = 0
+        self._refreshed = self._reloaded = float('-inf')
+
+    def _add(self, key):
+        self._keys.add(key)
+        if len(self._keys) > self._filter.capacity:
+            self._filter = BloomFilter(len(self._keys) * 2)
+            for existing in self._keys:
+                self._filter.add(existing)
+        else:
+            self._filter.add(key)
+
+    def add(self, key):
+        """Record a key revoked by this process."""
+        with self._lock:
+            self._add(key)
+
+    def refresh(self, force=False):
+        """Load the revocations recorded since the last refresh."""
+        now = time.monotonic()
+        if not force and now - self._refreshed < settings.TOKEN_REVOCATION_REFRESH_SECONDS:
+            return
+        with self._lock:
+            if now - self._reloaded >= settings.TOKEN_REVOCATION_RELOAD_SECONDS:
+                self._clear()
+                self._reloaded = now
+            rows = RevokedToken.objects.filter(id__gt=self._last_id).values_list('id', 'key')
+            for row_id, key in rows.order_by('id').iterator():
+                self._add(key)
+                self._last_id = row_id
+            self._refreshed = now
+
+    def reset(self):
+        """Forget every revocation; the next refresh reloads them all."""
+        with self._lock:
+            self._clear()
+
+    def __contains__(self, key):
+        self.refresh()
+        return key in self._filter and key in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+
+revocations = RevocationSet()
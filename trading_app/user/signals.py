@@ -0,0 +1,27 @@
+"""Signal handlers for user app"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from user.authentication import bump_user, expires_at, is_expired, token_cache
+from user.models import RevokedToken
+from user.revocation import revocations
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """Record tokens deleted before they expire so every worker refuses them."""
+    token_cache.discard(instance.key)
+    if is_expired(instance):
+        return
+    RevokedToken.objects.get_or_create(key=instance.key, defaults={'expires_at': expires_at(instance)})
+    transaction.on_commit(lambda: revocations.add(instance.key))
+
+
+@receiver(post_save, sender=get_user_model())
+def user_changed(sender, instance, **kwargs):
+    """Drop cached copies of a user whose details changed, in every worker."""
+    token_cache.discard(user_id=instance.pk)
+    transaction.on_commit(lambda: bump_user(instance.pk))
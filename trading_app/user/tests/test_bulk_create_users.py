@@ -0,0 +1,200 @@
+"""
+Tests for bulk user provisioning
+"""
+import json
+import tempfile
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from user import provisioning
+
+BULK_CREATE_URL = reverse('user:bulk-create')
+
+CSV_USERS = (
+    'username,email,password,first_name,last_name\n'
+    'alice,alice@example.com,alicepass,Alice,Smith\n'
+    'bob,bob@example.com,bobpass1,Bob,\n'
+    'alice,other@example.com,alicepass,,\n'
+    'carol,not-an-email,pw,,\n'
+)
+
+
+def as_stream(text):
+    """Return text as a binary stream"""
+    return BytesIO(text.encode('utf-8'))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ProvisioningTests(TestCase):
+    """Test validating and creating users in bulk"""
+
+    def setUp(self):
+        get_user_model().objects.create_user(
+            username='existing', email='existing@example.com', password='testpass123')
+
+    def test_creates_users_and_tokens(self):
+        rows = provisioning.read_csv(as_stream(CSV_USERS))
+        result = provisioning.provision_users(rows, workers=1)
+
+        self.assertEqual([user['username'] for user in result.created], ['alice', 'bob'])
+        alice = get_user_model().objects.get(username='alice')
+        self.assertTrue(alice.check_password('alicepass'))
+        self.assertEqual((alice.email, alice.first_name), ('alice@example.com', 'Alice'))
+        self.assertEqual(Token.objects.get(user=alice).key, result.created[0]['token'])
+
+        self.assertEqual([error['row'] for error in result.errors], [3, 4])
+        self.assertIn('username', result.errors[0]['errors'])
+        self.assertEqual(set(result.errors[1]['errors']), {'email', 'password'})
+
+    def test_rejects_existing_users(self):
+        result = provisioning.provision_users([
+            {'username': 'existing', 'email': 'new@example.com', 'password': 'testpass123'},
+            {'username': 'new', 'email': 'EXISTING@example.com', 'password': 'testpass123'},
+        ], workers=1)
+
+        self.assertEqual(result.created, [])
+        self.assertEqual(
+            [list(error['errors']) for error in result.errors], [['username'], ['email']])
+
+    def test_applies_model_field_validators(self):
+        result = provisioning.provision_users([
+            {'username': 'bad name!!', 'email': 'bad@example.com', 'password': 'testpass123'},
+            {'username': 'x' * 200, 'email': 'long@example.com', 'password': 'testpass123'},
+            {'username': 'longname', 'email': 'long2@example.com', 'password': 'testpass123',
+             'first_name': 'x' * 151},
+        ], workers=1)
+
+        self.assertEqual(result.created, [])
+        self.assertEqual(
+            [list(error['errors']) for error in result.errors],
+            [['username'], ['username'], ['first_name']])
+        self.assertIn('at most 150 characters', result.errors[1]['errors']['username'])
+
+    def test_concurrent_insert_is_a_conflict(self):
+        rows = [{'username': 'racer', 'email': 'racer@example.com', 'password': 'testpass123'}]
+        valid, errors = provisioning.validate_rows(rows)
+        get_user_model().objects.create_user(username='racer', password='testpass123')
+
+        with mock.patch.object(provisioning, 'validate_rows', return_value=(valid, errors)):
+            with self.assertRaises(provisioning.Conflict):
+                provisioning.provision_users(rows, workers=1)
+        self.assertEqual(get_user_model().objects.filter(username='racer').count(), 1)
+
+    def test_hashes_in_worker_processes(self):
+        passwords = [f'password{number}' for number in range(provisioning.POOL_MIN_ROWS)]
+        hashes = provisioning.hash_passwords(passwords, workers=2)
+        user = get_user_model()(password=hashes[7])
+        self.assertTrue(user.check_password('password7'))
+
+    def test_reads_ndjson(self):
+        stream = as_stream('{"username": "dan", "email": "dan@example.com"}\n\n{"username": "eve"}\n')
+        self.assertEqual(
+            provisioning.read_ndjson(stream),
+            [{'username': 'dan', 'email': 'dan@example.com'}, {'username': 'eve'}])
+        with self.assertRaises(provisioning.InvalidFile):
+            provisioning.read_ndjson(as_stream('{"username": \n'))
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            users_file = Path(directory) / 'users.csv'
+            users_file.write_text(CSV_USERS)
+            tokens_file = Path(directory) / 'tokens.csv'
+            out = StringIO()
+
+            call_command('bulk_create_users', str(users_file), workers=1,
+                         output=str(tokens_file), stdout=out)
+
+            self.assertIn('Created 2 users (2 rejected)', out.getvalue())
+            self.assertIn('users/sec', out.getvalue())
+            self.assertIn('Row 3 (alice): username', out.getvalue())
+            self.assertEqual(tokens_file.read_text().splitlines()[0], 'row,username,token')
+
+    def test_benchmark_rolls_back(self):
+        out = StringIO()
+        call_command('bulk_create_users', benchmark=5, workers=1, stdout=out)
+        self.assertIn('bulk provisioning', out.getvalue())
+        self.assertEqual(get_user_model().objects.count(), 1)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BulkCreateUsersApiTests(TestCase):
+    """Test the bulk user endpoint"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = get_user_model().objects.create_superuser(
+            username='admin', email='admin@example.com', password='testpass123')
+        self.client.force_authenticate(self.admin)
+
+    def test_requires_superuser(self):
+        user = get_user_model().objects.create_user(
+            username='user', email='user@example.com', password='testpass123')
+        self.client.force_authenticate(user)
+        res = self.client.post(BULK_CREATE_URL, CSV_USERS, content_type='text/csv')
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_csv_body(self):
+        res = self.client.post(BULK_CREATE_URL, CSV_USERS, content_type='text/csv')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['created'], 2)
+        self.assertEqual(len(res.data['errors']), 2)
+        self.assertTrue(Token.objects.filter(key=res.data['users'][1]['token'], user__username='bob').exists())
+
+    def test_ndjson_body(self):
+        body = '\n'.join(json.dumps(row) for row in [
+            {'username': 'dan', 'email': 'dan@example.com', 'password': 'danpass1'},
+        ])
+        res = self.client.post(BULK_CREATE_URL, body, content_type='application/x-ndjson')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(get_user_model().objects.filter(username='dan').exists())
+
+    def test_file_upload(self):
+        upload = SimpleUploadedFile('users.ndjson', b'{"username": "eve", "email": "eve@example.com", "password": "evepass1"}\n')
+        res = self.client.post(BULK_CREATE_URL, {'file': upload}, format='multipart')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data['users'][0]['username'], 'eve')
+
+    def test_all_rows_invalid(self):
+        res = self.client.post(BULK_CREATE_URL, [{'username': 'x'}], format='json')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data['created'], 0)
+
+    def test_concurrent_insert_is_a_conflict(self):
+        with mock.patch.object(provisioning, 'provision_users',
+                               side_effect=provisioning.Conflict('taken')):
+            res = self.client.post(BULK_CREATE_URL, CSV_USERS, content_type='text/csv')
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+
+    def test_default_row_limit_is_small(self):
+        rows = [{'username': f'user{number}', 'email': f'user{number}@example.com',
+                 'password': 'testpass123'} for number in range(21)]
+        with mock.patch.object(provisioning, 'hash_passwords') as hash_passwords:
+            res = self.client.post(BULK_CREATE_URL, rows, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('bulk_create_users command', res.data['detail'])
+        hash_passwords.assert_not_called()
+
+    def test_hashes_in_the_request_worker(self):
+        with mock.patch.object(provisioning, 'provision_users',
+                               wraps=provisioning.provision_users) as provision_users:
+            self.client.post(BULK_CREATE_URL, CSV_USERS, content_type='text/csv')
+        self.assertEqual(provision_users.call_args.kwargs['workers'], 1)
+
+    @override_settings(PROVISIONING_MAX_ROWS=1)
+    def test_row_limit(self):
+        res = self.client.post(BULK_CREATE_URL, CSV_USERS, content_type='text/csv')
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(get_user_model().objects.count(), 1)
@@ -0,0 +1,187 @@
+"""
+Tests for expiring, rotatable and revocable tokens
+"""
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+
+from user.authentication import ExpiringTokenAuthentication, TokenCache, token_cache
+from user.models import RevokedToken
+from user.revocation import BloomFilter, RevocationSet, revocations
+
+TOKEN_URL = reverse('user:token')
+ROTATE_URL = reverse('user:token-rotate')
+REVOKE_URL = reverse('user:token-revoke')
+ME_URL = reverse('user:me')
+
+
+@override_settings(TOKEN_TTL_SECONDS=3600, TOKEN_REVOCATION_REFRESH_SECONDS=3600)
+class TokenLifecycleTests(TestCase):
+    """Test token expiry, rotation and revocation"""
+
+    def setUp(self):
+        token_cache.discard()
+        revocations.reset()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            username='Testusername', email='test@example.com', password='testpass123')
+
+    def obtain(self):
+        res = self.client.post(TOKEN_URL, {'email': 'test@example.com', 'password': 'testpass123'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.data
+
+    def get_me(self, key):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        return self.client.get(ME_URL)
+
+    def test_token_reused_until_expiry(self):
+        first = self.obtain()
+        self.assertEqual(self.obtain()['token'], first['token'])
+        self.assertEqual(first['expires_at'], Token.objects.get().created + timedelta(hours=1))
+
+        Token.objects.update(created=timezone.now() - timedelta(hours=2))
+        self.assertNotEqual(self.obtain()['token'], first['token'])
+        self.assertFalse(RevokedToken.objects.exists())
+
+    def test_cached_authentication_skips_database(self):
+        key = self.obtain()['token']
+        authentication = ExpiringTokenAuthentication()
+        authentication.authenticate_credentials(key)
+
+        with self.assertNumQueries(0):
+            user, token = authentication.authenticate_credentials(key)
+        self.assertEqual((user.pk, token.key), (self.user.pk, key))
+
+    @override_settings(TOKEN_CACHE_MAX_ENTRIES=2)
+    def test_token_cache_is_bounded(self):
+        users = [get_user_model().objects.create_user(
+            username=f'user{i}', email=f'user{i}@example.com', password='testpass123')
+            for i in range(3)]
+        keys = [Token.objects.create(user=user).key for user in users]
+        authentication = ExpiringTokenAuthentication()
+        authentication.authenticate_credentials(keys[0])
+        authentication.authenticate_credentials(keys[1])
+        authentication.authenticate_credentials(keys[0])
+        authentication.authenticate_credentials(keys[2])
+
+        self.assertEqual(list(token_cache._entries), [keys[0], keys[2]])
+        with self.assertNumQueries(0):
+            authentication.authenticate_credentials(keys[0])
+
+    def test_expired_token_rejected(self):
+        key = self.obtain()['token']
+        self.assertEqual(self.get_me(key).status_code, status.HTTP_200_OK)
+
+        Token.objects.update(created=timezone.now() - timedelta(hours=2))
+        token_cache.discard()
+        res = self.get_me(key)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(res.data['detail'], 'Token has expired.')
+
+    def test_rotate(self):
+        old = self.obtain()['token']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {old}')
+        res = self.client.post(ROTATE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertNotEqual(res.data['token'], old)
+        self.assertEqual(self.get_me(old).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.get_me(res.data['token']).status_code, status.HTTP_200_OK)
+        self.assertTrue(RevokedToken.objects.filter(key=old).exists())
+
+    def test_revoke(self):
+        key = self.obtain()['token']
+        self.get_me(key)
+
+        res = self.client.post(REVOKE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.get_me(key).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertNotEqual(self.obtain()['token'], key)
+
+    def test_revocation_reaches_other_workers(self):
+        key = self.obtain()['token']
+        ExpiringTokenAuthentication().authenticate_credentials(key)
+        other_worker = RevocationSet()
+        other_worker.refresh(force=True)
+        self.assertNotIn(key, other_worker)
+
+        Token.objects.get(key=key).delete()
+        other_worker.refresh(force=True)
+        self.assertIn(key, other_worker)
+
+    def test_user_changes_drop_cached_user(self):
+        key = self.obtain()['token']
+        authentication = ExpiringTokenAuthentication()
+        authentication.authenticate_credentials(key)
+
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            authentication.authenticate_credentials(key)
+
+    def test_user_changes_reach_other_workers(self):
+        key = self.obtain()['token']
+        other_worker = TokenCache()
+        user, token = ExpiringTokenAuthentication().authenticate_credentials(key)
+        other_worker.set(key, user, token)
+        self.assertIsNotNone(other_worker.get(key))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+
+        self.assertIsNone(other_worker.get(key))
+        self.assertEqual(other_worker._entries, {})
+
+    def test_purge_tokens(self):
+        other = get_user_model().objects.create_user(
+            username='other', email='other@example.com', password='testpass123')
+        Token.objects.create(user=self.user)
+        Token.objects.create(user=other)
+        Token.objects.filter(user=other).update(created=timezone.now() - timedelta(hours=2))
+        RevokedToken.objects.create(key='old', expires_at=timezone.now() - timedelta(seconds=1))
+        RevokedToken.objects.create(key='live', expires_at=timezone.now() + timedelta(hours=1))
+
+        out = StringIO()
+        call_command('purge_tokens', batch_size=1, stdout=out)
+
+        self.assertIn('Deleted 1 expired tokens and 1 revocation records', out.getvalue())
+        self.assertEqual(list(Token.objects.values_list('user', flat=True)), [self.user.id])
+        self.assertEqual(list(RevokedToken.objects.values_list('key', flat=True)), ['live'])
+
+
+class BloomFilterTests(TestCase):
+    """Test the revocation Bloom filter"""
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        keys = [f'key-{number}' for number in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+
+        false_positives = sum(f'other-{number}' in bloom for number in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_set_grows_past_capacity(self):
+        revoked = RevocationSet()
+        for number in range(3000):
+            revoked.add(f'key-{number}')
+        with override_settings(TOKEN_REVOCATION_REFRESH_SECONDS=3600):
+            revoked._refreshed = float('inf')
+            self.assertIn('key-2999', revoked)
+            self.assertNotIn('key-3000', revoked)
+        self.assertEqual(len(revoked), 3000)
@@ -11,5 +11,8 @@ app_name = 'user'
 urlpatterns = [
     path('create/', views.CreateUserView.as_view(), name='create'),
     path('token/', views.CreateTokenView.as_view(), name='token'),
+    path('token/rotate/', views.RotateTokenView.as_view(), name='token-rotate'),
+    path('token/revoke/', views.RevokeTokenView.as_view(), name='token-revoke'),
     path('me/', views.ManageUserView.as_view(), name='me'),
+    path('bulk_create/', views.BulkCreateUsersView.as_view(), name='bulk-create'),
 ]
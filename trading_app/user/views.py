@@ -1,12 +1,21 @@
 """
 Views for the user API
 """
-from drf_spectacular.utils import extend_schema
+from django.conf import settings
 
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions, status
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 
+from api_trades.permissions import IsSuperUser
+from trading_app.schema import extend_schema
+
+from user import provisioning
+from user.authentication import ExpiringTokenAuthentication, expires_at, issue_token, rotate_token
+from user.parsers import CSVParser, NDJSONParser
 from user.serializers import (
     UserSerializer,
     AuthTokenSerializer,
@@ -31,6 +40,44 @@ class CreateTokenView(ObtainAuthToken):
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
+    def post(self, request, *args, **kwargs):
+        """return the user's token, issuing a new one if it has expired"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        token = issue_token(serializer.validated_data['user'])
+        return Response({'token': token.key, 'expires_at': expires_at(token)})
+
+
+@extend_schema(
+    summary="Rotate auth token",
+    description="Revoke the token used to make this request and return a new one."
+)
+class RotateTokenView(APIView):
+    """replace the authenticated user's token"""
+    authentication_classes = [ExpiringTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        """revoke the current token and issue a new one"""
+        token = rotate_token(request.auth)
+        return Response({'token': token.key, 'expires_at': expires_at(token)},
+                        status=status.HTTP_201_CREATED)
+
+
+@extend_schema(
+    summary="Revoke auth token",
+    description="Revoke the token used to make this request."
+)
+class RevokeTokenView(APIView):
+    """revoke the authenticated user's token"""
+    authentication_classes = [ExpiringTokenAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        """revoke the current token"""
+        request.auth.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 @extend_schema(
     summary="Manage authenticated user",
     description="Endpoint for retrieving and updating the authenticated user's information."
@@ -38,9 +85,61 @@ class CreateTokenView(ObtainAuthToken):
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """manage the authenticated user"""
     serializer_class = UserSerializer
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [ExpiringTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
         """retrieve and return the authenticated user"""
         return self.request.user
+
+
+@extend_schema(
+    summary="Create users in bulk",
+    description="Superuser endpoint for creating many users and their auth tokens at once. \
+        Accepts a CSV (text/csv) or NDJSON (application/x-ndjson) body, a JSON list, \
+        or a multipart upload in the 'file' field, with username, email, password, \
+        first_name and last_name per row, up to PROVISIONING_MAX_ROWS rows. Rows that fail \
+        validation are reported and skipped."
+)
+class BulkCreateUsersView(APIView):
+    """create users and tokens in bulk"""
+    authentication_classes = [ExpiringTokenAuthentication]
+    permission_classes = [IsSuperUser]
+    parser_classes = [CSVParser, NDJSONParser, JSONParser, MultiPartParser]
+
+    def post(self, request):
+        """create the users in the uploaded rows"""
+        upload = request.FILES.get('file')
+        if upload is not None:
+            try:
+                rows = provisioning.read_rows(upload, upload.name)
+            except provisioning.InvalidFile as e:
+                return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            rows = request.data
+
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            return Response({'detail': 'Expected a list of users.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > settings.PROVISIONING_MAX_ROWS:
+            return Response(
+                {'detail': f'At most {settings.PROVISIONING_MAX_ROWS} users can be created per request; '
+                           'use the bulk_create_users command for larger files.'},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            # Hashed in this worker: a process pool per request costs more
+            # than it saves at PROVISIONING_MAX_ROWS.
+            result = provisioning.provision_users(rows, workers=1)
+        except provisioning.Conflict as e:
+            return Response({'detail': str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response(
+            {
+                'created': len(result.created),
+                'users': result.created,
+                'errors': result.errors,
+                'seconds': round(result.seconds, 3),
+                'users_per_second': round(result.users_per_second, 1),
+            },
+            status=status.HTTP_201_CREATED if result.created else status.HTTP_400_BAD_REQUEST,
+        )